@@ -0,0 +1,166 @@
+"""回测行情数据
+
+回测优先读取本地的列式K线存储。存储没有覆盖回测区间的开头或结尾时，只向数据源回补缺少的部分，
+经过校验写入 price_data 和列式存储，之后相同区间的回测不再访问数据源；数据源不可用时直接使用本地已有的K线。
+区间中间的缺口（停牌、节假日等）不在回测时回补，需要时通过 /api/market-data/backfill 回补。
+
+加载好的K线按 (股票, 开始, 结束) 缓存在进程内，并记录日线存储的版本号：存储被写入或修正后版本号变化，
+对应的缓存自动失效。缓存按占用的内存淘汰最久未使用的数据，上限为 BACKTEST_DATA_CACHE_MB。
+"""
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app
+
+from app.market_data.backfill import plan_backfill, run_backfill
+from app.market_data.bar_store import get_bar_store, load_bars, normalize_frame, to_utc_naive
+from app.market_data.providers import get_provider
+from app.market_data.resample import storage_interval
+
+logger = logging.getLogger(__name__)
+
+
+class FrameCache:
+    """按占用内存淘汰的K线缓存，每项记录写入时的存储版本号"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()  # key -> (version, frame, size)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # 已经回补过的区间，数据源没有这些K线（如上市之前）时不再重复请求
+        self.requested = set()
+
+    def get(self, key, version):
+        """查询缓存，版本号不一致视为未命中，返回 (是否命中, K线)"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] != version:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, item[1]
+
+    def set(self, key, version, frame):
+        size = int(frame.memory_usage(index=True).sum())
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self._data[key] = (version, frame, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+            self.requested.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+def get_frame_cache(app=None):
+    """获取当前应用的回测K线缓存"""
+    app = app or current_app
+    cache = app.extensions.get('backtest_frames')
+    if cache is None:
+        cache = FrameCache(app.config['BACKTEST_DATA_CACHE_MB'] * 1024 * 1024)
+        app.extensions['backtest_frames'] = cache
+    return cache
+
+
+def _version(symbol, interval):
+    info = get_bar_store().info(symbol, interval)
+    return info['version'] if info else None
+
+
+def fetch_missing(symbols, start, end):
+    """回补本地存储没有覆盖的区间开头和结尾，返回 {symbol: 回补结果}
+
+    成功请求过的区间不再请求；数据源出错时只记录日志，回测使用本地已有的K线。
+    """
+    interval = storage_interval('1d')
+    end = min(end, datetime.utcnow())
+    cache = get_frame_cache()
+    store = get_bar_store()
+
+    gaps = []
+    for gap in plan_backfill(symbols, interval, start=start, end=end):
+        info = store.info(gap['symbol'], interval)
+        # 只回补存储覆盖范围之外的部分，中间的缺口多数是节假日，每次回测都请求没有意义
+        edge = not info or not info['rows'] or to_utc_naive(gap['end']).value <= info['start'] \
+            or to_utc_naive(gap['start']).value > info['end']
+        key = (gap['symbol'], gap['start'], gap['end'])
+        if edge and key not in cache.requested:
+            cache.requested.add(key)
+            gaps.append(gap)
+    if not gaps:
+        return {}
+
+    logger.info(f"回测回补 {len({g['symbol'] for g in gaps})} 只股票缺少的 {len(gaps)} 段K线")
+    try:
+        results = run_backfill(gaps)
+    except Exception as e:
+        logger.warning(f"回补回测数据失败，使用本地已有的K线: {str(e)}")
+        results = {gap['symbol']: {'rows': 0, 'rejected': 0, 'errors': [str(e)]} for gap in gaps}
+    failed = {symbol for symbol, result in results.items() if result['errors']}
+    for symbol in failed:
+        logger.warning(f"回补股票 {symbol} 的K线失败: {'; '.join(results[symbol]['errors'])}")
+    # 失败的区间下次加载时重试
+    cache.requested.difference_update((g['symbol'], g['start'], g['end']) for g in gaps if g['symbol'] in failed)
+    return results
+
+
+def load_backtest_data(symbols, start, end):
+    """加载回测使用的日线，返回 {symbol: DataFrame}，按请求的股票顺序排列，没有数据的股票不包含在内"""
+    interval = storage_interval('1d')
+    cache = get_frame_cache()
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    frames = {}
+    missing = []
+    for symbol in symbols:
+        hit, frame = cache.get((symbol, start, end), _version(symbol, interval))
+        if not hit:
+            missing.append(symbol)
+        elif len(frame):
+            frames[symbol] = frame
+
+    if missing:
+        fetch_missing(missing, start, end)
+    for symbol in missing:
+        data = load_bars(symbol, '1d', start=start, end=end)
+        if data.empty:
+            # 数据库中没有的股票无法写入存储，直接从数据源获取
+            try:
+                data = normalize_frame(get_provider().history([symbol], start=start, end=end).get(symbol))
+            except Exception as e:
+                logger.warning(f"获取股票 {symbol} 的K线失败: {str(e)}")
+        # 存储中的K线是内存映射的视图，缓存时复制一份
+        data = data.copy()
+        cache.set((symbol, start, end), _version(symbol, interval), data)
+        if len(data):
+            frames[symbol] = data
+    # 策略按这个顺序添加数据，self.datas[0] 不应取决于哪些股票命中了缓存
+    return {symbol: frames[symbol] for symbol in symbols if symbol in frames}
+
@@ -0,0 +1,292 @@
+"""回测执行
+
+使用 backtrader 运行用户策略，供后台回测任务调用，见 app/backtest/jobs.py。
+
+策略代码可以定义 backtrader 的 Strategy 类，也可以只定义与实盘任务相同的
+generate_signals(data, parameters) 函数，后者由 SignalStrategy 按信号交易，
+并且可以通过 parameters.engine = "vectorized" 使用向量化引擎，见 app/backtest/vectorized.py。
+"""
+import hashlib
+import importlib.util
+import os
+import sys
+import tempfile
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from app import indicators
+from app.backtest.data import load_backtest_data
+
+# 代码哈希 -> 编译好的策略类
+_strategy_classes = {}
+
+# 佣金比例，按成交金额计算
+COMMISSION = 0.001
+
+# 信号策略每次买入使用该股票资金的比例，保留一部分资金作为缓冲
+DEFAULT_POSITION_SIZE = 0.95
+
+ENGINES = ('backtrader', 'vectorized')
+
+
+class ProgressAnalyzer(bt.Analyzer):
+    """每根K线之后回报进度（0到1），由回调决定回报频率"""
+
+    params = (('callback', None), ('total', 0))
+
+    def next(self):
+        if self.p.total:
+            self.p.callback(min(len(self.strategy) / self.p.total, 1.0))
+
+
+class FillAnalyzer(bt.Analyzer):
+    """记录全部成交的订单"""
+
+    def start(self):
+        self.fills = []
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            self.fills.append({
+                'symbol': order.data._name,
+                'timestamp': bt.num2date(order.executed.dt),
+                'side': 'buy' if order.isbuy() else 'sell',
+                'quantity': abs(order.executed.size),
+                'price': order.executed.price,
+                'commission': order.executed.comm
+            })
+
+    def get_analysis(self):
+        return self.fills
+
+
+class EquityAnalyzer(bt.Analyzer):
+    """记录每根K线收盘后的账户总值"""
+
+    def start(self):
+        self.curve = []
+
+    def next(self):
+        self.curve.append({
+            'date': self.strategy.datetime.datetime(0).isoformat(),
+            'value': self.strategy.broker.getvalue()
+        })
+
+    def get_analysis(self):
+        return self.curve
+
+
+def signal_targets(data, generate_signals, parameters):
+    """调用 generate_signals，返回每根K线收盘后的目标持仓数组（1 持有，0 空仓）
+
+    data 的格式与实盘任务相同：timestamp 列加小写的价格列，整数索引。信号的 action 为 buy 时持有、
+    为 sell 时空仓，其余K线保持之前的状态；没有 action 列时按 signal 列，大于0为持有。
+
+    data 不设置 attrs 中的 symbol 和 interval，策略中的 indicators.incremental 每次全量计算，
+    不读写实盘共用的指标状态缓存，回测结果不受之前运行过的回测影响。
+    """
+    df = data[['Open', 'High', 'Low', 'Close', 'Volume']].rename(columns=str.lower)
+    df.insert(0, 'timestamp', df.index)
+    df.index = pd.RangeIndex(len(df))
+    signals = generate_signals(df, parameters)
+    if signals is None or len(signals) != len(df):
+        raise ValueError('generate_signals 需要为每根K线返回一行信号')
+
+    if 'action' in signals:
+        action = signals['action'].to_numpy()
+        target = np.where(action == 'buy', 1.0, np.where(action == 'sell', 0.0, np.nan))
+        return pd.Series(target).ffill().fillna(0.0).to_numpy()
+    return (signals['signal'].to_numpy() > 0).astype('float64')
+
+
+class SignalStrategy(bt.Strategy):
+    """按 generate_signals 的信号交易，规则与向量化引擎相同
+
+    每只股票分得相同的初始资金。第 t 根K线收盘后的目标持仓在第 t+1 根K线开盘时成交：
+    由空仓变为持有时用该股票当前资金的 position_size 比例买入，变为空仓时全部卖出。
+    """
+
+    # 在开盘时下单并按开盘价成交，买入数量可以按成交价计算
+    cheat_on_open = True
+    generate_signals = None
+
+    def __init__(self, **parameters):
+        self.position_size = parameters.get('position_size', DEFAULT_POSITION_SIZE)
+        self.targets = {}
+        self.cash = {}
+        for d in self.datas:
+            frame = d.p.dataname
+            # backtrader 从 fromdate 开始输出K线，第 i 根K线对应 frame 的第 offset + i 行
+            offset = frame.index.searchsorted(d.p.fromdate) if d.p.fromdate else 0
+            self.targets[d._name] = signal_targets(frame, type(self).generate_signals, parameters)[offset:]
+            self.cash[d._name] = self.broker.startingcash / len(self.datas)
+
+    def next_open(self):
+        for d in self.datas:
+            if len(d) < 2:
+                continue
+            target = self.targets[d._name][len(d) - 2]  # 上一根K线收盘后的目标持仓
+            position = self.getposition(d).size
+            if target and not position:
+                self.buy(d, size=self.position_size * self.cash[d._name] / (d.open[0] * (1 + COMMISSION)))
+            elif not target and position:
+                self.close(d)
+
+    def notify_order(self, order):
+        if order.status == order.Completed:
+            # 卖出时 size 为负数，资金增加
+            self.cash[order.data._name] -= order.executed.size * order.executed.price + order.executed.comm
+
+
+def compile_strategy(code):
+    """编译策略代码，返回其中的 Strategy 类，只有 generate_signals 函数时返回对应的 SignalStrategy
+
+    同一进程中相同的代码只编译一次，参数扫描等批量回测不会重复导入策略模块。
+    """
+    key = hashlib.sha1(code.encode('utf-8')).hexdigest()
+    if key in _strategy_classes:
+        return _strategy_classes[key]
+
+    # 这里需要安全地执行用户代码，实际应用中应该有更多的安全措施
+    # 为了简化，我们直接执行代码
+    strategy_file = None
+    try:
+        # 创建临时文件来存储策略代码
+        with tempfile.NamedTemporaryFile(suffix='.py', delete=False, mode='w') as f:
+            f.write(code)
+            strategy_file = f.name
+
+        # 导入策略模块，模块名包含代码的哈希，不同策略互不覆盖
+        spec = importlib.util.spec_from_file_location(f'user_strategy_{key[:16]}', strategy_file)
+        user_strategy = importlib.util.module_from_spec(spec)
+        user_strategy.indicators = indicators  # 与行情接口和实盘使用同一套指标实现
+        # backtrader 创建策略时会从 sys.modules 查找策略类所在的模块
+        sys.modules[spec.name] = user_strategy
+        spec.loader.exec_module(user_strategy)
+        if hasattr(user_strategy, 'Strategy'):
+            strategy_class = user_strategy.Strategy
+        elif hasattr(user_strategy, 'generate_signals'):
+            strategy_class = type('Strategy', (SignalStrategy,), {
+                'generate_signals': staticmethod(user_strategy.generate_signals)
+            })
+        else:
+            raise ValueError('需要定义 Strategy 类或 generate_signals 函数')
+    except Exception as e:
+        raise ValueError(f'策略代码执行失败: {str(e)}')
+    finally:
+        if strategy_file is not None:
+            os.unlink(strategy_file)
+
+    _strategy_classes[key] = strategy_class
+    return strategy_class
+
+
+def run_strategy(frames, strategy_class, params, initial_capital, start, end, progress=None):
+    """用已加载的K线运行一次回测，返回 (结果指标, 成交列表)，不访问数据库
+
+    progress 为进度回调，参数是0到1之间的完成比例，回调抛出的异常会中止回测。
+    params 中的 engine 选择回测引擎，不传给策略。
+    """
+    params = dict(params)
+    engine = params.pop('engine', None) or 'backtrader'
+    if engine not in ENGINES:
+        raise ValueError(f'不支持的回测引擎: {engine}')
+    if engine == 'vectorized':
+        # 在函数内导入，vectorized 依赖本模块
+        from app.backtest.vectorized import run_vectorized
+
+        generate_signals = getattr(strategy_class, 'generate_signals', None)
+        if generate_signals is None:
+            raise ValueError('向量化引擎需要策略代码定义 generate_signals 函数')
+        return run_vectorized(frames, generate_signals, params, initial_capital, start, end,
+                              progress=progress)
+
+    # 创建backtrader引擎
+    cerebro = bt.Cerebro(cheat_on_open=getattr(strategy_class, 'cheat_on_open', False))
+    
+    # 设置初始资金
+    cerebro.broker.setcash(initial_capital)
+    
+    # 设置佣金
+    cerebro.broker.setcommission(commission=COMMISSION)
+    
+    # 添加数据
+    total_bars = 0
+    for symbol, data in frames.items():
+        # 转换为backtrader可用的数据格式
+        datafeed = bt.feeds.PandasData(
+            dataname=data,
+            name=symbol,
+            fromdate=start,
+            todate=end
+        )
+        cerebro.adddata(datafeed)
+        total_bars = max(total_bars, len(data))
+    
+    # 添加策略
+    cerebro.addstrategy(strategy_class, **params)
+    
+    # 添加分析器
+    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
+    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
+    cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
+    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
+    cerebro.addanalyzer(FillAnalyzer, _name='fills')
+    cerebro.addanalyzer(EquityAnalyzer, _name='equity')
+    if progress is not None:
+        cerebro.addanalyzer(ProgressAnalyzer, _name='progress', callback=progress, total=total_bars)
+    
+    # 运行回测
+    results = cerebro.run()
+    strat = results[0]
+    
+    # 收集回测结果
+    portfolio_value = cerebro.broker.getvalue()
+    sharpe = strat.analyzers.sharpe.get_analysis()
+    drawdown = strat.analyzers.drawdown.get_analysis()
+    trades = strat.analyzers.trades.get_analysis()
+    
+    total_trades = trades.get('total', {}).get('total', 0)
+    won_trades = trades.get('won', {}).get('total', 0)
+    return {
+        'final_value': portfolio_value,
+        'return': (portfolio_value / initial_capital - 1) * 100,  # 百分比
+        'sharpe_ratio': sharpe.get('sharperatio', 0),
+        'max_drawdown': drawdown.get('max', {}).get('drawdown', 0),  # DrawDown 分析器返回的已经是百分比
+        'total_trades': total_trades,
+        'won_trades': won_trades,
+        'lost_trades': trades.get('lost', {}).get('total', 0),
+        'win_rate': won_trades / total_trades * 100 if total_trades > 0 else 0,
+        'equity_curve': strat.analyzers.equity.get_analysis()
+    }, strat.analyzers.fills.get_analysis()
+
+
+def execute_backtest(backtest, strategy, progress=None):
+    """执行回测的核心逻辑
+
+    progress 为进度回调，参数是0到1之间的完成比例，回调抛出的异常会中止回测。
+    代码、参数和K线都相同的回测直接使用缓存的结果，见 app/backtest/results.py。
+    """
+    from app.backtest.results import get_cached_result, result_key, save_result, save_trades
+
+    # 假设策略参数中包含了交易的股票代码
+    symbols = backtest.parameters.get('symbols', ['AAPL'])
+    frames = load_backtest_data(symbols, backtest.start_date, backtest.end_date)
+    key = result_key(strategy.code, backtest.parameters, backtest.start_date, backtest.end_date,
+                     backtest.initial_capital, frames)
+    
+    cached = get_cached_result(key)
+    if cached is not None:
+        results, fills = cached
+    else:
+        strategy_class = compile_strategy(strategy.code)
+        results, fills = run_strategy(frames, strategy_class, backtest.parameters, backtest.initial_capital,
+                                      backtest.start_date, backtest.end_date, progress=progress)
+        save_result(key, results, fills)
+    
+    # 记录成交，重新运行时替换之前的成交
+    save_trades(backtest, fills)
+    
+    return results
@@ -0,0 +1,300 @@
+"""后台回测任务
+
+回测请求只在 backtest_jobs 表中写入一条任务就返回，由独立的工作进程池执行：
+
+    flask backtest worker --processes 4
+
+每个工作进程循环从表中领取最早的排队任务（条件更新保证一个任务只被一个进程领取），
+执行过程中定期写入进度和心跳。工作进程退出时正在执行的任务重新排队；
+进程被强制结束的任务在心跳超时后由其他工作进程重新排队，超过最大尝试次数后标记为失败。
+Web进程不执行回测，回测占满的是工作进程所在的CPU核。
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import select, update
+
+from app import db
+from app.backtest import backtest_bp
+from app.backtest.engine import execute_backtest
+from app.models.backtest import Backtest, BacktestJob
+from app.models.strategy import Strategy
+
+logger = logging.getLogger(__name__)
+
+# 任务类型 -> 执行函数 handler(job, progress)，返回值保存为任务结果
+JOB_HANDLERS = {}
+
+
+class JobCancelled(Exception):
+    """任务在执行过程中被取消"""
+
+
+def register_job_handler(kind):
+    """注册任务类型的执行函数"""
+    def decorator(handler):
+        JOB_HANDLERS[kind] = handler
+        return handler
+    return decorator
+
+
+def submit_job(kind, user_id, backtest_id=None, payload=None):
+    """提交任务并提交事务，返回任务"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f'不支持的任务类型: {kind}')
+    job = BacktestJob(kind=kind, user_id=user_id, backtest_id=backtest_id, payload=payload or {}, status='queued')
+    db.session.add(job)
+    if backtest_id is not None:
+        db.session.get(Backtest, backtest_id).status = 'queued'
+    db.session.commit()
+    return job
+
+
+def cancel_job(job):
+    """取消任务：排队中的任务直接取消，执行中的任务在下次回报进度时中止"""
+    if job.status == 'queued':
+        _finish(job, 'cancelled')
+    elif job.status == 'running':
+        job.status = 'cancelling'
+    db.session.commit()
+    return job
+
+
+class ProgressReporter:
+    """执行任务时回报进度的回调，最多每 interval 秒写一次数据库
+
+    写入时检查任务是否被取消，被取消时抛出 JobCancelled 中止执行。
+    使用独立的数据库连接，不影响执行任务的会话中未提交的数据。
+    """
+
+    def __init__(self, job_id, interval):
+        self.job_id = job_id
+        self.interval = interval
+        self._last = 0.0
+
+    def __call__(self, progress, force=False):
+        now = time.monotonic()
+        if not force and now - self._last < self.interval:
+            return
+        self._last = now
+        table = BacktestJob.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == self.job_id).values(
+                progress=round(float(progress), 4), heartbeat_at=datetime.utcnow()))
+            status = conn.execute(select(table.c.status).where(table.c.id == self.job_id)).scalar()
+        if status == 'cancelling':
+            raise JobCancelled()
+
+
+def _heartbeat(app, job_id, stop, interval):
+    """执行任务期间定期更新心跳，数据加载等不回报进度的阶段也不会被判定为超时"""
+    table = BacktestJob.__table__
+    with app.app_context():
+        while not stop.wait(interval):
+            try:
+                with db.engine.begin() as conn:
+                    conn.execute(table.update().where(table.c.id == job_id).values(heartbeat_at=datetime.utcnow()))
+            except Exception as e:
+                logger.warning(f"更新任务 {job_id} 的心跳失败: {str(e)}")
+
+
+def _finish(job, status, result=None, error=None):
+    job.status = status
+    job.result = result
+    job.error = error
+    job.finished_at = datetime.utcnow()
+    if status == 'completed':
+        job.progress = 1.0
+    if job.backtest_id is not None:
+        backtest = db.session.get(Backtest, job.backtest_id)
+        if backtest is not None and status != 'completed':
+            backtest.status = status
+
+
+def _requeue(job):
+    """任务重新排队，对应的回测同时回到排队状态"""
+    job.status = 'queued'
+    job.worker = None
+    if job.backtest_id is not None:
+        backtest = db.session.get(Backtest, job.backtest_id)
+        if backtest is not None:
+            backtest.status = 'queued'
+
+
+def claim_job(worker):
+    """领取最早的排队任务，没有任务时返回None"""
+    while True:
+        job_id = db.session.execute(
+            select(BacktestJob.id).where(BacktestJob.status == 'queued')
+            .order_by(BacktestJob.id).limit(1).with_for_update(skip_locked=True)
+        ).scalar()
+        if job_id is None:
+            db.session.commit()
+            return None
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(BacktestJob).where(BacktestJob.id == job_id, BacktestJob.status == 'queued').values(
+                status='running', worker=worker, started_at=now, heartbeat_at=now,
+                progress=0.0, attempts=BacktestJob.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(BacktestJob, job_id)
+
+
+def requeue_stale_jobs(timeout, max_attempts):
+    """心跳超时的执行中任务重新排队，超过最大尝试次数的标记为失败，返回处理的任务数"""
+    deadline = datetime.utcnow() - timedelta(seconds=timeout)
+    stale = BacktestJob.query.filter(
+        BacktestJob.status.in_(('running', 'cancelling')), BacktestJob.heartbeat_at < deadline
+    ).all()
+    for job in stale:
+        if job.status == 'cancelling':
+            _finish(job, 'cancelled')
+        elif job.attempts >= max_attempts:
+            _finish(job, 'failed', error='工作进程退出，超过最大尝试次数')
+        else:
+            logger.warning(f"任务 {job.id} 的工作进程 {job.worker} 没有心跳，重新排队")
+            _requeue(job)
+    db.session.commit()
+    return len(stale)
+
+
+def run_job(job):
+    """在当前进程中执行任务"""
+    config = current_app.config
+    app = current_app._get_current_object()
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_heartbeat, args=(app, job.id, stop, config['BACKTEST_JOB_HEARTBEAT']), daemon=True)
+    heartbeat.start()
+    logger.info(f"开始执行任务 {job.id}（{job.kind}）")
+    try:
+        result = JOB_HANDLERS[job.kind](job, ProgressReporter(job.id, config['BACKTEST_PROGRESS_INTERVAL']))
+        _finish(job, 'completed', result=result)
+        db.session.commit()
+        logger.info(f"任务 {job.id} 执行完成")
+    except JobCancelled:
+        db.session.rollback()
+        _finish(job, 'cancelled')
+        db.session.commit()
+        logger.info(f"任务 {job.id} 已取消")
+    except (KeyboardInterrupt, SystemExit):
+        # 工作进程退出，任务交给其他进程重新执行
+        db.session.rollback()
+        _requeue(job)
+        db.session.commit()
+        raise
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"任务 {job.id} 执行失败")
+        _finish(job, 'failed', error=str(e))
+        db.session.commit()
+    finally:
+        stop.set()
+        db.session.remove()
+
+
+def worker_loop(max_jobs=None):
+    """工作进程主循环：领取并执行任务，没有任务时检查心跳超时的任务"""
+    config = current_app.config
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    done = 0
+    while max_jobs is None or done < max_jobs:
+        job = claim_job(worker)
+        if job is None:
+            requeue_stale_jobs(config['BACKTEST_JOB_TIMEOUT'], config['BACKTEST_JOB_MAX_ATTEMPTS'])
+            db.session.remove()
+            time.sleep(config['BACKTEST_POLL_INTERVAL'])
+            continue
+        run_job(job)
+        done += 1
+
+
+def _exit(signum, frame):
+    raise SystemExit(0)
+
+
+def _worker_main(nice, workers):
+    """工作进程入口：创建独立的应用实例和数据库连接"""
+    from app import create_app
+
+    if nice:
+        os.nice(nice)
+    signal.signal(signal.SIGTERM, _exit)
+    app = create_app()
+    # 参数扫描按实际的工作进程数分配进程，见 app/backtest/sweep.py 的 sweep_processes
+    app.config['BACKTEST_WORKERS'] = workers
+    with app.app_context():
+        try:
+            worker_loop()
+        except (KeyboardInterrupt, SystemExit):
+            pass
+
+
+def run_worker_pool(processes=None):
+    """启动回测工作进程池，进程异常退出时自动重启，收到中断信号时停止全部进程"""
+    config = current_app.config
+    processes = processes or config['BACKTEST_WORKERS']
+    context = multiprocessing.get_context('spawn')
+    workers = [None] * processes
+    logger.info(f"启动 {processes} 个回测工作进程")
+
+    def start(slot):
+        process = context.Process(target=_worker_main, args=(config['BACKTEST_WORKER_NICE'], processes),
+                                  name=f'backtest-worker-{slot}', daemon=False)
+        process.start()
+        workers[slot] = process
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopping.set())
+    try:
+        while not stopping.is_set():
+            for slot, process in enumerate(workers):
+                if process is None or not process.is_alive():
+                    if process is not None:
+                        logger.warning(f"回测工作进程 {process.name} 退出（{process.exitcode}），重新启动")
+                    start(slot)
+            stopping.wait(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in workers:
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in workers:
+            if process is not None:
+                process.join()
+        logger.info("回测工作进程已全部停止")
+
+
+@register_job_handler('backtest')
+def run_backtest_job(job, progress):
+    """执行一个回测"""
+    backtest = db.session.get(Backtest, job.backtest_id)
+    if not backtest:
+        raise ValueError('回测不存在')
+    strategy = db.session.get(Strategy, backtest.strategy_id)
+    if not strategy:
+        raise ValueError('策略不存在')
+    backtest.status = 'running'
+    db.session.commit()
+
+    results = execute_backtest(backtest, strategy, progress=progress)
+    backtest.results = results
+    backtest.status = 'completed'
+    return {'backtest_id': backtest.id}
+
+
+@backtest_bp.cli.command('worker')
+@click.option('--processes', type=int, help='工作进程数，默认为 BACKTEST_WORKERS')
+def worker_command(processes):
+    """启动回测工作进程池"""
+    run_worker_pool(processes)
@@ -0,0 +1,180 @@
+"""多进程回测
+
+参数扫描和滚动优化这类批量回测用同一段行情运行大量回测。行情只在任务进程中加载一次，
+打包到一块共享内存；进程池的每个进程启动时映射这块内存并编译一次策略，
+之后每个回测只向子进程传递参数和日期区间，不再逐个序列化K线。
+
+批量回测的收益率、夏普比率和最大回撤都由权益曲线按K线计算（curve_metrics），
+不使用 backtrader 按自然年收益率计算的夏普比率，不足一年的区间也能比较和排序。
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from app.backtest.engine import compile_strategy, run_strategy
+from app.market_data.bar_store import COLUMNS
+
+TRADING_DAYS = 252
+
+
+class SharedFrames:
+    """打包在一块共享内存中的一组K线
+
+    内存布局为全部股票的时间戳（int64纳秒），接着是全部股票的 OHLCV（float64，每行5列）；
+    handle 记录内存块名称和每只股票所在的行区间，可以传给子进程映射同一块内存。
+    """
+
+    def __init__(self, shm, layout, rows, owner=False):
+        self.shm = shm
+        self.layout = layout
+        self.rows = rows
+        self.owner = owner
+
+    @classmethod
+    def create(cls, frames):
+        """把 {symbol: DataFrame} 复制到新建的共享内存中"""
+        rows = sum(len(df) for df in frames.values())
+        shm = shared_memory.SharedMemory(create=True, size=max(rows * 8 * (1 + len(COLUMNS)), 1))
+        shared = cls(shm, [], rows, owner=True)
+        index, values = shared._arrays()
+        start = 0
+        for symbol, df in frames.items():
+            stop = start + len(df)
+            index[start:stop] = df.index.asi8
+            values[start:stop] = df[COLUMNS].to_numpy(dtype='float64')
+            shared.layout.append((symbol, start, stop))
+            start = stop
+        return shared
+
+    @classmethod
+    def attach(cls, handle):
+        name, layout, rows = handle
+        return cls(shared_memory.SharedMemory(name=name), layout, rows)
+
+    @property
+    def handle(self):
+        return self.shm.name, self.layout, self.rows
+
+    def _arrays(self):
+        index = np.ndarray((self.rows,), dtype='int64', buffer=self.shm.buf)
+        values = np.ndarray((self.rows, len(COLUMNS)), dtype='float64', buffer=self.shm.buf, offset=self.rows * 8)
+        return index, values
+
+    def frames(self):
+        """返回 {symbol: DataFrame}，数据直接引用共享内存"""
+        index, values = self._arrays()
+        return {
+            symbol: pd.DataFrame(values[start:stop], columns=COLUMNS, copy=False,
+                                 index=pd.DatetimeIndex(index[start:stop].view('datetime64[ns]'), name='timestamp'))
+            for symbol, start, stop in self.layout
+        }
+
+    def close(self):
+        """创建者负责释放共享内存"""
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# 进程池子进程中的行情和策略，由 _init_worker 设置
+_shared = None
+_frames = None
+_strategy_class = None
+
+
+def _init_worker(handle, code):
+    global _shared, _frames, _strategy_class
+    _shared = SharedFrames.attach(handle)
+    _frames = _shared.frames()
+    _strategy_class = compile_strategy(code)
+
+
+def run_in_worker(params, initial_capital, start, end):
+    """在进程池的子进程中用共享的行情和策略运行一次回测，返回 (结果指标, 成交列表)"""
+    return run_strategy(_frames, _strategy_class, params, initial_capital, start, end)
+
+
+def curve_metrics(values, base):
+    """由权益序列计算收益率、夏普比率和最大回撤（百分比），base 为区间开始前的账户总值"""
+    values = np.concatenate([[base], np.asarray(values, dtype='float64')])
+    returns = np.diff(values) / values[:-1]
+    std = returns.std(ddof=1) if len(returns) > 1 else 0
+    peak = np.maximum.accumulate(values)
+    return {
+        'final_value': float(values[-1]),
+        'return': float((values[-1] / base - 1) * 100),
+        'sharpe_ratio': float(returns.mean() / std * np.sqrt(TRADING_DAYS)) if std > 0 else None,
+        'max_drawdown': float(((peak - values) / peak).max() * 100)
+    }
+
+
+def run_metrics(task):
+    """默认的任务函数：task 为 (params, initial_capital, start, end)，返回不含权益曲线的结果指标"""
+    results, _ = run_in_worker(*task)
+    curve = results.pop('equity_curve', None)
+    if curve:
+        results.update(curve_metrics([point['value'] for point in curve], task[1]))
+    return results
+
+
+class BacktestPool:
+    """共享同一段行情和同一个策略的回测进程池
+
+    用作上下文管理器，退出时关闭进程池并释放共享内存；同一个进程池可以多次调用 run，
+    例如滚动优化先并行运行全部样本内回测，再并行运行全部样本外回测。
+    """
+
+    def __init__(self, frames, code, processes=None):
+        # 先在当前进程编译一次，代码有错误时直接报错，而不是让进程池初始化失败
+        compile_strategy(code)
+        self.frames = frames
+        self.code = code
+        self.processes = processes or os.cpu_count() or 1
+        self.shared = None
+        self.executor = None
+
+    def __enter__(self):
+        self.shared = SharedFrames.create(self.frames)
+        self.executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker, initargs=(self.shared.handle, self.code))
+        return self
+
+    def __exit__(self, *exc_info):
+        # 出错或被取消时不再运行还在排队的回测
+        self.executor.shutdown(cancel_futures=exc_info[0] is not None)
+        self.shared.close()
+
+    def run(self, tasks, function=run_metrics, progress=None):
+        """并行运行一组任务，按任务顺序返回 function(task) 的结果
+
+        function 必须是模块级函数；单个任务出错时结果为 {'error': 错误信息}，不影响其他任务。
+        progress 为进度回调，参数是已完成的比例，回调抛出异常时中止。
+        """
+        futures = {self.executor.submit(function, task): i for i, task in enumerate(tasks)}
+        results = [None] * len(tasks)
+        for done, future in enumerate(as_completed(futures), start=1):
+            try:
+                results[futures[future]] = future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception as e:
+                results[futures[future]] = {'error': str(e)}
+            if progress is not None:
+                progress(done / len(tasks))
+        return results
+
+
+def run_parallel(frames, code, tasks, processes=None, progress=None):
+    """在进程池中运行一组回测，按任务顺序返回每个回测的结果指标
+
+    tasks 为 (params, initial_capital, start, end) 的列表，见 BacktestPool.run。
+    """
+    if not tasks:
+        return []
+    with BacktestPool(frames, code, min(processes or os.cpu_count() or 1, len(tasks))) as pool:
+        return pool.run(tasks, progress=progress)
@@ -0,0 +1,117 @@
+"""回测结果缓存
+
+回测结果只取决于策略代码、参数、回测区间、初始资金、引擎设置和区间内的K线，
+这些内容相同的回测直接使用缓存的结果和成交，不再运行。
+
+K线以区间内实际使用的数据的哈希作为版本：修正区间内的K线后哈希变化，缓存自然失效；
+在区间之后追加新的K线不影响较早区间的缓存。修改回测引擎的计算方式时增加 ENGINE_VERSION，
+使旧的缓存全部失效。缓存最多保留 BACKTEST_RESULT_CACHE_SIZE 条，超过后删除最久未使用的结果。
+"""
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app import db
+from app.backtest.engine import COMMISSION
+from app.market_data.bar_store import COLUMNS
+from app.models.backtest import BacktestResultCache, BacktestTrade
+
+logger = logging.getLogger(__name__)
+
+# 回测引擎的计算方式改变时增加
+ENGINE_VERSION = 1
+
+# 缓存写入时更新的字段
+VALUE_FIELDS = ['results', 'trades', 'last_used_at']
+
+
+def data_fingerprint(frames):
+    """计算 {symbol: DataFrame} 中全部K线的哈希，与股票的先后顺序无关"""
+    digest = hashlib.sha256()
+    for symbol in sorted(frames):
+        data = frames[symbol]
+        digest.update(symbol.encode())
+        digest.update(data.index.asi8.tobytes())
+        digest.update(np.ascontiguousarray(data[COLUMNS].to_numpy(dtype='float64')).tobytes())
+    return digest.hexdigest()
+
+
+def result_key(code, params, start, end, initial_capital, frames):
+    """回测结果的缓存键"""
+    spec = {
+        'code': hashlib.sha256(code.encode()).hexdigest(),
+        'parameters': params,
+        'symbols': sorted(frames),
+        'start': start,
+        'end': end,
+        'initial_capital': float(initial_capital),
+        'engine': params.get('engine') or 'backtrader',
+        'engine_version': ENGINE_VERSION,
+        'commission': COMMISSION,
+        'data': data_fingerprint(frames)
+    }
+    return hashlib.sha256(json.dumps(spec, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_cached_result(key):
+    """查询缓存，返回 (结果指标, 成交列表)，未命中时返回 None"""
+    if current_app.config['BACKTEST_RESULT_CACHE_SIZE'] <= 0:
+        return None
+    entry = BacktestResultCache.query.filter_by(key=key).first()
+    if entry is None:
+        return None
+    entry.hits = (entry.hits or 0) + 1
+    entry.last_used_at = datetime.utcnow()
+    fills = [dict(fill, timestamp=datetime.fromisoformat(fill['timestamp'])) for fill in entry.trades]
+    return entry.results, fills
+
+
+def _upsert_statement(dialect):
+    """按数据库方言构造upsert语句，两个工作进程同时缓存相同的回测时以后写入的为准"""
+    table = BacktestResultCache.__table__
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({f: stmt.inserted[f] for f in VALUE_FIELDS})
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        return stmt.on_conflict_do_update(index_elements=['key'], set_={f: stmt.excluded[f] for f in VALUE_FIELDS})
+    raise ValueError(f'不支持的数据库类型: {dialect}')
+
+
+def save_result(key, results, fills):
+    """缓存回测结果，并删除超出数量上限的最久未使用的结果"""
+    size = current_app.config['BACKTEST_RESULT_CACHE_SIZE']
+    if size <= 0:
+        return
+    trades = [{
+        'symbol': fill['symbol'],
+        'timestamp': fill['timestamp'].isoformat(),
+        'side': fill['side'],
+        'quantity': float(fill['quantity']),
+        'price': float(fill['price']),
+        'commission': float(fill['commission'])
+    } for fill in fills]
+
+    now = datetime.utcnow()
+    db.session.execute(_upsert_statement(db.engine.dialect.name), {
+        'key': key, 'results': results, 'trades': trades, 'hits': 0, 'created_at': now, 'last_used_at': now
+    })
+
+    stale = [row.id for row in BacktestResultCache.query.with_entities(BacktestResultCache.id)
+             .order_by(BacktestResultCache.last_used_at.desc()).offset(size)]
+    if stale:
+        BacktestResultCache.query.filter(BacktestResultCache.id.in_(stale)).delete(synchronize_session=False)
+        logger.info(f"删除 {len(stale)} 条最久未使用的回测结果缓存")
+
+
+def save_trades(backtest, fills):
+    """用成交列表替换回测记录的成交"""
+    backtest.trades.delete()
+    for fill in fills:
+        db.session.add(BacktestTrade(backtest_id=backtest.id, order_type='market', **fill))
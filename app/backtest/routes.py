@@ -1,18 +1,18 @@
-from flask import request, jsonify
+from flask import current_app, request, jsonify, url_for
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.backtest import backtest_bp
-from app.models.backtest import Backtest, BacktestTrade
+from app.backtest.jobs import cancel_job, submit_job
+from app.backtest.sweep import METRICS, grid_size
+from app.backtest.walkforward import make_windows
+from app.models.backtest import Backtest, BacktestJob, BacktestTrade
 from app.models.strategy import Strategy
 from app import db
 import pandas as pd
 import numpy as np
 import json
-from datetime import datetime, timedelta
+from datetime import datetime
 import pytz
-import backtrader as bt
 import io
-import os
-import tempfile
 
 @backtest_bp.route('/list', methods=['GET'])
 @jwt_required()
@@ -137,7 +137,10 @@ def create_backtest():
 @backtest_bp.route('/<int:backtest_id>/run', methods=['POST'])
 @jwt_required()
 def run_backtest(backtest_id):
-    """运行回测"""
+    """提交回测任务，由回测工作进程异步执行
+
+    结果缓存由工作进程在加载K线后查询，提交时不读取K线。
+    """
     user_id = get_jwt_identity()
     
     # 验证回测是否存在且属于当前用户
@@ -146,37 +149,191 @@ def run_backtest(backtest_id):
         return jsonify({'error': '回测不存在或无权访问'}), 404
     
     # 检查回测状态
-    if backtest.status == 'running':
+    if backtest.status in ('queued', 'running'):
         return jsonify({'error': '回测已在运行中'}), 400
     
-    # 更新回测状态
-    backtest.status = 'running'
-    db.session.commit()
+    strategy = Strategy.query.get(backtest.strategy_id)
+    if not strategy:
+        return jsonify({'error': '策略不存在'}), 404
+    
+    job = submit_job('backtest', user_id, backtest_id=backtest.id)
+    
+    return jsonify({
+        'message': '回测已提交',
+        'job_id': job.id,
+        'status': job.status
+    }), 202, {'Location': url_for('backtest.get_job', job_id=job.id)}
+
+def _optimization_payload(data, user_id, required_fields):
+    """校验参数扫描和滚动优化共用的请求字段，返回 (任务参数, None) 或 (None, 错误响应)"""
+    for field in required_fields:
+        if field not in data:
+            return None, (jsonify({'error': f'缺少必要字段: {field}'}), 400)
+    
+    # 验证策略是否存在且属于当前用户
+    strategy = Strategy.query.filter_by(id=data['strategy_id']).first()
+    if not strategy or strategy.user_id != user_id:
+        return None, (jsonify({'error': '策略不存在或无权访问'}), 404)
     
     try:
-        # 获取策略代码
-        strategy = Strategy.query.get(backtest.strategy_id)
-        if not strategy:
-            raise ValueError('策略不存在')
-        
-        # 这里应该异步执行回测，但为了简化，我们同步执行
-        # 在实际应用中，应该使用Celery等任务队列
-        results = execute_backtest(backtest, strategy)
-        
-        # 更新回测结果
-        backtest.results = results
-        backtest.status = 'completed'
-        db.session.commit()
-        
-        return jsonify({
-            'message': '回测执行成功',
-            'results': results
-        })
-    except Exception as e:
-        # 回测失败，更新状态
-        backtest.status = 'failed'
-        db.session.commit()
-        return jsonify({'error': f'回测执行失败: {str(e)}'}), 500
+        datetime.fromisoformat(data['start_date'])
+        datetime.fromisoformat(data['end_date'])
+    except ValueError:
+        return None, (jsonify({'error': '日期格式无效'}), 400)
+    
+    grid = data['grid']
+    if not isinstance(grid, dict) or not grid or not all(isinstance(v, list) and v for v in grid.values()):
+        return None, (jsonify({'error': 'grid 必须是参数名到非空取值列表的映射'}), 400)
+    
+    sort = data.get('sort', 'sharpe_ratio')
+    if sort not in METRICS:
+        return None, (jsonify({'error': f'不支持的排序指标: {sort}'}), 400)
+    
+    return {
+        'strategy_id': strategy.id,
+        'start_date': data['start_date'],
+        'end_date': data['end_date'],
+        'initial_capital': data['initial_capital'],
+        'parameters': data.get('parameters', {}),
+        'grid': grid,
+        'sort': sort,
+        'descending': bool(data.get('descending', True))
+    }, None
+
+@backtest_bp.route('/sweep', methods=['POST'])
+@jwt_required()
+def create_sweep():
+    """提交参数扫描任务：对参数网格的每个组合运行回测，结果按指标排序"""
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    payload, error = _optimization_payload(
+        data, user_id, ['strategy_id', 'start_date', 'end_date', 'initial_capital', 'grid'])
+    if error:
+        return error
+    
+    combinations = grid_size(payload['grid'])
+    max_combinations = current_app.config['BACKTEST_SWEEP_MAX_COMBINATIONS']
+    if combinations > max_combinations:
+        return jsonify({'error': f'参数组合数超过上限 {max_combinations}'}), 400
+    
+    job = submit_job('sweep', user_id, payload=payload)
+    
+    return jsonify({
+        'message': '参数扫描已提交',
+        'job_id': job.id,
+        'combinations': combinations,
+        'status': job.status
+    }), 202, {'Location': url_for('backtest.get_job', job_id=job.id)}
+
+@backtest_bp.route('/walk-forward', methods=['POST'])
+@jwt_required()
+def create_walk_forward():
+    """提交滚动优化任务：逐个窗口在样本内选择参数，在随后的样本外区间评估"""
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    
+    payload, error = _optimization_payload(
+        data, user_id, ['strategy_id', 'start_date', 'end_date', 'initial_capital', 'grid',
+                        'in_sample_days', 'out_of_sample_days'])
+    if error:
+        return error
+    
+    try:
+        in_sample_days = int(data['in_sample_days'])
+        out_of_sample_days = int(data['out_of_sample_days'])
+    except (TypeError, ValueError):
+        return jsonify({'error': '窗口长度必须是整数天数'}), 400
+    if in_sample_days <= 0 or out_of_sample_days <= 0:
+        return jsonify({'error': '窗口长度必须大于0'}), 400
+    
+    windows = make_windows(datetime.fromisoformat(payload['start_date']), datetime.fromisoformat(payload['end_date']),
+                           in_sample_days, out_of_sample_days)
+    if not windows:
+        return jsonify({'error': '回测区间短于样本内区间'}), 400
+    # 每个窗口都要对整个网格做一次参数扫描
+    runs = grid_size(payload['grid']) * len(windows)
+    max_combinations = current_app.config['BACKTEST_SWEEP_MAX_COMBINATIONS']
+    if runs > max_combinations:
+        return jsonify({'error': f'样本内回测次数 {runs} 超过上限 {max_combinations}'}), 400
+    
+    payload.update(in_sample_days=in_sample_days, out_of_sample_days=out_of_sample_days)
+    job = submit_job('walk_forward', user_id, payload=payload)
+    
+    return jsonify({
+        'message': '滚动优化已提交',
+        'job_id': job.id,
+        'windows': len(windows),
+        'status': job.status
+    }), 202, {'Location': url_for('backtest.get_job', job_id=job.id)}
+
+def _job_to_dict(job):
+    """任务状态的响应格式"""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'backtest_id': job.backtest_id,
+        'status': job.status,
+        'progress': job.progress,
+        'payload': job.payload,
+        'result': job.result,
+        'error': job.error,
+        'attempts': job.attempts,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None
+    }
+
+@backtest_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+def get_jobs():
+    """获取用户的回测任务列表，可按状态过滤"""
+    user_id = get_jwt_identity()
+    status = request.args.get('status')
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 10, type=int)
+    
+    query = BacktestJob.query.filter_by(user_id=user_id)
+    if status:
+        query = query.filter_by(status=status)
+    pagination = query.order_by(BacktestJob.id.desc()).paginate(page=page, per_page=per_page)
+    
+    return jsonify({
+        'jobs': [_job_to_dict(job) for job in pagination.items],
+        'total': pagination.total,
+        'pages': pagination.pages,
+        'current_page': page
+    })
+
+@backtest_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    """查询回测任务的状态和进度"""
+    user_id = get_jwt_identity()
+    
+    job = BacktestJob.query.filter_by(id=job_id, user_id=user_id).first()
+    if not job:
+        return jsonify({'error': '任务不存在或无权访问'}), 404
+    
+    return jsonify({'job': _job_to_dict(job)})
+
+@backtest_bp.route('/jobs/<int:job_id>', methods=['DELETE'])
+@jwt_required()
+def delete_job(job_id):
+    """取消回测任务"""
+    user_id = get_jwt_identity()
+    
+    job = BacktestJob.query.filter_by(id=job_id, user_id=user_id).first()
+    if not job:
+        return jsonify({'error': '任务不存在或无权访问'}), 404
+    if job.status not in ('queued', 'running', 'cancelling'):
+        return jsonify({'error': '任务已结束'}), 400
+    
+    cancel_job(job)
+    return jsonify({
+        'message': '任务已取消' if job.status == 'cancelled' else '正在取消任务',
+        'job': _job_to_dict(job)
+    })
 
 @backtest_bp.route('/<int:backtest_id>', methods=['DELETE'])
 @jwt_required()
@@ -188,115 +345,15 @@ def delete_backtest(backtest_id):
     if not backtest:
         return jsonify({'error': '回测不存在或无权访问'}), 404
     
-    # 删除相关的交易记录
+    if backtest.status in ('queued', 'running'):
+        return jsonify({'error': '回测正在运行，请先取消任务'}), 400
+    
+    # 删除相关的交易记录和任务
     BacktestTrade.query.filter_by(backtest_id=backtest_id).delete()
+    BacktestJob.query.filter_by(backtest_id=backtest_id).delete()
     
     # 删除回测
     db.session.delete(backtest)
     db.session.commit()
     
     return jsonify({'message': '回测删除成功'})
-
-# 辅助函数：执行回测
-def execute_backtest(backtest, strategy):
-    """执行回测的核心逻辑"""
-    # 创建backtrader引擎
-    cerebro = bt.Cerebro()
-    
-    # 设置初始资金
-    cerebro.broker.setcash(backtest.initial_capital)
-    
-    # 设置佣金
-    cerebro.broker.setcommission(commission=0.001)  # 0.1%
-    
-    # 添加数据
-    # 这里应该从数据库或外部API获取数据
-    # 为了简化，我们使用Yahoo Finance的数据
-    import yfinance as yf
-    
-    # 假设策略参数中包含了交易的股票代码
-    symbols = backtest.parameters.get('symbols', ['AAPL'])
-    
-    for symbol in symbols:
-        data = yf.download(symbol, 
-                          start=backtest.start_date, 
-                          end=backtest.end_date)
-        if len(data) > 0:
-            # 转换为backtrader可用的数据格式
-            datafeed = bt.feeds.PandasData(
-                dataname=data,
-                name=symbol,
-                fromdate=backtest.start_date,
-                todate=backtest.end_date
-            )
-            cerebro.adddata(datafeed)
-    
-    # 动态创建策略类
-    strategy_code = strategy.code
-    strategy_params = backtest.parameters
-    
-    # 这里需要安全地执行用户代码，实际应用中应该有更多的安全措施
-    # 为了简化，我们直接执行代码
-    try:
-        # 创建临时文件来存储策略代码
-        with tempfile.NamedTemporaryFile(suffix='.py', delete=False, mode='w') as f:
-            f.write(strategy_code)
-            strategy_file = f.name
-        
-        # 导入策略模块
-        import importlib.util
-        spec = importlib.util.spec_from_file_location("user_strategy", strategy_file)
-        user_strategy = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(user_strategy)
-        
-        # 添加策略
-        cerebro.addstrategy(user_strategy.Strategy, **strategy_params)
-        
-        # 删除临时文件
-        os.unlink(strategy_file)
-    except Exception as e:
-        raise ValueError(f'策略代码执行失败: {str(e)}')
-    
-    # 添加分析器
-    cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
-    cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-    cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
-    cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
-    
-    # 运行回测
-    results = cerebro.run()
-    strat = results[0]
-    
-    # 收集回测结果
-    portfolio_value = cerebro.broker.getvalue()
-    sharpe = strat.analyzers.sharpe.get_analysis()
-    drawdown = strat.analyzers.drawdown.get_analysis()
-    returns = strat.analyzers.returns.get_analysis()
-    trades = strat.analyzers.trades.get_analysis()
-    
-    # 记录交易
-    for i, trade in enumerate(strat.trades):
-        db_trade = BacktestTrade(
-            backtest_id=backtest.id,
-            symbol=trade.data._name,
-            timestamp=backtest.start_date + timedelta(days=i),  # 简化处理
-            order_type='market',
-            side='buy' if trade.size > 0 else 'sell',
-            quantity=abs(trade.size),
-            price=trade.price,
-            commission=trade.commission
-        )
-        db.session.add(db_trade)
-    
-    # 返回结果
-    return {
-        'final_value': portfolio_value,
-        'return': (portfolio_value / backtest.initial_capital - 1) * 100,  # 百分比
-        'sharpe_ratio': sharpe.get('sharperatio', 0),
-        'max_drawdown': drawdown.get('max', {}).get('drawdown', 0) * 100,  # 百分比
-        'total_trades': trades.get('total', {}).get('total', 0),
-        'won_trades': trades.get('won', {}).get('total', 0),
-        'lost_trades': trades.get('lost', {}).get('total', 0),
-        'win_rate': trades.get('won', {}).get('total', 0) / trades.get('total', {}).get('total', 1) * 100 if trades.get('total', {}).get('total', 0) > 0 else 0,
-        'equity_curve': [cerebro.broker.get_value() for _ in range(10)]  # 简化的权益曲线
-    }
\ No newline at end of file
@@ -0,0 +1,83 @@
+"""参数扫描
+
+对策略参数网格的每个组合运行一次回测，按指定指标排序返回结果表。
+行情只加载一次，全部组合在进程池中并行运行，见 app/backtest/parallel.py。
+
+每个回测工作进程都可能同时运行参数扫描，默认把CPU核平均分给各个工作进程，
+整台机器上的回测进程数不超过CPU核数。
+"""
+import itertools
+import math
+import os
+from datetime import datetime
+
+from flask import current_app
+
+from app import db
+from app.backtest.data import load_backtest_data
+from app.backtest.jobs import register_job_handler
+from app.backtest.parallel import run_parallel
+from app.models.strategy import Strategy
+
+# 可以用于排序的结果指标
+METRICS = ['final_value', 'return', 'sharpe_ratio', 'max_drawdown', 'total_trades', 'won_trades', 'lost_trades', 'win_rate']
+
+
+def expand_grid(grid):
+    """把 {参数: [取值, ...]} 展开为参数组合的列表"""
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def grid_size(grid):
+    return math.prod(len(values) for values in grid.values())
+
+
+def sweep_processes(tasks):
+    """一个参数扫描或滚动优化任务使用的进程数，不超过回测次数"""
+    config = current_app.config
+    processes = config['BACKTEST_SWEEP_PROCESSES'] or (os.cpu_count() or 1) // max(config['BACKTEST_WORKERS'], 1)
+    return max(1, min(processes, tasks))
+
+
+def rank_results(rows, sort, descending=True):
+    """按指标排序，出错或指标缺失的组合排在最后，并写入名次"""
+    def key(row):
+        value = row.get(sort)
+        if value is None or 'error' in row:
+            return (1, 0)
+        return (0, -value if descending else value)
+
+    ranked = sorted(rows, key=key)
+    for rank, row in enumerate(ranked, start=1):
+        row['rank'] = rank
+    return ranked
+
+
+@register_job_handler('sweep')
+def run_sweep_job(job, progress):
+    """执行参数扫描，payload 见 POST /api/backtest/sweep"""
+    payload = job.payload
+    strategy = db.session.get(Strategy, payload['strategy_id'])
+    if not strategy:
+        raise ValueError('策略不存在')
+    start = datetime.fromisoformat(payload['start_date'])
+    end = datetime.fromisoformat(payload['end_date'])
+    parameters = payload.get('parameters', {})
+
+    frames = load_backtest_data(parameters.get('symbols', ['AAPL']), start, end)
+    if not frames:
+        raise ValueError('没有可用的行情数据')
+
+    combinations = expand_grid(payload['grid'])
+    tasks = [({**parameters, **combination}, payload['initial_capital'], start, end) for combination in combinations]
+    results = run_parallel(frames, strategy.code, tasks, sweep_processes(len(tasks)), progress)
+
+    rows = [{'parameters': combination, **result} for combination, result in zip(combinations, results)]
+    return {
+        'strategy_id': strategy.id,
+        'combinations': len(rows),
+        'sort': payload['sort'],
+        'descending': payload['descending'],
+        'results': rank_results(rows, payload['sort'], payload['descending'])
+    }
@@ -0,0 +1,124 @@
+"""向量化回测引擎
+
+按 SignalStrategy 的规则回测 generate_signals 策略（只做多或空仓），全部用整列的 NumPy 运算：
+
+- 第 t 根K线收盘后的目标持仓决定第 t+1 根K线是否持有，买卖都按开盘价成交；
+- 每只股票分得相同的初始资金，买入使用当前资金的 position_size 比例，卖出全部持仓；
+- 第 k 次买入前的资金只取决于之前每笔交易的收益倍数，用累积乘积一次算出，
+  权益曲线、成交和交易统计再按每根K线所属的交易索引得到。
+
+结果指标（夏普比率按年收益率、无风险利率1%计算，最大回撤按每根K线的账户总值）
+与 backtrader 的分析器一致，两种引擎的对比见 scripts/backtest_parity.py。
+"""
+import numpy as np
+import pandas as pd
+
+from app.backtest.engine import COMMISSION, DEFAULT_POSITION_SIZE, signal_targets
+
+# 与 backtrader SharpeRatio 分析器的默认参数一致
+RISK_FREE_RATE = 0.01
+
+
+def simulate(open_, close, held, cash, position_size=DEFAULT_POSITION_SIZE, commission=COMMISSION):
+    """模拟一只股票的交易
+
+    held[t] 表示第 t 根K线是否持有（开盘时成交），cash 为初始资金。
+    返回 (每根K线收盘时的账户总值, 买入位置, 卖出位置, 每笔交易的股数, 每笔交易买入前的资金)。
+    """
+    change = np.diff(held.astype('int8'), prepend=np.int8(0))
+    entries = np.flatnonzero(change == 1)
+    exits = np.flatnonzero(change == -1)
+
+    # 每笔已平仓的交易使资金变为原来的 (1 - f) + f * 卖出净额 / 买入成本 倍
+    growth = (1 - position_size) + position_size * (open_[exits] * (1 - commission)) \
+        / (open_[entries[:len(exits)]] * (1 + commission))
+    balances = cash * np.concatenate([[1.0], np.cumprod(growth)])
+    shares = position_size * balances[:len(entries)] / (open_[entries] * (1 + commission))
+
+    # 每根K线所属的交易：最近一次买入的序号，买入之前为 -1
+    trade = np.cumsum(change == 1) - 1
+    current = np.maximum(trade, 0)
+    if len(entries):
+        holding = balances[current] * (1 - position_size) + shares[current] * close
+    else:
+        holding = np.zeros(len(close))
+    flat = np.where(trade < 0, cash, balances[np.minimum(trade + 1, len(balances) - 1)])
+    equity = np.where(held, holding, flat)
+    return equity, entries, exits, shares, balances
+
+
+def yearly_sharpe(index, equity, initial_capital):
+    """按自然年收益率计算夏普比率，与 backtrader SharpeRatio 分析器的默认设置一致"""
+    years = index.year
+    last = np.flatnonzero(np.append(years[1:] != years[:-1], True))
+    ends = equity[last]
+    returns = ends / np.concatenate([[initial_capital], ends[:-1]]) - 1 - RISK_FREE_RATE
+    std = returns.std()
+    return float(returns.mean() / std) if std > 0 else None
+
+
+def run_vectorized(frames, generate_signals, params, initial_capital, start, end, progress=None):
+    """用向量化引擎运行一次回测，返回值与 run_strategy 相同：(结果指标, 成交列表)"""
+    position_size = params.get('position_size', DEFAULT_POSITION_SIZE)
+    cash = initial_capital / max(len(frames), 1)
+    curves = []
+    fills = []
+    pnls = []
+    total_trades = 0
+
+    for symbol, data in frames.items():
+        targets = signal_targets(data, generate_signals, params)
+        lo = data.index.searchsorted(start) if start else 0
+        hi = data.index.searchsorted(end, side='right') if end else len(data)
+        bars = data.iloc[lo:hi]
+        open_ = bars['Open'].to_numpy()
+        close = bars['Close'].to_numpy()
+        held = np.zeros(len(bars), dtype=bool)
+        held[1:] = targets[lo:hi - 1] > 0
+
+        equity, entries, exits, shares, balances = simulate(open_, close, held, cash, position_size)
+        curves.append(pd.Series(equity, index=bars.index))
+        total_trades += len(entries)
+
+        # 已平仓交易的净盈亏，含买卖两次佣金
+        closed = shares[:len(exits)]
+        pnls.append(closed * (open_[exits] * (1 - COMMISSION) - open_[entries[:len(exits)]] * (1 + COMMISSION)))
+
+        timestamps = bars.index
+        for side, positions, quantities in (('buy', entries, shares), ('sell', exits, closed)):
+            prices = open_[positions]
+            fills.extend({
+                'symbol': symbol,
+                'timestamp': timestamp.to_pydatetime(),
+                'side': side,
+                'quantity': float(quantity),
+                'price': float(price),
+                'commission': float(quantity * price * COMMISSION)
+            } for timestamp, quantity, price in zip(timestamps[positions], quantities, prices))
+
+    fills.sort(key=lambda fill: fill['timestamp'])
+    if curves:
+        # 不同股票的K线时间不完全相同时，按全部时间对齐，股票还没有K线时账户总值为初始资金
+        equity = pd.concat(curves, axis=1).ffill().fillna(cash).sum(axis=1)
+    else:
+        equity = pd.Series(dtype='float64')
+    values = equity.to_numpy()
+    if progress is not None:
+        progress(1.0)
+
+    pnl = np.concatenate(pnls) if pnls else np.array([])
+    won_trades = int((pnl >= 0).sum())
+    final_value = float(values[-1]) if len(values) else float(initial_capital)
+    peak = np.maximum.accumulate(values) if len(values) else values
+    return {
+        'final_value': final_value,
+        'return': (final_value / initial_capital - 1) * 100,  # 百分比
+        'sharpe_ratio': yearly_sharpe(equity.index, values, initial_capital) if len(values) else None,
+        'max_drawdown': float(((peak - values) / peak).max() * 100) if len(values) else 0,
+        'total_trades': total_trades,
+        'won_trades': won_trades,
+        'lost_trades': len(pnl) - won_trades,
+        'win_rate': won_trades / total_trades * 100 if total_trades > 0 else 0,
+        'equity_curve': [{'date': timestamp.isoformat(), 'value': float(value)}
+                         for timestamp, value in zip(equity.index, values)]
+    }, fills
@@ -0,0 +1,131 @@
+"""滚动优化（walk-forward）
+
+把回测区间切分为向后滚动的窗口：每个窗口在样本内区间上对参数网格做参数扫描，
+选出最优参数，再在紧接着的样本外区间上评估。全部窗口的样本内回测作为一批并行运行，
+之后并行运行全部样本外回测，两批共用同一个进程池，行情和编译好的策略在窗口之间复用。
+
+样本外回测从样本内区间开始运行，使指标有足够的历史数据，只统计样本外区间的权益和成交，
+因此样本外区间开始时可能带有之前建立的持仓。各窗口样本外区间的权益曲线依次衔接为一条曲线，
+反映只用当时已有的数据选择参数时策略的表现。
+"""
+from datetime import datetime, timedelta
+
+from app import db
+from app.backtest.data import load_backtest_data
+from app.backtest.jobs import register_job_handler
+from app.backtest.parallel import BacktestPool, curve_metrics, run_in_worker
+from app.backtest.sweep import expand_grid, rank_results, sweep_processes
+from app.models.strategy import Strategy
+
+
+def make_windows(start, end, in_sample_days, out_of_sample_days):
+    """切分滚动窗口，返回 [(样本内开始, 样本内结束, 样本外开始, 样本外结束)]，日期都包含在区间内
+
+    每个窗口比上一个窗口向后移动一个样本外区间，最后一个样本外区间截止到 end。
+    """
+    windows = []
+    in_sample_start = start
+    while True:
+        out_of_sample_start = in_sample_start + timedelta(days=in_sample_days)
+        if out_of_sample_start > end:
+            break
+        out_of_sample_end = min(out_of_sample_start + timedelta(days=out_of_sample_days - 1), end)
+        windows.append((in_sample_start, out_of_sample_start - timedelta(days=1), out_of_sample_start, out_of_sample_end))
+        in_sample_start += timedelta(days=out_of_sample_days)
+    return windows
+
+
+def run_out_of_sample(task):
+    """进程池任务：task 为 (params, initial_capital, 样本内开始, 样本外结束, 样本外开始)
+
+    返回样本外区间的权益曲线、区间开始前的账户总值和区间内的成交笔数。
+    """
+    params, initial_capital, start, end, out_of_sample_start = task
+    results, fills = run_in_worker(params, initial_capital, start, end)
+    since = out_of_sample_start.isoformat()
+    curve = results['equity_curve']
+    before = [point['value'] for point in curve if point['date'] < since]
+    return {
+        'base': before[-1] if before else initial_capital,
+        'equity_curve': [point for point in curve if point['date'] >= since],
+        'fills': sum(1 for fill in fills if fill['timestamp'] >= out_of_sample_start)
+    }
+
+
+def _window_dict(window):
+    return {
+        'in_sample': {'start': window[0].isoformat(), 'end': window[1].isoformat()},
+        'out_of_sample': {'start': window[2].isoformat(), 'end': window[3].isoformat()}
+    }
+
+
+@register_job_handler('walk_forward')
+def run_walk_forward_job(job, progress):
+    """执行滚动优化，payload 见 POST /api/backtest/walk-forward"""
+    payload = job.payload
+    strategy = db.session.get(Strategy, payload['strategy_id'])
+    if not strategy:
+        raise ValueError('策略不存在')
+    start = datetime.fromisoformat(payload['start_date'])
+    end = datetime.fromisoformat(payload['end_date'])
+    parameters = payload.get('parameters', {})
+    initial_capital = payload['initial_capital']
+    sort, descending = payload['sort'], payload['descending']
+
+    windows = make_windows(start, end, payload['in_sample_days'], payload['out_of_sample_days'])
+    if not windows:
+        raise ValueError('回测区间短于样本内区间')
+    frames = load_backtest_data(parameters.get('symbols', ['AAPL']), start, end)
+    if not frames:
+        raise ValueError('没有可用的行情数据')
+
+    combinations = expand_grid(payload['grid'])
+    in_sample_tasks = [({**parameters, **combination}, initial_capital, window[0], window[1])
+                       for window in windows for combination in combinations]
+    # 按回测次数分配进度，样本外回测次数少，但每次运行的区间更长
+    share = len(in_sample_tasks) / (len(in_sample_tasks) + len(windows))
+    with BacktestPool(frames, strategy.code, sweep_processes(len(in_sample_tasks))) as pool:
+        results = pool.run(in_sample_tasks, progress=lambda done: progress(done * share))
+
+        best = []
+        for i in range(len(windows)):
+            rows = [{'parameters': combination, **result}
+                    for combination, result in zip(combinations, results[i * len(combinations):(i + 1) * len(combinations)])]
+            row = rank_results(rows, sort, descending)[0]
+            # 全部组合都没有该指标时（如区间内没有成交、权益不变）无法选择参数，不评估这个窗口
+            if 'error' not in row and row.get(sort) is None:
+                row = dict(row, error=f'样本内全部参数组合都没有 {sort} 指标，无法选择参数')
+            best.append(row)
+
+        selected = [i for i, row in enumerate(best) if 'error' not in row]
+        out_of_sample_tasks = [({**parameters, **best[i]['parameters']}, initial_capital, windows[i][0], windows[i][3],
+                                windows[i][2]) for i in selected]
+        out_of_sample = dict(zip(selected, pool.run(out_of_sample_tasks, function=run_out_of_sample,
+                                                    progress=lambda done: progress(share + done * (1 - share)))))
+
+    # 衔接样本外权益曲线：每个窗口按上一个窗口结束时的账户总值缩放
+    value = initial_capital
+    stitched = []
+    reports = []
+    for i, (window, row) in enumerate(zip(windows, best)):
+        result = out_of_sample.get(i, {})
+        report = _window_dict(window)
+        report['parameters'] = row['parameters']
+        report['in_sample_metrics'] = {name: row.get(name) for name in (sort, 'return', 'sharpe_ratio', 'max_drawdown')}
+        if 'error' in row or 'error' in result or not result['equity_curve']:
+            report['error'] = row.get('error') or result.get('error') or '样本外区间没有K线'
+            reports.append(report)
+            continue
+        curve = [point['value'] for point in result['equity_curve']]
+        report['out_of_sample_metrics'] = dict(curve_metrics(curve, result['base']), trades=result['fills'])
+        scale = value / result['base']
+        stitched.extend({'date': point['date'], 'value': point['value'] * scale} for point in result['equity_curve'])
+        value = stitched[-1]['value']
+        reports.append(report)
+
+    return {
+        'strategy_id': strategy.id,
+        'windows': reports,
+        'out_of_sample': curve_metrics([point['value'] for point in stitched], initial_capital) if stitched else None,
+        'equity_curve': stitched
+    }
@@ -17,6 +17,48 @@ class BaseConfig:
     # 应用配置
     TIMEZONE = os.getenv('TIMEZONE', 'Asia/Shanghai')
 
+    # 行情数据配置
+    BAR_STORE_PATH = os.getenv('BAR_STORE_PATH', os.path.join('data', 'bars'))
+    MARKET_DATA_CACHE_SIZE = int(os.getenv('MARKET_DATA_CACHE_SIZE', 512))
+    MARKET_DATA_PROVIDER = os.getenv('MARKET_DATA_PROVIDER')  # 为空时按data_sources表选择
+    REPLAY_DATA_PATH = os.getenv('REPLAY_DATA_PATH', os.path.join('data', 'replay'))
+    MARKET_DATA_BATCH_SIZE = int(os.getenv('MARKET_DATA_BATCH_SIZE', 50))
+    MARKET_DATA_MAX_WORKERS = int(os.getenv('MARKET_DATA_MAX_WORKERS', 4))
+    MARKET_DATA_BASE_INTERVALS = os.getenv('MARKET_DATA_BASE_INTERVALS', '5m,1d')  # 更粗的周期由这些周期聚合
+    MARKET_SESSION_TIMEZONE = os.getenv('MARKET_SESSION_TIMEZONE', 'America/New_York')
+    MARKET_SESSION_OPEN = os.getenv('MARKET_SESSION_OPEN', '09:30')
+    RESAMPLE_CACHE_SIZE = int(os.getenv('RESAMPLE_CACHE_SIZE', 256))
+    RING_BUFFER_SIZE = int(os.getenv('RING_BUFFER_SIZE', 500))
+    QUOTE_POLL_INTERVAL = float(os.getenv('QUOTE_POLL_INTERVAL', 5))
+    QUOTE_QUEUE_SIZE = int(os.getenv('QUOTE_QUEUE_SIZE', 100))
+    QUOTE_HEARTBEAT_INTERVAL = float(os.getenv('QUOTE_HEARTBEAT_INTERVAL', 15))
+    QUOTE_STREAM_MAX_SYMBOLS = int(os.getenv('QUOTE_STREAM_MAX_SYMBOLS', 100))
+    INDICATOR_STATE_CACHE_SIZE = int(os.getenv('INDICATOR_STATE_CACHE_SIZE', 4096))
+    INDICATOR_STATE_TTL = int(os.getenv('INDICATOR_STATE_TTL', 86400))
+    INDICATOR_BATCH_MAX_SYMBOLS = int(os.getenv('INDICATOR_BATCH_MAX_SYMBOLS', 500))
+    UNIVERSE_REFRESH_INTERVAL = int(os.getenv('UNIVERSE_REFRESH_INTERVAL', 300))  # 多久比较一次全市场快照的存储版本号（秒）
+    SCREENER_MAX_RESULTS = int(os.getenv('SCREENER_MAX_RESULTS', 1000))
+    SEARCH_INDEX_TTL = int(os.getenv('SEARCH_INDEX_TTL', 600))  # 搜索索引最长多久从数据库重建一次（秒）
+    PRICE_DATA_BATCH_SIZE = int(os.getenv('PRICE_DATA_BATCH_SIZE', 5000))
+    PRICE_DATA_COPY_THRESHOLD = int(os.getenv('PRICE_DATA_COPY_THRESHOLD', 50000))  # 仅PostgreSQL
+    DATA_QUALITY_SPIKE_RATIO = float(os.getenv('DATA_QUALITY_SPIKE_RATIO', 10))
+    DATA_QUALITY_SPIKE_WINDOW = int(os.getenv('DATA_QUALITY_SPIKE_WINDOW', 11))
+    DATA_QUALITY_REJECT_ZERO_VOLUME = os.getenv('DATA_QUALITY_REJECT_ZERO_VOLUME', 'false').lower() == 'true'
+    PRICE_DATA_PARTITION_MONTHS_AHEAD = int(os.getenv('PRICE_DATA_PARTITION_MONTHS_AHEAD', 3))  # 仅PostgreSQL
+
+    # 回测配置
+    BACKTEST_WORKERS = int(os.getenv('BACKTEST_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+    BACKTEST_WORKER_NICE = int(os.getenv('BACKTEST_WORKER_NICE', 10))
+    BACKTEST_POLL_INTERVAL = float(os.getenv('BACKTEST_POLL_INTERVAL', 1))
+    BACKTEST_PROGRESS_INTERVAL = float(os.getenv('BACKTEST_PROGRESS_INTERVAL', 1))
+    BACKTEST_JOB_HEARTBEAT = int(os.getenv('BACKTEST_JOB_HEARTBEAT', 30))
+    BACKTEST_JOB_TIMEOUT = int(os.getenv('BACKTEST_JOB_TIMEOUT', 300))
+    BACKTEST_JOB_MAX_ATTEMPTS = int(os.getenv('BACKTEST_JOB_MAX_ATTEMPTS', 3))
+    BACKTEST_SWEEP_PROCESSES = int(os.getenv('BACKTEST_SWEEP_PROCESSES', 0))
+    BACKTEST_SWEEP_MAX_COMBINATIONS = int(os.getenv('BACKTEST_SWEEP_MAX_COMBINATIONS', 1000))
+    BACKTEST_DATA_CACHE_MB = int(os.getenv('BACKTEST_DATA_CACHE_MB', 512))
+    BACKTEST_RESULT_CACHE_SIZE = int(os.getenv('BACKTEST_RESULT_CACHE_SIZE', 1000))
+
     # 安全配置
     SECRET_KEY = os.getenv('SECRET_KEY', 'dev_secret_key')
     WTF_CSRF_SECRET_KEY = os.getenv('WTF_CSRF_SECRET_KEY', 'csrf_dev_secret_key')
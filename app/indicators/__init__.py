@@ -0,0 +1,8 @@
+# 导入指标计算引擎
+from app.indicators.engine import (
+    INDICATORS, register_indicator, indicator_params, compute_indicator,
+    sma, ema, rsi, macd, bollinger, atr, stochastic, obv, vwap, wilder, true_range
+)
+
+# 导入指标增量计算
+from app.indicators.incremental import incremental_indicator, incremental
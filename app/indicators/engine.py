@@ -0,0 +1,176 @@
+"""技术指标计算引擎
+
+所有指标都是基于 pandas/NumPy 的 O(n) 向量化实现，输入为包含OHLCV列的DataFrame
+（列名大小写均可），行情接口、实盘策略和回测都通过这里计算指标，保证结果一致。
+
+输入也可以是多只股票对齐后的面板：列为 (字段, symbol) 两级索引，
+此时所有股票在同一次向量化计算中完成，输出列为 (输出名, symbol)。
+"""
+import numpy as np
+import pandas as pd
+
+# 指标名称 -> (计算函数, 默认参数)
+INDICATORS = {}
+
+
+def register_indicator(name, **defaults):
+    """注册指标的装饰器，defaults 为指标参数及其默认值"""
+    def decorator(func):
+        INDICATORS[name] = (func, defaults)
+        return func
+    return decorator
+
+
+def column(df, name):
+    """按名称取列，兼容 close / Close 两种写法"""
+    if name in df.columns:
+        return df[name].astype('float64')
+    return df[name.capitalize()].astype('float64')
+
+
+def wilder(values, period):
+    """Wilder平滑：前period个值的简单平均作为种子，之后按 1/period 递推
+
+    values 可以是Series，也可以是每列一只股票的DataFrame，各列分别确定种子位置。
+    """
+    frame = values.to_frame() if isinstance(values, pd.Series) else values
+    data = frame.to_numpy(dtype='float64')
+    rows = np.arange(len(data))[:, None]
+
+    valid = ~np.isnan(data)
+    seed_at = valid.argmax(axis=0) + period - 1
+    seeded_columns = np.flatnonzero(valid.any(axis=0) & (seed_at < len(data)))
+
+    # 种子之前的值置空，种子位置放入前period个值的均值，之后的值保持不变
+    seeded = np.where(rows > seed_at, data, np.nan)
+    means = frame.rolling(window=period).mean().to_numpy()
+    seeded[seed_at[seeded_columns], seeded_columns] = means[seed_at[seeded_columns], seeded_columns]
+
+    result = pd.DataFrame(seeded, index=frame.index, columns=frame.columns)
+    result = result.ewm(alpha=1.0 / period, adjust=False).mean()
+    result = result.where(rows >= seed_at)
+    return result.iloc[:, 0] if isinstance(values, pd.Series) else result
+
+
+@register_indicator('sma', period=14)
+def sma(df, period=14):
+    """简单移动平均线"""
+    return column(df, 'close').rolling(window=period).mean()
+
+
+@register_indicator('ema', period=14)
+def ema(df, period=14):
+    """指数移动平均线"""
+    return column(df, 'close').ewm(span=period, adjust=False).mean()
+
+
+@register_indicator('rsi', period=14)
+def rsi(df, period=14):
+    """相对强弱指标（Wilder平滑）"""
+    delta = column(df, 'close').diff()
+    avg_gain = wilder(delta.clip(lower=0), period)
+    avg_loss = wilder(-delta.clip(upper=0), period)
+    rs = avg_gain / avg_loss
+    return 100 - (100 / (1 + rs))
+
+
+@register_indicator('macd', fast=12, slow=26, signal=9)
+def macd(df, fast=12, slow=26, signal=9):
+    """MACD：快慢EMA之差、信号线和柱状图"""
+    close = column(df, 'close')
+    line = close.ewm(span=fast, adjust=False).mean() - close.ewm(span=slow, adjust=False).mean()
+    signal_line = line.ewm(span=signal, adjust=False).mean()
+    return pd.concat({
+        'macd': line,
+        'signal': signal_line,
+        'hist': line - signal_line
+    }, axis=1)
+
+
+@register_indicator('bollinger', period=20, std=2.0)
+def bollinger(df, period=20, std=2.0):
+    """布林带：中轨为简单移动平均，上下轨为中轨加减std倍标准差"""
+    close = column(df, 'close')
+    rolling = close.rolling(window=period)
+    middle = rolling.mean()
+    width = rolling.std(ddof=0) * std
+    return pd.concat({
+        'middle': middle,
+        'upper': middle + width,
+        'lower': middle - width
+    }, axis=1)
+
+
+def true_range(high, low, prev_close):
+    """真实波幅：当日高低差、最高价与前收盘价之差、最低价与前收盘价之差中的最大值"""
+    result = high - low
+    for candidate in ((high - prev_close).abs(), (low - prev_close).abs()):
+        result = result.mask(candidate > result, candidate)
+    return result
+
+
+@register_indicator('atr', period=14)
+def atr(df, period=14):
+    """平均真实波幅（Wilder平滑）"""
+    high, low, close = column(df, 'high'), column(df, 'low'), column(df, 'close')
+    return wilder(true_range(high, low, close.shift(1)), period)
+
+
+@register_indicator('stochastic', k_period=14, d_period=3)
+def stochastic(df, k_period=14, d_period=3):
+    """随机指标：%K 为收盘价在区间高低点中的位置，%D 为 %K 的简单移动平均"""
+    high, low, close = column(df, 'high'), column(df, 'low'), column(df, 'close')
+    lowest = low.rolling(window=k_period).min()
+    highest = high.rolling(window=k_period).max()
+    k = 100 * (close - lowest) / (highest - lowest).replace(0, np.nan)
+    return pd.concat({
+        'k': k,
+        'd': k.rolling(window=d_period).mean()
+    }, axis=1)
+
+
+@register_indicator('obv')
+def obv(df):
+    """能量潮：按收盘价涨跌方向累加成交量"""
+    direction = np.sign(column(df, 'close').diff()).fillna(0)
+    return (direction * column(df, 'volume').fillna(0)).cumsum()
+
+
+@register_indicator('vwap', period=0)
+def vwap(df, period=0):
+    """成交量加权平均价
+
+    period 为0时按自然日累计（日内K线每天重新开始），否则为最近period根K线的滚动VWAP。
+    """
+    typical = (column(df, 'high') + column(df, 'low') + column(df, 'close')) / 3
+    volume = column(df, 'volume')
+    weighted = typical * volume
+    if period:
+        return weighted.rolling(window=period).sum() / volume.rolling(window=period).sum()
+    day = pd.DatetimeIndex(df.index).normalize()
+    return weighted.groupby(day).cumsum() / volume.groupby(day).cumsum()
+
+
+def indicator_params(name, values):
+    """从请求参数中取出指标需要的参数，并转换为默认值的类型"""
+    if name not in INDICATORS:
+        raise ValueError(f'不支持的指标类型: {name}')
+    defaults = INDICATORS[name][1]
+    params = dict(defaults)
+    for key, default in defaults.items():
+        if values.get(key) is not None:
+            params[key] = type(default)(values[key])
+    return params
+
+
+def compute_indicator(name, df, **params):
+    """计算指标，统一返回DataFrame：单输出指标的列名为 value，多输出指标每个输出一列"""
+    if name not in INDICATORS:
+        raise ValueError(f'不支持的指标类型: {name}')
+    func, defaults = INDICATORS[name]
+    result = func(df, **{**defaults, **params})
+    if isinstance(result, pd.Series):
+        result = result.to_frame('value')
+    elif isinstance(df.columns, pd.MultiIndex) and not isinstance(result.columns, pd.MultiIndex):
+        result = pd.concat({'value': result}, axis=1)
+    return result
@@ -0,0 +1,227 @@
+"""指标增量计算
+
+按 (symbol, interval, 指标, 参数) 缓存指标的中间状态（EMA种子、滚动窗口、Wilder均值等）
+和返回范围内已经算出的结果。新K线到来时只计算尾部，代价与新增K线数和返回的行数成正比，
+而不是整段历史。
+
+最后一根K线可能尚未收盘，因此状态只推进到倒数第二根K线，每次都会重新计算最后一根。
+行情出现断档或修订（缓存的最后确认时间不在新数据中）时自动退回全量计算。
+"""
+import numpy as np
+import pandas as pd
+from flask import current_app
+
+from app.indicators.engine import INDICATORS, column, compute_indicator, true_range, wilder
+
+
+def _ewm_from(seed, values, **kwargs):
+    """以seed为上一期结果继续计算指数平均，返回与values对齐的结果"""
+    series = pd.concat([pd.Series([seed]), pd.Series(values.to_numpy(dtype='float64'))], ignore_index=True)
+    result = series.ewm(adjust=False, **kwargs).mean().iloc[1:]
+    return pd.Series(result.to_numpy(), index=values.index)
+
+
+class WindowState:
+    """有限窗口指标：保留最近 window-1 根K线，新K线到来时只在窗口内重算"""
+
+    def __init__(self, window):
+        self.window = window
+
+    def run(self, name, params, state, bars):
+        frame = pd.concat([state, bars]) if state is not None else bars
+        result = compute_indicator(name, frame, **params).iloc[len(frame) - len(bars):]
+        return result, frame.iloc[-(self.window - 1):] if self.window > 1 else frame.iloc[:0]
+
+
+class EmaState:
+    """指数移动平均：状态为上一期EMA值"""
+
+    def run(self, name, params, state, bars):
+        close = column(bars, 'close')
+        if state is None:
+            value = close.ewm(span=params['period'], adjust=False).mean()
+        else:
+            value = _ewm_from(state, close, span=params['period'])
+        return value.to_frame('value'), value.iloc[-1]
+
+
+class MacdState:
+    """MACD：状态为快线、慢线、信号线三个EMA值"""
+
+    def run(self, name, params, state, bars):
+        close = column(bars, 'close')
+        if state is None:
+            fast = close.ewm(span=params['fast'], adjust=False).mean()
+            slow = close.ewm(span=params['slow'], adjust=False).mean()
+            signal = (fast - slow).ewm(span=params['signal'], adjust=False).mean()
+        else:
+            fast = _ewm_from(state[0], close, span=params['fast'])
+            slow = _ewm_from(state[1], close, span=params['slow'])
+            signal = _ewm_from(state[2], fast - slow, span=params['signal'])
+        line = fast - slow
+        result = pd.DataFrame({'macd': line, 'signal': signal, 'hist': line - signal})
+        return result, (fast.iloc[-1], slow.iloc[-1], signal.iloc[-1])
+
+
+class WilderState:
+    """RSI和ATR：状态为Wilder平均值和上一根K线的收盘价，尚未完成预热时不保存状态"""
+
+    def _inputs(self, name, bars, prev_close):
+        close = column(bars, 'close')
+        prev = close.shift(1)
+        if prev_close is not None:
+            prev.iloc[0] = prev_close
+        if name == 'rsi':
+            delta = close - prev
+            return delta.clip(lower=0), -delta.clip(upper=0)
+        return (true_range(column(bars, 'high'), column(bars, 'low'), prev),)
+
+    def run(self, name, params, state, bars):
+        period = params['period']
+        if state is None:
+            inputs = self._inputs(name, bars, None)
+            averages = [wilder(series, period) for series in inputs]
+        else:
+            inputs = self._inputs(name, bars, state['close'])
+            averages = [
+                _ewm_from(seed, series, alpha=1.0 / period)
+                for seed, series in zip(state['averages'], inputs)
+            ]
+
+        if name == 'rsi':
+            value = 100 - (100 / (1 + averages[0] / averages[1]))
+        else:
+            value = averages[0]
+
+        last = [series.iloc[-1] for series in averages]
+        new_state = None if any(pd.isna(v) for v in last) else {
+            'close': column(bars, 'close').iloc[-1],
+            'averages': last
+        }
+        return value.to_frame('value'), new_state
+
+
+class ObvState:
+    """能量潮：状态为上一期OBV值和收盘价"""
+
+    def run(self, name, params, state, bars):
+        close, volume = column(bars, 'close'), column(bars, 'volume').fillna(0)
+        prev = close.shift(1)
+        start = 0.0
+        if state is not None:
+            prev.iloc[0] = state[1]
+            start = state[0]
+        direction = np.sign(close - prev).fillna(0)
+        value = start + (direction * volume).cumsum()
+        return value.to_frame('value'), (value.iloc[-1], close.iloc[-1])
+
+
+def _runner(name, params):
+    """选择指标对应的增量计算方式，不支持增量计算时返回None"""
+    if name in ('sma', 'bollinger'):
+        return WindowState(params['period'])
+    if name == 'stochastic':
+        return WindowState(params['k_period'] + params['d_period'] - 1)
+    if name == 'vwap' and params['period']:
+        return WindowState(params['period'])
+    if name == 'ema':
+        return EmaState()
+    if name == 'macd':
+        return MacdState()
+    if name in ('rsi', 'atr'):
+        return WilderState()
+    if name == 'obv':
+        return ObvState()
+    return None
+
+
+def get_indicator_state_cache(app=None):
+    """获取当前应用的指标状态缓存"""
+    # 在函数内导入，避免 app.indicators 与 app.market_data 之间的循环导入
+    from app.market_data.cache import TTLCache
+
+    app = app or current_app
+    cache = app.extensions.get('indicator_state_cache')
+    if cache is None:
+        cache = TTLCache(maxsize=app.config['INDICATOR_STATE_CACHE_SIZE'])
+        app.extensions['indicator_state_cache'] = cache
+    return cache
+
+
+def _time_indexed(df):
+    """返回以时间为索引的K线，兼容带 timestamp 列的DataFrame"""
+    if not isinstance(df.index, pd.DatetimeIndex) and 'timestamp' in df.columns:
+        return df.set_index('timestamp')
+    return df
+
+
+def _from(frame, start):
+    """按时间索引截取 start 及之后的行，frame 的索引必须升序"""
+    return frame.iloc[frame.index.searchsorted(start):]
+
+
+def incremental_indicator(symbol, interval, name, df, since=None, **params):
+    """增量计算指标，返回值与 compute_indicator 相同，索引与df对齐
+
+    df 的时间索引（或 timestamp 列）必须升序。指定 since 时只返回该时间及之后的结果，
+    状态仍从df的第一根K线开始推进；缓存只保留返回范围内的结果，命中时的代价与返回的行数
+    和新增K线数成正比，与df之前的历史长度无关。不支持增量计算的指标直接全量计算。
+    """
+    if name not in INDICATORS:
+        raise ValueError(f'不支持的指标类型: {name}')
+    params = {**INDICATORS[name][1], **params}
+    runner = _runner(name, params)
+    bars = _time_indexed(df)
+    if runner is None or len(bars) < 2 or not isinstance(bars.index, pd.DatetimeIndex):
+        result = compute_indicator(name, df, **params)
+        return result if since is None else result[bars.index >= since]
+
+    start = bars.index[0] if since is None else max(bars.index[0], pd.Timestamp(since))
+    cache = get_indicator_state_cache()
+    key = (symbol.upper(), interval, name, tuple(sorted(params.items())))
+    hit, cached = cache.get(key)
+
+    # cached = (最后确认的K线时间, 截止该K线的状态, 从 covered 到该K线的结果, covered, 状态的起点)
+    # 状态为None表示指标尚未完成预热，此时同样从头计算
+    position = None
+    if hit and cached[1] is not None and cached[4] <= bars.index[0] and cached[3] <= start:
+        position = bars.index.searchsorted(cached[0])
+        if position >= len(bars) or bars.index[position] != cached[0]:
+            position = None
+    if position is not None:
+        state, output, anchor = cached[1], _from(cached[2], start), cached[4]
+        new_bars = bars.iloc[position + 1:]
+    else:
+        state, output, new_bars, anchor = None, None, bars, bars.index[0]
+
+    if len(new_bars) > 1:
+        # 推进状态到倒数第二根K线，只保留 start 之后的结果
+        committed, state = runner.run(name, params, state, new_bars.iloc[:-1])
+        committed = _from(committed, start)
+        output = pd.concat([output, committed]) if output is not None else committed
+        cache.set(key, (new_bars.index[-2], state, output, start, anchor), current_app.config['INDICATOR_STATE_TTL'])
+
+    if not len(new_bars):
+        result = output
+    elif state is None:
+        result = _from(compute_indicator(name, bars, **params), start)
+    else:
+        # 最后一根K线总是基于确认状态重新计算
+        last, _ = runner.run(name, params, state, new_bars.iloc[-1:])
+        result = pd.concat([output, _from(last, start)])
+
+    if since is None and bars is not df:
+        result = result.set_axis(df.index)
+    return result
+
+
+def incremental(name, df, **params):
+    """供策略代码使用：按 df.attrs 中的 symbol 和 interval 增量计算指标
+
+    df.attrs 中没有这两个字段时直接全量计算。实盘任务设置这两个字段；回测不设置，
+    见 app/backtest/engine.py 的 signal_targets，回测结果不依赖进程中缓存的指标状态。
+    """
+    symbol, interval = df.attrs.get('symbol'), df.attrs.get('interval')
+    if not symbol or not interval:
+        return compute_indicator(name, df, **params)
+    return incremental_indicator(symbol, interval, name, df, **params)
@@ -0,0 +1,122 @@
+"""增量回补计划
+
+根据 price_data 中已有的K线和交易日历，计算每只股票缺失的交易时段，
+只向数据源请求这些缺口。交易日历按周一至周五计算，节假日会被视为缺口，
+但数据源对这些日期返回空数据，不会写入任何记录。
+
+缺口按交易时段对齐：起点为第一个缺失时段的零点，终点为最后一个缺失时段的次日零点。
+日内周期下最后一个已有时段可能尚未收盘，总是会被重新请求。
+
+只回补基础周期：请求回补可以由基础周期聚合的周期（如 1h）时，实际回补其来源周期（如 5m）。
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+import pandas as pd
+
+from app.market_data.bar_store import load_bars, to_utc_naive
+from app.market_data.ingest import ingest_bars
+from app.market_data.resample import storage_interval
+from app.market_data.upstream import fetch_history_batch
+
+logger = logging.getLogger(__name__)
+
+# 各K线周期对应的交易时段粒度
+SESSION_FREQS = {
+    '1wk': 'W-SUN',
+    '1mo': 'M',
+}
+DAILY_INTERVALS = ('1d', '5d', '1wk', '1mo', '3mo')
+
+
+def _sessions(start, end, interval):
+    """返回 [start, end] 区间内应当有数据的交易时段（PeriodIndex）"""
+    freq = SESSION_FREQS.get(interval, 'B')
+    days = pd.bdate_range(start.normalize(), end.normalize())
+    return pd.PeriodIndex(days, freq=freq).unique()
+
+
+def _runs(periods):
+    """把有序的交易时段切分为连续片段"""
+    runs = []
+    for period in periods:
+        if runs and period.ordinal == runs[-1][-1].ordinal + 1:
+            runs[-1].append(period)
+        else:
+            runs.append([period])
+    return runs
+
+
+def plan_backfill(symbols, interval='1d', start=None, end=None):
+    """计算需要回补的 (symbol, interval, 时间区间) 缺口
+
+    返回的每个缺口包含 symbol、interval、start、end（不含）和缺失的交易时段数。
+    """
+    interval = storage_interval(interval)
+    end = to_utc_naive(end or datetime.utcnow())
+    start = to_utc_naive(start) if start is not None else end - pd.DateOffset(years=1)
+    expected = _sessions(start, end, interval)
+    freq = expected.freq
+
+    gaps = []
+    for symbol in dict.fromkeys(symbols):
+        existing = load_bars(symbol, interval, start=start.normalize(), end=end).index
+        present = existing.to_period(freq).unique() if len(existing) else pd.PeriodIndex([], freq=freq)
+        missing = expected.difference(present)
+
+        # 日内K线的最后一个已有时段可能不完整，重新请求整个时段
+        if len(present) and interval not in DAILY_INTERVALS:
+            missing = missing.union(pd.PeriodIndex([present.max()], freq=freq))
+
+        for run in _runs(missing.sort_values()):
+            gaps.append({
+                'symbol': symbol,
+                'interval': interval,
+                'start': run[0].start_time.to_pydatetime(),
+                'end': (run[-1].end_time.normalize() + pd.Timedelta(days=1)).to_pydatetime(),
+                'sessions': len(run)
+            })
+    return gaps
+
+
+def backfill_report(gaps):
+    """汇总回补计划，用于预演（dry run）"""
+    requests = {(g['interval'], g['start'], g['end']) for g in gaps}
+    return {
+        'symbols': len({g['symbol'] for g in gaps}),
+        'missing_sessions': sum(g['sessions'] for g in gaps),
+        'requests': len(requests),
+        'gaps': [{
+            **gap,
+            'start': gap['start'].isoformat(),
+            'end': gap['end'].isoformat()
+        } for gap in gaps]
+    }
+
+
+def run_backfill(gaps):
+    """执行回补计划：相同时间区间的缺口合并为一次批量请求，结果写入price_data
+
+    返回 {symbol: 写入统计或错误信息}。
+    """
+    groups = defaultdict(list)
+    for gap in gaps:
+        groups[(gap['interval'], gap['start'], gap['end'])].append(gap['symbol'])
+
+    results = defaultdict(lambda: {'rows': 0, 'rejected': 0, 'errors': []})
+    for (interval, start, end), symbols in groups.items():
+        frames, errors = fetch_history_batch(symbols, period=None, interval=interval, start=start, end=end)
+        for symbol, error in errors.items():
+            results[symbol]['errors'].append(error)
+        for symbol, df in frames.items():
+            if df.empty:
+                continue
+            try:
+                stats = ingest_bars(symbol, interval, df)
+                results[symbol]['rows'] += stats['rows']
+                results[symbol]['rejected'] += stats['quality']['rejected']
+            except Exception as e:
+                logger.error(f"回补股票 {symbol} 的K线时出错: {str(e)}")
+                results[symbol]['errors'].append(str(e))
+    return dict(results)
@@ -0,0 +1,319 @@
+"""列式K线存储
+
+按 (symbol, interval) 把 price_data 镜像为 NumPy 列文件，读取时内存映射，
+区间查询直接在映射数组上切片，不复制数据。
+
+目录结构::
+
+    <BAR_STORE_PATH>/<interval>/<SYMBOL>/
+        timestamp.<version>.npy   int64，UTC 纳秒时间戳，升序且唯一
+        values.<version>.npy      float64，形状 (5, n)，按 open/high/low/close/volume 逐列连续存放
+        index.json                行数、首尾时间戳、版本号和当前版本的文件名
+
+每次写入都生成新版本的数据文件，最后原子替换 index.json 切换版本，
+读者总是看到同一版本的时间戳和数值。Web进程、回测工作进程和定时任务可能同时写入同一只股票，
+写入时对目录中的 .lock 文件加排他锁（fcntl.flock），读取版本号到切换索引之间不会交错。price_data 中没有K线的股票也会写入 rows 为0的 index.json，
+表示已经从 price_data 加载过，之后不再查询数据库。
+"""
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+
+from app import db
+from app.models.market_data import StockData, PriceData
+
+try:
+    import fcntl
+except ImportError:  # Windows 上只有进程内的锁
+    fcntl = None
+
+# 与 yfinance 返回的列名保持一致，便于替换原有的下载逻辑
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# yfinance 风格的 period 参数对应的时间跨度
+PERIOD_OFFSETS = {
+    '1d': pd.DateOffset(days=1),
+    '5d': pd.DateOffset(days=5),
+    '1mo': pd.DateOffset(months=1),
+    '3mo': pd.DateOffset(months=3),
+    '6mo': pd.DateOffset(months=6),
+    '1y': pd.DateOffset(years=1),
+    '2y': pd.DateOffset(years=2),
+    '5y': pd.DateOffset(years=5),
+    '10y': pd.DateOffset(years=10),
+}
+
+
+def to_utc_naive(value):
+    """把任意时间值转换为不带时区的UTC时间，None原样返回"""
+    if value is None:
+        return None
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC').tz_localize(None)
+    return ts
+
+
+def period_start(period, now=None):
+    """把 period 参数换算为起始时间，max 或无法识别时返回None"""
+    now = to_utc_naive(now or datetime.utcnow())
+    if period == 'ytd':
+        return pd.Timestamp(year=now.year, month=1, day=1)
+    offset = PERIOD_OFFSETS.get(period)
+    return now - offset if offset is not None else None
+
+
+def empty_frame():
+    """返回空的K线DataFrame"""
+    return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], name='timestamp'), dtype='float64')
+
+
+def normalize_frame(df, dedupe=True):
+    """把各种来源的K线DataFrame整理为标准格式：UTC时间索引升序去重，列为COLUMNS
+
+    dedupe=False 时保留重复的时间戳，相同时间戳的K线保持原来的先后顺序。
+    """
+    if df is None or df.empty:
+        return empty_frame()
+    frame = df.rename(columns={c: c.capitalize() for c in df.columns if isinstance(c, str)})
+    index = pd.DatetimeIndex(frame.index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    frame = frame.reindex(columns=COLUMNS).astype('float64')
+    frame.index = index.rename('timestamp')
+    if dedupe:
+        frame = frame[~frame.index.duplicated(keep='last')]
+    return frame.sort_index(kind='stable')
+
+
+class BarStore:
+    """基于内存映射NumPy文件的列式K线存储"""
+
+    def __init__(self, root):
+        self.root = root
+        self._lock = threading.RLock()
+        # (symbol, interval) -> (version, timestamps, values)
+        self._mapped = {}
+
+    def _path(self, symbol, interval):
+        return os.path.join(self.root, interval, symbol.upper())
+
+    def _read_index(self, path):
+        try:
+            with open(os.path.join(path, 'index.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _open(self, symbol, interval):
+        """打开（或复用已打开的）内存映射数组，不存在时返回None"""
+        key = (symbol.upper(), interval)
+        path = self._path(symbol, interval)
+        for _ in range(3):
+            index = self._read_index(path)
+            if index is None or not index.get('rows'):
+                self._mapped.pop(key, None)
+                return None
+
+            with self._lock:
+                mapped = self._mapped.get(key)
+                if mapped is not None and mapped[0] == index['version']:
+                    return mapped
+                try:
+                    # 旧版本的存储没有记录文件名
+                    timestamps = np.load(os.path.join(path, index.get('timestamp', 'timestamp.npy')), mmap_mode='r')
+                    values = np.load(os.path.join(path, index.get('values', 'values.npy')), mmap_mode='r')
+                except FileNotFoundError:
+                    # 读取 index.json 之后又写入了两个新版本，旧文件已被删除，重新读取索引
+                    continue
+                mapped = (index['version'], timestamps, values)
+                self._mapped[key] = mapped
+            return mapped
+        raise RuntimeError(f'K线存储 {symbol} {interval} 写入过于频繁，无法读取一致的版本')
+
+    @contextmanager
+    def _file_lock(self, path):
+        """对 (symbol, interval) 目录加跨进程的排他锁"""
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, '.lock'), 'a') as f:
+            if fcntl is None:
+                yield
+                return
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def info(self, symbol, interval):
+        """返回存储的索引信息（行数、首尾时间、版本），不存在时返回None"""
+        return self._read_index(self._path(symbol, interval))
+
+    def read(self, symbol, interval, start=None, end=None, limit=None):
+        """读取 [start, end] 区间的K线
+
+        返回的DataFrame直接引用内存映射数组的切片，调用方不应原地修改。
+        limit 表示只取区间内最后 limit 根K线。
+        """
+        mapped = self._open(symbol, interval)
+        if mapped is None:
+            return empty_frame()
+        _, timestamps, values = mapped
+
+        lo, hi = 0, len(timestamps)
+        if start is not None:
+            lo = int(np.searchsorted(timestamps, to_utc_naive(start).value, side='left'))
+        if end is not None:
+            hi = int(np.searchsorted(timestamps, to_utc_naive(end).value, side='right'))
+        if limit is not None:
+            lo = max(lo, hi - int(limit))
+        if lo >= hi:
+            return empty_frame()
+
+        index = pd.DatetimeIndex(timestamps[lo:hi].view('datetime64[ns]'), name='timestamp')
+        # values[:, lo:hi] 的转置与 pandas 的列块布局一致，copy=False 时不会复制
+        return pd.DataFrame(values[:, lo:hi].T, index=index, columns=COLUMNS, copy=False)
+
+    def write(self, symbol, interval, df, hydrate=True):
+        """把K线合并写入存储，相同时间戳以新数据为准，返回写入后的总行数
+
+        存储中还没有该 (symbol, interval) 时，先合并 price_data 中已有的全部K线，
+        避免存储只包含这次写入的K线；df 已经是完整历史时传 hydrate=False。
+        """
+        new = normalize_frame(df)
+        path = self._path(symbol, interval)
+        with self._lock, self._file_lock(path):
+            info = self.info(symbol, interval)
+            if info is not None and new.empty:
+                return info['rows']
+            if info is None and hydrate:
+                existing = query_symbol_frame(symbol, interval)
+            else:
+                existing = self.read(symbol, interval)
+            if not existing.empty:
+                merged = pd.concat([existing, new])
+                merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+            else:
+                merged = new
+
+            timestamps = merged.index.values.astype('datetime64[ns]').view('int64')
+            values = np.ascontiguousarray(merged[COLUMNS].to_numpy(dtype='float64').T)
+            version = (info or {}).get('version', 0) + 1
+
+            # 数据文件按版本号命名，写好后再原子替换 index.json 切换到新版本
+            files = {'timestamp': f'timestamp.{version}.npy', 'values': f'values.{version}.npy'}
+            for name, array in ((files['timestamp'], timestamps), (files['values'], values)):
+                tmp = os.path.join(path, name + '.tmp')
+                with open(tmp, 'wb') as f:
+                    np.save(f, array)
+                os.replace(tmp, os.path.join(path, name))
+
+            index = {
+                'symbol': symbol.upper(),
+                'interval': interval,
+                'rows': int(len(timestamps)),
+                'start': int(timestamps[0]) if len(timestamps) else None,
+                'end': int(timestamps[-1]) if len(timestamps) else None,
+                'version': version,
+                'updated_at': datetime.utcnow().isoformat(),
+                **files
+            }
+            tmp = os.path.join(path, 'index.json.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(index, f)
+            os.replace(tmp, os.path.join(path, 'index.json'))
+            self._mapped.pop((symbol.upper(), interval), None)
+            self._remove_old_files(path, version)
+
+        return index['rows']
+
+    def _remove_old_files(self, path, version):
+        """删除早于上一版本的数据文件，保留上一版本给刚读取了旧 index.json 的读者
+
+        已经映射的文件删除后仍然可以读取，直到映射被释放。
+        """
+        keep = {f'{name}.{v}.npy' for name in ('timestamp', 'values') for v in (version, version - 1)}
+        for name in os.listdir(path):
+            if name.endswith('.npy') and name not in keep:
+                try:
+                    os.remove(os.path.join(path, name))
+                except FileNotFoundError:
+                    pass
+
+
+def get_bar_store(app=None):
+    """获取当前应用的列式K线存储实例"""
+    app = app or current_app
+    store = app.extensions.get('bar_store')
+    if store is None:
+        store = BarStore(app.config['BAR_STORE_PATH'])
+        app.extensions['bar_store'] = store
+    return store
+
+
+def query_price_frame(stock_id, interval, start=None, end=None):
+    """从 price_data 表读取K线并整理为标准DataFrame"""
+    query = db.session.query(
+        PriceData.timestamp,
+        PriceData.open_price,
+        PriceData.high_price,
+        PriceData.low_price,
+        PriceData.close_price,
+        PriceData.volume
+    ).filter(PriceData.stock_id == stock_id, PriceData.interval == interval)
+    if start is not None:
+        query = query.filter(PriceData.timestamp >= to_utc_naive(start).to_pydatetime())
+    if end is not None:
+        query = query.filter(PriceData.timestamp <= to_utc_naive(end).to_pydatetime())
+
+    rows = query.order_by(PriceData.timestamp).all()
+    if not rows:
+        return empty_frame()
+    df = pd.DataFrame.from_records(rows, columns=['timestamp'] + COLUMNS, index='timestamp')
+    return normalize_frame(df)
+
+
+def query_symbol_frame(symbol, interval):
+    """按股票代码从 price_data 表读取全部K线，股票不存在时返回空的DataFrame"""
+    stock = StockData.query.filter_by(symbol=symbol).first()
+    if not stock:
+        return empty_frame()
+    return query_price_frame(stock.id, interval)
+
+
+def sync_bar_store(symbol, interval):
+    """用 price_data 中的全部K线重建某个 (symbol, interval) 的列式存储
+
+    股票存在但没有K线时写入空的存储，之后的读取不再查询数据库。
+    """
+    stock = StockData.query.filter_by(symbol=symbol).first()
+    if not stock:
+        return 0
+    return get_bar_store().write(symbol, interval, query_price_frame(stock.id, interval), hydrate=False)
+
+
+def load_bars(symbol, interval='1d', start=None, end=None, limit=None):
+    """统一的K线读取接口
+
+    优先从列式存储读取；存储中还没有该 (symbol, interval) 时，
+    先从 price_data 表加载并写入存储，之后的读取都走内存映射。
+    interval 不是基础周期时由基础周期聚合得到，见 app.market_data.resample。
+    返回以UTC时间为索引、列为 Open/High/Low/Close/Volume 的DataFrame。
+    """
+    # 在函数内导入，resample 依赖本模块
+    from app.market_data.resample import load_resampled
+
+    bars = load_resampled(symbol, interval, start=start, end=end, limit=limit)
+    if bars is not None:
+        return bars
+
+    store = get_bar_store()
+    if store.info(symbol, interval) is None:
+        sync_bar_store(symbol, interval)
+    return store.read(symbol, interval, start=start, end=end, limit=limit)
@@ -0,0 +1,135 @@
+"""行情数据读穿缓存
+
+按 (symbol, period, interval) 缓存上游返回的历史K线，
+过期时间随K线周期变化，容量满时按LRU淘汰。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+
+from app.market_data.upstream import fetch_history
+
+# 各K线周期的缓存有效期（秒），周期越短数据变化越快
+INTERVAL_TTLS = {
+    '1m': 30,
+    '2m': 60,
+    '5m': 120,
+    '15m': 300,
+    '30m': 600,
+    '60m': 900,
+    '90m': 900,
+    '1h': 900,
+    '1d': 3600,
+    '5d': 3600 * 6,
+    '1wk': 3600 * 6,
+    '1mo': 3600 * 12,
+    '3mo': 3600 * 12,
+}
+DEFAULT_TTL = 300
+
+
+class TTLCache:
+    """线程安全的TTL + LRU缓存"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """查询缓存，返回 (是否命中, 值)"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = item
+            if expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def set(self, key, value, ttl):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, ttl):
+        """读穿：命中则直接返回，否则调用loader加载并写入缓存"""
+        hit, value = self.get(key)
+        if hit:
+            return value
+        value = loader()
+        self.set(key, value, ttl)
+        return value
+
+    def delete(self, predicate=None):
+        """删除满足条件的条目，predicate为空时清空缓存，返回删除的条目数"""
+        with self._lock:
+            if predicate is None:
+                count = len(self._data)
+                self._data.clear()
+                return count
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+            return len(keys)
+
+    def stats(self):
+        """返回缓存统计信息"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def entries(self):
+        """返回所有条目的键和剩余有效期（秒），按最近使用排序"""
+        now = time.monotonic()
+        with self._lock:
+            return [(key, max(0.0, expires_at - now)) for key, (expires_at, _) in reversed(self._data.items())]
+
+
+def get_history_cache(app=None):
+    """获取当前应用的历史K线缓存实例"""
+    app = app or current_app
+    cache = app.extensions.get('history_cache')
+    if cache is None:
+        cache = TTLCache(maxsize=app.config['MARKET_DATA_CACHE_SIZE'])
+        app.extensions['history_cache'] = cache
+    return cache
+
+
+def get_history(symbol, period='1mo', interval='1d'):
+    """带缓存地获取历史K线
+
+    返回的DataFrame在多个请求间共享，调用方需要修改时应先复制。
+    """
+    key = (symbol.upper(), period, interval)
+    ttl = INTERVAL_TTLS.get(interval, DEFAULT_TTL)
+    return get_history_cache().get_or_load(
+        key,
+        lambda: fetch_history(symbol, period=period, interval=interval),
+        ttl
+    )
@@ -0,0 +1,201 @@
+"""price_data 批量写入
+
+把整段K线DataFrame批量upsert到 price_data，相同 (stock_id, timestamp, interval)
+的记录直接覆盖，重复执行不会违反 uix_price_data 约束：
+
+- PostgreSQL / SQLite 使用 INSERT ... ON CONFLICT DO UPDATE
+- MySQL 使用 INSERT ... ON DUPLICATE KEY UPDATE
+- PostgreSQL 上的大批量数据先 COPY 到临时表，再一次性合并
+
+写入前先做数据质量校验，不合格的K线写入 quarantined_bars 隔离表，见 validation.py。
+"""
+import csv
+import io
+import logging
+import time
+from datetime import datetime
+
+import pandas as pd
+from flask import current_app
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app import db
+from app.market_data.bar_store import COLUMNS, get_bar_store, normalize_frame, to_utc_naive
+from app.market_data.partitions import ensure_partitions_for
+from app.market_data.resample import storage_interval
+from app.market_data.ring_buffer import get_ring_buffers
+from app.market_data.universe import get_universe
+from app.market_data.validation import validate_bars
+from app.models.market_data import StockData, PriceData, QuarantinedBar
+
+logger = logging.getLogger(__name__)
+
+# DataFrame 列与 price_data 字段的对应关系
+FIELD_MAP = {
+    'Open': 'open_price',
+    'High': 'high_price',
+    'Low': 'low_price',
+    'Close': 'close_price',
+    'Volume': 'volume',
+}
+VALUE_FIELDS = list(FIELD_MAP.values())
+KEY_FIELDS = ['stock_id', 'timestamp', 'interval']
+# 隔离表中重复隔离的K线更新为最新的数据和原因
+QUARANTINE_FIELDS = VALUE_FIELDS + ['reasons', 'created_at']
+
+
+def _build_rows(stock_id, interval, df):
+    """把标准化后的K线转换为插入用的字典列表"""
+    now = datetime.utcnow()
+    frame = df[COLUMNS].rename(columns=FIELD_MAP)
+    frame['volume'] = frame['volume'].round().astype('Int64')
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame['timestamp'] = df.index.to_pydatetime()
+    frame['stock_id'] = stock_id
+    frame['interval'] = interval
+    frame['created_at'] = now
+    return frame.to_dict('records')
+
+
+def _upsert_statement(dialect, table=PriceData.__table__, fields=VALUE_FIELDS):
+    """按数据库方言构造upsert语句，按 KEY_FIELDS 判断重复，更新 fields"""
+    if dialect == 'mysql':
+        stmt = mysql.insert(table)
+        return stmt.on_duplicate_key_update({f: stmt.inserted[f] for f in fields})
+    if dialect in ('postgresql', 'sqlite'):
+        insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        stmt = insert(table)
+        return stmt.on_conflict_do_update(
+            index_elements=KEY_FIELDS,
+            set_={f: stmt.excluded[f] for f in fields}
+        )
+    raise ValueError(f'不支持的数据库类型: {dialect}')
+
+
+def _copy_upsert(rows):
+    """PostgreSQL大批量写入：COPY到临时表后合并到price_data"""
+    columns = KEY_FIELDS + VALUE_FIELDS + ['created_at']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['' if row[c] is None else row[c] for c in columns])
+    buffer.seek(0)
+
+    updates = ', '.join(f'{f} = EXCLUDED.{f}' for f in VALUE_FIELDS)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS price_data_load ('
+            'stock_id integer, timestamp timestamp, interval varchar(8), '
+            'open_price double precision, high_price double precision, '
+            'low_price double precision, close_price double precision, '
+            'volume bigint, created_at timestamp) ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            f"COPY price_data_load ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+        cursor.execute(
+            f"INSERT INTO price_data ({', '.join(columns)}) "
+            f"SELECT {', '.join(columns)} FROM price_data_load "
+            f"ON CONFLICT (stock_id, timestamp, interval) DO UPDATE SET {updates}"
+        )
+        cursor.execute('TRUNCATE price_data_load')
+    finally:
+        cursor.close()
+
+
+def upsert_price_data(stock_id, interval, df, batch_size=None):
+    """把K线DataFrame批量upsert到price_data，不提交事务
+
+    df 以时间为索引，包含 Open/High/Low/Close/Volume 列（大小写不限）。
+    返回写入统计：行数、批次数、耗时和每秒行数。
+    """
+    started = time.perf_counter()
+    frame = normalize_frame(df)
+    rows = _build_rows(stock_id, interval, frame) if not frame.empty else []
+
+    batch_size = batch_size or current_app.config['PRICE_DATA_BATCH_SIZE']
+    dialect = db.engine.dialect.name
+    batches = 0
+    if rows:
+        # PostgreSQL 分区表上先创建K线所在月份的分区，避免数据落入默认分区
+        ensure_partitions_for(frame.index)
+
+    if rows and dialect == 'postgresql' and len(rows) >= current_app.config['PRICE_DATA_COPY_THRESHOLD']:
+        _copy_upsert(rows)
+        batches = 1
+    elif rows:
+        stmt = _upsert_statement(dialect)
+        for i in range(0, len(rows), batch_size):
+            db.session.execute(stmt, rows[i:i + batch_size])
+            batches += 1
+
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': len(rows),
+        'batches': batches,
+        'seconds': round(elapsed, 4),
+        'rows_per_sec': round(len(rows) / elapsed, 1) if elapsed > 0 else 0.0
+    }
+
+
+def quarantine_bars(stock_id, interval, rejected):
+    """把未通过校验的K线写入隔离表，不提交事务，返回写入的行数
+
+    已经隔离过的K线（如回补时再次获取到）更新原有记录，不重复写入。
+    """
+    if rejected.empty:
+        return 0
+    # 同一批中重复的时间戳只保留最后一根，upsert 不能在一条语句中更新同一行两次
+    rejected = rejected[~rejected.index.duplicated(keep='last')]
+    now = datetime.utcnow()
+    frame = rejected[COLUMNS].rename(columns=FIELD_MAP)
+    frame = frame.astype(object).where(frame.notna(), None)
+    frame['reasons'] = rejected['reasons']
+    frame['timestamp'] = rejected.index.to_pydatetime()
+    frame['stock_id'] = stock_id
+    frame['interval'] = interval
+    frame['created_at'] = now
+    db.session.execute(_upsert_statement(db.engine.dialect.name, QuarantinedBar.__table__, QUARANTINE_FIELDS),
+                       frame.to_dict('records'))
+    return len(frame)
+
+
+def ingest_bars(symbol, interval, df, batch_size=None):
+    """写入一只股票的K线：校验后upsert到price_data并提交，然后同步到列式存储和环形缓冲区
+
+    不合格的K线写入隔离表。股票不存在时抛出 ValueError，
+    返回 upsert_price_data 的统计信息，quality 为校验报告。
+    """
+    stock = StockData.query.filter_by(symbol=symbol).first()
+    if not stock:
+        raise ValueError(f'股票 {symbol} 不存在于数据库中')
+
+    # 已保存的之前若干根K线用于计算开头几根K线的异常跳变
+    store = get_bar_store()
+    context = None
+    if not df.empty and store.info(symbol, interval):
+        first = to_utc_naive(pd.DatetimeIndex(df.index).min())
+        context = store.read(symbol, interval, end=first, limit=current_app.config['DATA_QUALITY_SPIKE_WINDOW'] + 1)
+        context = context[context.index < first]
+    bars, rejected, report = validate_bars(df, interval, context)
+
+    stats = upsert_price_data(stock.id, interval, bars, batch_size=batch_size)
+    quarantine_bars(stock.id, interval, rejected)
+    db.session.commit()
+    stats['quality'] = report
+
+    if stats['rows']:
+        store.write(symbol, interval, bars)
+        get_ring_buffers().update(symbol, interval, bars)
+        if interval == storage_interval('1d'):
+            get_universe().mark_dirty(symbol)
+    if report['rejected']:
+        reasons = ', '.join(f'{name} {count}' for name, count in report['reasons'].items())
+        logger.warning(f"隔离不合格的K线: {symbol} {interval}, {report['rejected']} 行（{reasons}）")
+    logger.info(
+        f"写入K线: {symbol} {interval}, {stats['rows']} 行, "
+        f"{stats['batches']} 批, {stats['rows_per_sec']} 行/秒"
+    )
+    return stats
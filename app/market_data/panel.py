@@ -0,0 +1,57 @@
+"""多只股票对齐的K线面板
+
+把多只股票的K线按全部K线时间的并集对齐，拼成一个DataFrame，列为 (字段, symbol) 两级索引，
+指标引擎在一次向量化计算中处理全部股票。
+
+某只股票在某个时间没有K线（停牌、不同市场的休市日）时面板中该位置为NaN，同时返回每只股票
+实际有K线的位置，取结果时过滤掉补出的行。跨过缺口的计算按缺失值处理（如包含缺口的移动平均为空），
+K线时间与面板相同的股票与逐只计算的结果完全一致。
+"""
+import logging
+
+import pandas as pd
+
+from app.market_data.bar_store import COLUMNS, load_bars, normalize_frame, period_start
+from app.market_data.upstream import fetch_history_batch
+
+logger = logging.getLogger(__name__)
+
+
+def load_panel(symbols, interval='1d', period='1y'):
+    """加载多只股票的K线，按K线时间的并集拼成一个面板
+
+    优先读取本地列式存储，本地没有数据的股票合并为批量请求从数据源获取。
+    返回 (panel, present, errors)：present 为与面板索引相同、每只股票一列的布尔DataFrame，
+    表示该股票在该时间是否有K线；没有数据或获取失败的股票不在面板中，错误信息记录在errors里，
+    全部股票都没有数据时 panel 和 present 为 None。
+    """
+    symbols = list(dict.fromkeys(s.upper() for s in symbols))
+    frames, errors = {}, {}
+    for symbol in symbols:
+        try:
+            frames[symbol] = load_bars(symbol, interval, start=period_start(period))
+        except Exception as e:
+            logger.error(f"读取股票 {symbol} 的本地K线时出错: {str(e)}")
+            frames[symbol] = None
+
+    missing = [symbol for symbol, df in frames.items() if df is None or df.empty]
+    if missing:
+        fetched, errors = fetch_history_batch(missing, period=period, interval=interval)
+        for symbol in missing:
+            frames[symbol] = normalize_frame(fetched.get(symbol))
+
+    loaded = {}
+    for symbol, df in frames.items():
+        if symbol in errors:
+            continue
+        if df.empty:
+            errors[symbol] = '没有找到数据'
+            continue
+        loaded[symbol] = df[COLUMNS]
+    if not loaded:
+        return None, None, errors
+
+    # 按K线时间的并集对齐，缺少的K线为NaN
+    panel = pd.concat(loaded, axis=1).sort_index().swaplevel(axis=1).sort_index(axis=1)
+    present = pd.DataFrame({symbol: panel.index.isin(df.index) for symbol, df in loaded.items()}, index=panel.index)
+    return panel, present, errors
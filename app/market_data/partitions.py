@@ -0,0 +1,109 @@
+"""price_data 月分区维护
+
+PostgreSQL 上 price_data 是按 timestamp 月度范围分区的表（见迁移脚本
+partition_price_data_by_month）。写入没有对应分区的月份时数据会落入默认分区，
+而默认分区中有某月数据后就无法再为该月创建分区，所以写入前为K线所在的月份创建缺少的分区，
+也可以用 flask market_data create-partitions 或定时任务提前创建未来几个月的分区。
+"""
+import logging
+from datetime import datetime
+
+import click
+import pandas as pd
+from flask import current_app
+from sqlalchemy import text
+
+from app import db
+from app.market_data import market_data_bp
+
+logger = logging.getLogger(__name__)
+
+
+def partition_name(month):
+    """返回某月分区的表名，如 price_data_y2024m01"""
+    return f'price_data_y{month:%Y}m{month:%m}'
+
+
+def is_partitioned():
+    """price_data 是否为分区表"""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    return bool(db.session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('price_data'))"
+    )).scalar())
+
+
+def _known_partitions():
+    """本进程已确认存在或已尝试创建的分区名，写入时不必每次查询系统表"""
+    return current_app.extensions.setdefault('price_data_partitions', set())
+
+
+def _create_partitions(months):
+    """在当前事务中创建 months（pd.Period 列表）中缺少的分区，不提交事务，返回新建的分区名
+
+    每个分区在单独的保存点中创建，失败时只回滚该分区。
+    """
+    existing = set(db.session.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = to_regclass('price_data')"
+    )).scalars())
+    known = _known_partitions()
+    known.update(existing)
+
+    created = []
+    for month in months:
+        name = partition_name(month.start_time)
+        if name in existing:
+            continue
+        following = (month + 1).start_time
+        try:
+            with db.session.begin_nested():
+                db.session.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF price_data "
+                    f"FOR VALUES FROM ('{month.start_time:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+                ))
+            known.add(name)
+            created.append(name)
+            logger.info(f"创建price_data分区: {name}")
+        except Exception as e:
+            # 默认分区中已有该月数据时无法创建，需要手工把数据迁出默认分区，写入时不再重试
+            known.add(name)
+            logger.error(f"创建price_data分区 {name} 失败: {str(e)}")
+    return created
+
+
+def ensure_price_data_partitions(months_ahead=None):
+    """创建从本月起未来 months_ahead 个月中缺少的分区并提交，返回新建的分区名"""
+    if not is_partitioned():
+        return []
+    if months_ahead is None:
+        months_ahead = current_app.config['PRICE_DATA_PARTITION_MONTHS_AHEAD']
+    created = _create_partitions(pd.period_range(datetime.utcnow(), periods=months_ahead + 1, freq='M'))
+    db.session.commit()
+    return created
+
+
+def ensure_partitions_for(timestamps):
+    """写入K线前为其所在的月份创建缺少的分区，与写入在同一事务中，不提交事务
+
+    在同一事务中创建，避免另开连接等待本事务持有的 price_data 锁。
+    返回新建的分区名。
+    """
+    if db.engine.dialect.name != 'postgresql' or not len(timestamps):
+        return []
+    months = pd.DatetimeIndex(timestamps).to_period('M').unique().sort_values()
+    known = _known_partitions()
+    if all(partition_name(month.start_time) in known for month in months):
+        return []
+    if not is_partitioned():
+        return []
+    return _create_partitions(months)
+
+
+@market_data_bp.cli.command('create-partitions')
+@click.option('--months-ahead', type=int, help='从本月起提前创建的月数，默认为 PRICE_DATA_PARTITION_MONTHS_AHEAD')
+def create_partitions_command(months_ahead):
+    """创建price_data未来几个月的分区（仅PostgreSQL）"""
+    created = ensure_price_data_partitions(months_ahead)
+    click.echo(f"已创建price_data分区: {', '.join(created)}" if created else '没有需要创建的price_data分区')
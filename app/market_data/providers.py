@@ -0,0 +1,195 @@
+"""行情数据源
+
+所有上游行情请求都通过 MarketDataProvider 接口发出，具体使用哪个数据源由
+data_sources 表中启用的记录（或 MARKET_DATA_PROVIDER 配置）决定。
+新增数据源时实现该接口并调用 register_provider 注册即可。
+"""
+import os
+import threading
+
+import pandas as pd
+import yfinance as yf
+from flask import current_app
+
+from app.market_data.bar_store import period_start, to_utc_naive
+from app.models.market_data import DataSource
+
+HISTORY_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+class MarketDataProvider:
+    """行情数据源接口"""
+
+    # 单次history调用最多支持的股票数量，1表示不支持批量请求
+    max_batch_size = 1
+
+    def __init__(self, api_key=None, **options):
+        self.api_key = api_key
+        self.options = options
+
+    def history(self, symbols, period=None, interval='1d', start=None, end=None):
+        """获取历史K线，返回 {symbol: DataFrame}，没有数据的股票对应空DataFrame"""
+        raise NotImplementedError
+
+    def quote(self, symbols):
+        """获取最新报价，返回 {symbol: {'price': 最新价, 'timestamp': 时间}}"""
+        frames = self.history(symbols, period='1d')
+        quotes = {}
+        for symbol, df in frames.items():
+            if not df.empty:
+                quotes[symbol] = {
+                    'price': float(df['Close'].iloc[-1]),
+                    'timestamp': df.index[-1].to_pydatetime()
+                }
+        return quotes
+
+    def info(self, symbol):
+        """获取股票基本信息，字段与yfinance的info保持一致"""
+        return {}
+
+
+class YahooFinanceProvider(MarketDataProvider):
+    """Yahoo Finance 数据源"""
+
+    max_batch_size = 50
+
+    def history(self, symbols, period=None, interval='1d', start=None, end=None):
+        if not start and not period:
+            period = '1mo'
+        if len(symbols) == 1:
+            symbol = symbols[0]
+            df = yf.Ticker(symbol).history(period=period, interval=interval, start=start, end=end)
+            return {symbol: df}
+
+        data = yf.download(
+            symbols,
+            period=period,
+            interval=interval,
+            start=start,
+            end=end,
+            group_by='ticker',
+            auto_adjust=True,
+            progress=False,
+            threads=True
+        )
+        frames = {}
+        for symbol in symbols:
+            if data.empty or symbol not in data.columns.get_level_values(0):
+                frames[symbol] = pd.DataFrame(columns=HISTORY_COLUMNS)
+            else:
+                frames[symbol] = data[symbol].dropna(how='all')
+        return frames
+
+    def info(self, symbol):
+        return yf.Ticker(symbol).info
+
+
+class ReplayProvider(MarketDataProvider):
+    """本地文件回放数据源，用于离线压测和基准测试
+
+    数据文件放在 <path>/<interval>/<SYMBOL>.csv 或 .parquet，
+    第一列（或 Date/Datetime/timestamp 列）为时间。period 以文件中最后一根K线为基准截取，
+    可选的 <path>/symbols.csv 提供 symbol,name,exchange,industry,sector 等基本信息。
+    """
+
+    max_batch_size = 500
+
+    def __init__(self, api_key=None, path=None, **options):
+        super().__init__(api_key, **options)
+        self.path = path or current_app.config['REPLAY_DATA_PATH']
+        self._frames = {}
+        self._info = None
+        self._lock = threading.Lock()
+
+    def _load(self, symbol, interval):
+        key = (symbol.upper(), interval)
+        with self._lock:
+            if key in self._frames:
+                return self._frames[key]
+
+        base = os.path.join(self.path, interval, symbol.upper())
+        if os.path.exists(base + '.parquet'):
+            df = pd.read_parquet(base + '.parquet')
+        elif os.path.exists(base + '.csv'):
+            df = pd.read_csv(base + '.csv')
+        else:
+            df = None
+
+        if df is not None:
+            time_column = next((c for c in ('Date', 'Datetime', 'timestamp') if c in df.columns), None)
+            if time_column:
+                df = df.set_index(time_column)
+            df.index = pd.to_datetime(df.index, utc=True)
+            df = df.rename(columns={c: c.capitalize() for c in df.columns}).sort_index()
+        else:
+            df = pd.DataFrame(columns=HISTORY_COLUMNS)
+
+        with self._lock:
+            self._frames[key] = df
+        return df
+
+    def history(self, symbols, period=None, interval='1d', start=None, end=None):
+        frames = {}
+        for symbol in symbols:
+            df = self._load(symbol, interval)
+            if not df.empty:
+                if start is not None:
+                    df = df[df.index >= to_utc_naive(start).tz_localize('UTC')]
+                if end is not None:
+                    df = df[df.index < to_utc_naive(end).tz_localize('UTC')]
+                if start is None and period and period != 'max':
+                    since = period_start(period, now=df.index[-1])
+                    if since is not None:
+                        df = df[df.index >= since.tz_localize('UTC')]
+            frames[symbol] = df
+        return frames
+
+    def info(self, symbol):
+        if self._info is None:
+            path = os.path.join(self.path, 'symbols.csv')
+            if os.path.exists(path):
+                info = pd.read_csv(path).rename(columns={'name': 'shortName'})
+                self._info = {row['symbol'].upper(): row.dropna().to_dict() for _, row in info.iterrows()}
+            else:
+                self._info = {}
+        return self._info.get(symbol.upper(), {'shortName': symbol})
+
+
+PROVIDERS = {
+    'yahoo': YahooFinanceProvider,
+    'replay': ReplayProvider,
+}
+
+
+def register_provider(name, provider_class):
+    """注册新的数据源实现"""
+    PROVIDERS[name] = provider_class
+
+
+def get_provider(app=None):
+    """获取当前使用的行情数据源
+
+    MARKET_DATA_PROVIDER 配置优先；否则使用 data_sources 表中第一个启用且指定了
+    provider 的记录；都没有时使用 Yahoo Finance。结果在应用内缓存，修改配置后需重启生效。
+    """
+    app = app or current_app
+    provider = app.extensions.get('market_data_provider')
+    if provider is not None:
+        return provider
+
+    name = app.config.get('MARKET_DATA_PROVIDER')
+    api_key, options = None, {}
+    if not name:
+        source = DataSource.query.filter(
+            DataSource.is_active.is_(True),
+            DataSource.provider.isnot(None)
+        ).order_by(DataSource.id).first()
+        if source:
+            name, api_key, options = source.provider, source.api_key, source.parameters or {}
+    name = name or 'yahoo'
+
+    if name not in PROVIDERS:
+        raise ValueError(f'未知的行情数据源: {name}')
+    provider = PROVIDERS[name](api_key=api_key, **options)
+    app.extensions['market_data_provider'] = provider
+    return provider
@@ -0,0 +1,231 @@
+"""实时报价推送
+
+客户端通过 SSE 订阅一组股票，进程内只有一个轮询线程：每个周期把所有被订阅的
+不同股票合并成批量请求向数据源获取一次报价，价格变化时推送给订阅了该股票的全部客户端，
+并批量更新 stock_data 的 last_price。上游请求量只与订阅的股票数量有关，与连接数无关。
+
+每个订阅者有一个有界队列，客户端读取太慢、队列满时丢弃最旧的消息并计数，
+慢客户端不会阻塞轮询线程，也不会让内存无限增长。
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam
+
+from app import db
+from app.models.market_data import StockData
+from app.market_data.upstream import fetch_quote_batch
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """一个报价订阅（一条SSE连接）"""
+
+    def __init__(self, symbols, queue_size, owner=None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.symbols = set(symbols)
+        self.queue = deque(maxlen=queue_size)
+        self.dropped = 0
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, message):
+        """放入一条消息，队列满时丢弃最旧的消息"""
+        with self.condition:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(message)
+            self.condition.notify()
+
+    def get(self, timeout):
+        """取出全部待发送的消息，没有消息时最多等待timeout秒"""
+        with self.condition:
+            if not self.queue and not self.closed:
+                self.condition.wait(timeout)
+            messages = list(self.queue)
+            self.queue.clear()
+        return messages
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class QuoteHub:
+    """管理订阅者并为被订阅的股票轮询报价"""
+
+    def __init__(self, app, poll_interval, queue_size):
+        self.app = app
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers = {}  # 订阅ID -> Subscriber
+        self._symbols = {}  # symbol -> 订阅了该股票的订阅ID集合
+        self._quotes = {}  # symbol -> 最近一次报价
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self.polls = 0
+        self.errors = 0
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='quote-poller', daemon=True)
+            self._thread.start()
+
+    def _attach(self, subscriber, symbols):
+        """在持有锁时把订阅者加入symbols的订阅列表，返回这些股票已有的报价"""
+        snapshot = []
+        for symbol in symbols:
+            self._symbols.setdefault(symbol, set()).add(subscriber.id)
+            if symbol in self._quotes:
+                snapshot.append(self._quotes[symbol])
+        subscriber.symbols.update(symbols)
+        return snapshot
+
+    def _detach(self, subscriber, symbols):
+        for symbol in symbols:
+            ids = self._symbols.get(symbol)
+            if ids is None:
+                continue
+            ids.discard(subscriber.id)
+            if not ids:
+                # 没有订阅者的股票不再轮询
+                del self._symbols[symbol]
+                self._quotes.pop(symbol, None)
+        subscriber.symbols.difference_update(symbols)
+
+    def subscribe(self, symbols, owner=None):
+        """新建订阅，已有的最新报价立即放入队列"""
+        symbols = [s.upper() for s in symbols]
+        subscriber = Subscriber([], self.queue_size, owner)
+        with self._lock:
+            self._subscribers[subscriber.id] = subscriber
+            snapshot = self._attach(subscriber, symbols)
+        for quote in snapshot:
+            subscriber.put(quote)
+        self._ensure_thread()
+        self._wakeup.set()
+        return subscriber
+
+    def get(self, subscriber_id):
+        return self._subscribers.get(subscriber_id)
+
+    def update(self, subscriber_id, add=(), remove=()):
+        """增减订阅的股票，订阅不存在时返回None"""
+        with self._lock:
+            subscriber = self._subscribers.get(subscriber_id)
+            if subscriber is None:
+                return None
+            self._detach(subscriber, [s.upper() for s in remove])
+            snapshot = self._attach(subscriber, [s.upper() for s in add])
+        for quote in snapshot:
+            subscriber.put(quote)
+        self._wakeup.set()
+        return subscriber
+
+    def unsubscribe(self, subscriber_id):
+        """取消订阅并结束对应的推送"""
+        with self._lock:
+            subscriber = self._subscribers.pop(subscriber_id, None)
+            if subscriber is None:
+                return False
+            self._detach(subscriber, list(subscriber.symbols))
+        subscriber.close()
+        return True
+
+    def _run(self):
+        while True:
+            if not self._symbols:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            started = time.monotonic()
+            try:
+                with self.app.app_context():
+                    self.poll()
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"轮询报价失败: {str(e)}")
+            self._wakeup.wait(max(0, self.poll_interval - (time.monotonic() - started)))
+            self._wakeup.clear()
+
+    def poll(self):
+        """获取所有被订阅股票的报价，推送有变化的报价，返回推送的报价数量"""
+        symbols = list(self._symbols)
+        if not symbols:
+            return 0
+        quotes, errors = fetch_quote_batch(symbols)
+        self.polls += 1
+        if errors:
+            self.errors += len(errors)
+            logger.warning(f"获取 {len(errors)} 只股票的报价失败: {', '.join(sorted(errors))}")
+
+        changed = []
+        with self._lock:
+            for symbol, quote in quotes.items():
+                symbol = symbol.upper()
+                if symbol not in self._symbols:
+                    continue
+                message = {
+                    'symbol': symbol,
+                    'price': quote['price'],
+                    'timestamp': quote['timestamp'].isoformat()
+                }
+                if self._quotes.get(symbol) == message:
+                    continue
+                self._quotes[symbol] = message
+                subscribers = [self._subscribers[i] for i in self._symbols[symbol] if i in self._subscribers]
+                changed.append((message, subscribers))
+
+        for message, subscribers in changed:
+            for subscriber in subscribers:
+                subscriber.put(message)
+        if changed:
+            save_last_prices([message for message, _ in changed])
+        return len(changed)
+
+    def stats(self):
+        """返回订阅和轮询的统计信息"""
+        with self._lock:
+            return {
+                'subscribers': len(self._subscribers),
+                'symbols': {symbol: len(ids) for symbol, ids in sorted(self._symbols.items())},
+                'dropped': sum(s.dropped for s in self._subscribers.values()),
+                'poll_interval': self.poll_interval,
+                'polls': self.polls,
+                'errors': self.errors
+            }
+
+
+def save_last_prices(quotes):
+    """批量更新股票的最新价格"""
+    table = StockData.__table__
+    now = datetime.utcnow()
+    try:
+        db.session.execute(
+            table.update().where(table.c.symbol == bindparam('b_symbol')).values(
+                last_price=bindparam('b_price'), last_update=bindparam('b_update')),
+            [{'b_symbol': q['symbol'], 'b_price': q['price'], 'b_update': now} for q in quotes]
+        )
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"更新最新价格失败: {str(e)}")
+
+
+def get_quote_hub(app=None):
+    """获取当前应用的报价推送中心"""
+    app = app or current_app._get_current_object()
+    hub = app.extensions.get('quote_hub')
+    if hub is None:
+        hub = QuoteHub(app, app.config['QUOTE_POLL_INTERVAL'], app.config['QUOTE_QUEUE_SIZE'])
+        app.extensions['quote_hub'] = hub
+    return hub
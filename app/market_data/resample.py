@@ -0,0 +1,154 @@
+"""K线重采样
+
+只存储最细粒度的基础周期（MARKET_DATA_BASE_INTERVALS，默认 5m 和 1d），
+更粗的周期读取时由基础周期聚合得到，不再单独请求和存储。
+
+聚合按交易所时区的交易时段对齐：日内K线从开盘时间起按周期切分（如 1h 为
+09:30、10:30 ...），周线以周一、月线以月初、季线以季初为起点，与数据源的K线一致。
+聚合结果按 (symbol, interval) 缓存，基础周期的存储版本变化时重新计算。
+"""
+import pandas as pd
+from flask import current_app
+
+from app.market_data.bar_store import COLUMNS, empty_frame, get_bar_store, sync_bar_store, to_utc_naive
+from app.market_data.cache import TTLCache
+
+# 可以由更细周期聚合得到的周期 -> 按优先级排列的来源周期
+RESAMPLE_SOURCES = {
+    '2m': ['1m'],
+    '5m': ['1m'],
+    '15m': ['5m', '1m'],
+    '30m': ['15m', '5m', '1m'],
+    '60m': ['30m', '15m', '5m', '1m'],
+    '90m': ['30m', '15m', '5m', '1m'],
+    '1h': ['30m', '15m', '5m', '1m'],
+    '1wk': ['1d'],
+    '1mo': ['1d'],
+    '3mo': ['1mo', '1d'],
+}
+
+# 日内周期的长度
+INTRADAY_LENGTHS = {
+    '1m': pd.Timedelta(minutes=1),
+    '2m': pd.Timedelta(minutes=2),
+    '5m': pd.Timedelta(minutes=5),
+    '15m': pd.Timedelta(minutes=15),
+    '30m': pd.Timedelta(minutes=30),
+    '60m': pd.Timedelta(hours=1),
+    '90m': pd.Timedelta(minutes=90),
+    '1h': pd.Timedelta(hours=1),
+}
+
+AGGREGATIONS = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum',
+}
+
+# 聚合结果缓存的有效期（秒），基础数据变化由版本号判断，这里只用于清理冷数据
+RESAMPLE_CACHE_TTL = 86400
+
+
+def base_intervals(app=None):
+    """返回配置的基础周期"""
+    app = app or current_app
+    return [i.strip() for i in app.config['MARKET_DATA_BASE_INTERVALS'].split(',') if i.strip()]
+
+
+def source_interval(interval):
+    """返回用于聚合interval的基础周期，interval本身是基础周期或无法聚合时返回None"""
+    bases = base_intervals()
+    if interval in bases:
+        return None
+    for candidate in RESAMPLE_SOURCES.get(interval, []):
+        if candidate in bases:
+            return candidate
+    return None
+
+
+def storage_interval(interval):
+    """返回interval实际写入存储的周期"""
+    return source_interval(interval) or interval
+
+
+def _buckets(index, interval):
+    """计算每根K线所属的聚合时段起点（UTC），全部为向量化运算"""
+    config = current_app.config
+    local = index.tz_localize('UTC').tz_convert(config['MARKET_SESSION_TIMEZONE']).tz_localize(None)
+
+    if interval in INTRADAY_LENGTHS:
+        length = INTRADAY_LENGTHS[interval]
+        session_open = local.normalize() + pd.Timedelta(config['MARKET_SESSION_OPEN'] + ':00')
+        bucket = session_open + ((local - session_open) // length) * length
+    else:
+        # 日线的时间可能是交易所时区零点，也可能是UTC零点，取最近的交易所零点作为交易日
+        day = (local + pd.Timedelta(hours=12)).normalize()
+        if interval == '1wk':
+            bucket = day - pd.to_timedelta(day.dayofweek, unit='D')
+        elif interval == '1mo':
+            bucket = day.to_period('M').to_timestamp()
+        elif interval == '3mo':
+            bucket = day.to_period('Q').to_timestamp()
+        else:
+            raise ValueError(f'不支持聚合的K线周期: {interval}')
+
+    bucket = pd.DatetimeIndex(bucket).tz_localize(
+        config['MARKET_SESSION_TIMEZONE'], ambiguous='NaT', nonexistent='shift_forward')
+    return bucket.tz_convert('UTC').tz_localize(None)
+
+
+def resample_bars(df, interval):
+    """把细粒度K线聚合为interval周期，df为以UTC时间为索引的OHLCV"""
+    if df.empty:
+        return empty_frame()
+    bars = df[COLUMNS].dropna(subset=['Close'])
+    buckets = _buckets(bars.index, interval)
+    result = bars.groupby(buckets.rename('timestamp'), sort=True).agg(AGGREGATIONS)
+    return result[result.index.notna()]
+
+
+def get_resample_cache(app=None):
+    """获取当前应用的聚合K线缓存"""
+    app = app or current_app
+    cache = app.extensions.get('resample_cache')
+    if cache is None:
+        cache = TTLCache(maxsize=app.config['RESAMPLE_CACHE_SIZE'])
+        app.extensions['resample_cache'] = cache
+    return cache
+
+
+def load_resampled(symbol, interval, start=None, end=None, limit=None):
+    """读取由基础周期聚合得到的K线，基础周期没有数据时返回None
+
+    返回的DataFrame是缓存中完整聚合结果的切片，调用方不应原地修改。
+    """
+    source = source_interval(interval)
+    if source is None:
+        return None
+    store = get_bar_store()
+    info = store.info(symbol, source)
+    if info is None:
+        sync_bar_store(symbol, source)
+        info = store.info(symbol, source)
+    if not info or not info['rows']:
+        return None
+
+    cache = get_resample_cache()
+    key = (symbol.upper(), interval)
+    hit, cached = cache.get(key)
+    if hit and cached[0] == (source, info['version']):
+        bars = cached[1]
+    else:
+        bars = resample_bars(store.read(symbol, source), interval)
+        cache.set(key, ((source, info['version']), bars), RESAMPLE_CACHE_TTL)
+
+    lo, hi = 0, len(bars)
+    if start is not None:
+        lo = bars.index.searchsorted(to_utc_naive(start), side='left')
+    if end is not None:
+        hi = bars.index.searchsorted(to_utc_naive(end), side='right')
+    if limit is not None:
+        lo = max(lo, hi - int(limit))
+    return bars.iloc[lo:hi]
@@ -0,0 +1,203 @@
+"""最近K线的环形缓冲区
+
+进程内按 (symbol, interval) 保存最近 RING_BUFFER_SIZE 根K线，供实盘任务每分钟读取，
+不再每次都查询数据库或存储。写入K线时同步更新，首次读取时从存储加载，预热只是提前加载。
+每个缓冲区记录加载时列式存储的版本号，读取时版本号变化（其他进程写入或修正了K线）则加载到
+新的缓冲区并替换旧的，已经交出的视图仍指向旧缓冲区，数据不会被改写。
+
+每根K线在长度为 2R 的数组中写两份（位置 p 和 p + R），任意最近 n 根K线
+总是一段连续的切片，读取时直接返回这段数组上的只读DataFrame视图，不复制数据。
+缓冲区比可读取的根数多留一些余量，新K线追加时不会覆盖已经交出的视图。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+from flask import current_app
+
+from app.market_data.bar_store import COLUMNS, empty_frame, get_bar_store, load_bars, normalize_frame
+from app.market_data.resample import source_interval
+
+
+class BarRing:
+    """单个 (symbol, interval) 的K线环形缓冲区"""
+
+    def __init__(self, capacity, slack=None):
+        self.capacity = capacity
+        self.size = capacity + (slack if slack is not None else max(16, capacity // 4))
+        self.timestamps = np.zeros(2 * self.size, dtype='int64')
+        self.values = np.full((len(COLUMNS), 2 * self.size), np.nan)
+        self.count = 0  # 写入过的K线总数
+        self.version = None  # 与缓冲区内容对应的存储版本号
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    @property
+    def last_timestamp(self):
+        if not self.count:
+            return None
+        return int(self.timestamps[(self.count - 1) % self.size])
+
+    def _write(self, positions, timestamps, values):
+        """按逻辑序号写入K线，每根写两份"""
+        slots = positions % self.size
+        for offset in (0, self.size):
+            self.timestamps[slots + offset] = timestamps
+            self.values[:, slots + offset] = values
+
+    def _window(self, n):
+        """最近n根K线在数组中的起止位置"""
+        start = (self.count - n) % self.size
+        return start, start + n
+
+    def extend(self, df):
+        """写入K线，df为标准格式的K线
+
+        新K线追加在末尾，已有时间戳的K线（如未收盘K线的更新）原地覆盖。
+        包含缓冲区中没有的更早K线时返回False，调用方需要重新预热。
+        """
+        if df.empty:
+            return True
+        timestamps = df.index.asi8
+        values = df[COLUMNS].to_numpy(dtype='float64').T
+
+        with self.lock:
+            last = self.last_timestamp
+            if last is not None and timestamps[0] <= last:
+                revised = timestamps <= last
+                start, end = self._window(len(self))
+                existing = self.timestamps[start:end]
+                positions = np.searchsorted(existing, timestamps[revised])
+                found = positions < len(existing)
+                if not found.all() or (existing[positions] != timestamps[revised]).any():
+                    return False
+                self._write(self.count - len(self) + positions, timestamps[revised], values[:, revised])
+                timestamps, values = timestamps[~revised], values[:, ~revised]
+
+            # 一次写入超过缓冲区长度时只保留最后 size 根
+            timestamps, values = timestamps[-self.size:], values[:, -self.size:]
+            positions = self.count + np.arange(len(timestamps))
+            self._write(positions, timestamps, values)
+            self.count += len(timestamps)
+        return True
+
+    def view(self, limit=None, columns=None):
+        """返回最近limit根K线的只读DataFrame视图，最多 capacity 根
+
+        columns 可以替换列名（如策略使用的小写列名），不影响数据。
+        """
+        with self.lock:
+            n = min(len(self), self.capacity, limit if limit is not None else self.capacity)
+            if not n:
+                return empty_frame().set_axis(columns or COLUMNS, axis=1)
+            start, end = self._window(n)
+            timestamps = self.timestamps[start:end].view()
+            values = self.values[:, start:end].view()
+        timestamps.flags.writeable = False
+        values.flags.writeable = False
+        index = pd.DatetimeIndex(timestamps.view('datetime64[ns]'), name='timestamp')
+        return pd.DataFrame(values.T, index=index, columns=columns or COLUMNS, copy=False)
+
+
+class RingBuffers:
+    """进程内全部K线环形缓冲区"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._rings = {}
+        self._lock = threading.Lock()
+
+    def _version(self, symbol, interval):
+        """K线在存储中的版本号，聚合得到的周期使用基础周期的版本号"""
+        info = get_bar_store().info(symbol, source_interval(interval) or interval)
+        return info['version'] if info else None
+
+    def _load(self, symbol, interval):
+        """从存储加载到新的缓冲区并替换原有的缓冲区，应在持有 self._lock 时调用"""
+        # 先取版本号再读取，读取期间有新的写入时下次读取会再加载一次
+        version = self._version(symbol, interval)
+        ring = BarRing(self.capacity)
+        ring.extend(load_bars(symbol, interval, limit=ring.size))
+        ring.version = version
+        self._rings[(symbol.upper(), interval)] = ring
+        return ring
+
+    def _stale(self, ring, symbol, interval):
+        return ring is None or not len(ring) or ring.version != self._version(symbol, interval)
+
+    def get(self, symbol, interval, limit=None, columns=None):
+        """读取最近的K线视图，缓冲区不存在、为空或存储版本号变化时先从存储加载"""
+        key = (symbol.upper(), interval)
+        ring = self._rings.get(key)
+        if self._stale(ring, symbol, interval):
+            with self._lock:
+                # 其他线程可能已经加载过
+                ring = self._rings.get(key)
+                if self._stale(ring, symbol, interval):
+                    ring = self._load(symbol, interval)
+        return ring.view(limit, columns)
+
+    def warm(self, pairs):
+        """预热一组 (symbol, interval)"""
+        for symbol, interval in pairs:
+            self.get(symbol, interval, limit=0)
+
+    def update(self, symbol, interval, df):
+        """写入新K线，只更新已经存在的缓冲区，应在K线写入存储之后调用
+
+        由该周期聚合得到的周期（如 5m 写入后的 1h）从存储重新读取尾部。
+        """
+        symbol = symbol.upper()
+        info = get_bar_store().info(symbol, interval)
+        version = info['version'] if info else None
+        for (ring_symbol, ring_interval), ring in list(self._rings.items()):
+            if ring_symbol != symbol:
+                continue
+            if ring_interval == interval:
+                bars = normalize_frame(df)
+            elif source_interval(ring_interval) == interval:
+                last = ring.last_timestamp
+                start = pd.Timestamp(last) if last is not None else None
+                bars = load_bars(symbol, ring_interval, start=start)
+            else:
+                continue
+            if not ring.extend(bars):
+                with self._lock:
+                    self._load(symbol, ring_interval)
+            elif version is not None and ring.version == version - 1:
+                # 上次加载之后只有这一次写入，缓冲区已经是最新的；否则下次读取时重新加载
+                ring.version = version
+
+    def discard(self, symbol=None):
+        """删除缓冲区，symbol为空时全部删除，返回删除的数量"""
+        with self._lock:
+            keys = [key for key in self._rings if symbol is None or key[0] == symbol.upper()]
+            for key in keys:
+                del self._rings[key]
+        return len(keys)
+
+    def stats(self):
+        """返回缓冲区数量、容量和占用的内存"""
+        rings = list(self._rings.values())
+        return {
+            'series': len(rings),
+            'capacity': self.capacity,
+            'bytes': sum(ring.timestamps.nbytes + ring.values.nbytes for ring in rings)
+        }
+
+
+def get_ring_buffers(app=None):
+    """获取当前应用的K线环形缓冲区"""
+    app = app or current_app
+    buffers = app.extensions.get('ring_buffers')
+    if buffers is None:
+        buffers = RingBuffers(app.config['RING_BUFFER_SIZE'])
+        app.extensions['ring_buffers'] = buffers
+    return buffers
+
+
+def recent_bars(symbol, interval, limit=None, columns=None):
+    """读取最近的K线，返回只读的零拷贝DataFrame视图，需要修改时应先复制"""
+    return get_ring_buffers().get(symbol, interval, limit, columns)
@@ -1,11 +1,23 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response, current_app, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app.market_data import market_data_bp
-from app.models.market_data import StockData, DataSource
+from app.models.market_data import StockData, DataSource, PriceData, QuarantinedBar
+from app.market_data.backfill import backfill_report, plan_backfill, run_backfill
+from app.market_data.bar_store import load_bars, period_start
+from app.market_data.cache import get_history, get_history_cache
+from app.market_data.panel import load_panel
+from app.market_data.quotes import get_quote_hub
+from app.market_data.resample import get_resample_cache
+from app.market_data.ring_buffer import get_ring_buffers
+from app.market_data.search import search_symbols
+from app.market_data.serialize import OHLCV_FIELDS, to_columnar, values_to_list
+from app.market_data.universe import FIELDS as SNAPSHOT_FIELDS, TEXT_FIELDS as SNAPSHOT_TEXT_FIELDS, get_universe
+from app.indicators import compute_indicator, incremental_indicator, indicator_params
+from app.market_data.upstream import fetch_history_batch, fetch_info_batch, flight
 from app import db
-import yfinance as yf
 import pandas as pd
 from datetime import datetime, timedelta
+import json
 import pytz
 
 @market_data_bp.route('/sources', methods=['GET'])
@@ -18,6 +30,7 @@ def get_data_sources():
             'id': source.id,
             'name': source.name,
             'description': source.description,
+            'provider': source.provider,
             'is_active': source.is_active
         } for source in sources]
     })
@@ -30,11 +43,8 @@ def search_stocks():
     if len(query) < 2:
         return jsonify({'error': '搜索关键词至少需要2个字符'}), 400
     
-    # 这里使用简单的模糊匹配，实际应用中可能需要更复杂的搜索逻辑
-    stocks = StockData.query.filter(
-        (StockData.symbol.ilike(f'%{query}%')) | 
-        (StockData.name.ilike(f'%{query}%'))
-    ).limit(20).all()
+    # 代码前缀匹配优先，其次是名称匹配
+    stocks = search_symbols(query, limit=20)
     
     return jsonify({
         'stocks': [{
@@ -52,26 +62,30 @@ def get_stock_price(symbol):
     """获取股票价格数据"""
     interval = request.args.get('interval', '1d')  # 1m, 5m, 15m, 30m, 1h, 1d, 1wk, 1mo
     period = request.args.get('period', '1mo')  # 1d, 5d, 1mo, 3mo, 6mo, 1y, 2y, 5y, 10y, ytd, max
+    output_format = request.args.get('format', 'rows')  # rows, columnar
+    precision = request.args.get('precision', type=int)  # columnar格式下保留的小数位数
     
-    # 使用yfinance获取数据
+    # 从行情数据源获取数据，相同参数的请求在有效期内共用缓存
     try:
-        stock = yf.Ticker(symbol)
-        hist = stock.history(period=period, interval=interval)
+        hist = get_history(symbol, period=period, interval=interval)
         
         if hist.empty:
             return jsonify({'error': '没有找到数据'}), 404
         
         # 格式化数据
-        data = []
-        for index, row in hist.iterrows():
-            data.append({
-                'date': index.isoformat(),
-                'open': float(row['Open']),
-                'high': float(row['High']),
-                'low': float(row['Low']),
-                'close': float(row['Close']),
-                'volume': int(row['Volume'])
-            })
+        if output_format == 'columnar':
+            data = to_columnar(hist, OHLCV_FIELDS, precision)
+        else:
+            data = []
+            for index, row in hist.iterrows():
+                data.append({
+                    'date': index.isoformat(),
+                    'open': float(row['Open']),
+                    'high': float(row['High']),
+                    'low': float(row['Low']),
+                    'close': float(row['Close']),
+                    'volume': int(row['Volume'])
+                })
         
         # 更新数据库中的最新价格
         stock_data = StockData.query.filter_by(symbol=symbol).first()
@@ -84,11 +98,84 @@ def get_stock_price(symbol):
             'symbol': symbol,
             'interval': interval,
             'period': period,
+            'format': output_format,
             'data': data
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _json_number(value):
+    """NaN 转为 None，NaN 不是合法的JSON"""
+    return None if value is not None and value != value else value
+
+@market_data_bp.route('/stocks/<symbol>/history', methods=['GET'])
+@jwt_required()
+def stream_price_history(symbol):
+    """从数据库流式返回历史K线
+
+    format=ndjson 时每行一根K线；format=columnar 时每行是一批K线的列式数据。
+    使用服务端游标分批读取，内存占用与区间长度无关。
+    """
+    interval = request.args.get('interval', '1d')
+    output_format = request.args.get('format', 'ndjson')
+    # 在开始流式输出之前限制范围，yield_per 不接受小于1的值
+    chunk_size = max(1, min(request.args.get('chunk_size', 5000, type=int), 50000))
+    
+    if output_format not in ('ndjson', 'columnar'):
+        return jsonify({'error': '不支持的输出格式'}), 400
+    
+    try:
+        start = datetime.fromisoformat(request.args['start_date']) if request.args.get('start_date') else None
+        end = datetime.fromisoformat(request.args['end_date']) if request.args.get('end_date') else None
+    except ValueError:
+        return jsonify({'error': '日期格式无效'}), 400
+    
+    stock = StockData.query.filter_by(symbol=symbol).first()
+    if not stock:
+        return jsonify({'error': '股票不存在'}), 404
+    
+    query = db.select(
+        PriceData.timestamp,
+        PriceData.open_price,
+        PriceData.high_price,
+        PriceData.low_price,
+        PriceData.close_price,
+        PriceData.volume
+    ).where(
+        PriceData.stock_id == stock.id,
+        PriceData.interval == interval
+    ).order_by(PriceData.timestamp)
+    if start:
+        query = query.where(PriceData.timestamp >= start)
+    if end:
+        query = query.where(PriceData.timestamp <= end)
+    
+    def generate():
+        result = db.session.execute(query.execution_options(yield_per=chunk_size))
+        for rows in result.partitions():
+            if output_format == 'columnar':
+                t, o, h, l, c, v = zip(*rows)
+                # 缺失值（NULL 或 NaN）输出为 null，NaN 不是合法的JSON
+                yield json.dumps({
+                    't': [ts.isoformat() for ts in t],
+                    'o': values_to_list(o),
+                    'h': values_to_list(h),
+                    'l': values_to_list(l),
+                    'c': values_to_list(c),
+                    'v': values_to_list(v, integer=True)
+                }) + '\n'
+            else:
+                yield ''.join(json.dumps({
+                    'date': row[0].isoformat(),
+                    'open': _json_number(row[1]),
+                    'high': _json_number(row[2]),
+                    'low': _json_number(row[3]),
+                    'close': _json_number(row[4]),
+                    'volume': _json_number(row[5])
+                }) + '\n' for row in rows)
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @market_data_bp.route('/stocks/sync', methods=['POST'])
 @jwt_required()
 def sync_stock_data():
@@ -99,16 +186,31 @@ def sync_stock_data():
     if not symbols:
         return jsonify({'error': '请提供股票代码列表'}), 400
     
+    # 一次查出已存在的股票，只为新股票获取基本信息
+    existing = {
+        stock.symbol: stock
+        for stock in StockData.query.filter(StockData.symbol.in_(symbols)).all()
+    }
+    infos, errors = fetch_info_batch([s for s in symbols if s not in existing])
+    
+    # 最新价格按批量获取
+    frames, history_errors = fetch_history_batch(symbols, period='1d')
+    errors.update(history_errors)
+    
     results = []
     for symbol in symbols:
+        if symbol in errors:
+            results.append({
+                'symbol': symbol,
+                'status': 'error',
+                'message': errors[symbol]
+            })
+            continue
+        
         try:
-            # 使用yfinance获取基本信息
-            stock = yf.Ticker(symbol)
-            info = stock.info
-            
-            # 检查数据库中是否已存在
-            stock_data = StockData.query.filter_by(symbol=symbol).first()
+            stock_data = existing.get(symbol)
             if not stock_data:
+                info = infos.get(symbol, {})
                 stock_data = StockData(
                     symbol=symbol,
                     name=info.get('shortName', ''),
@@ -118,10 +220,11 @@ def sync_stock_data():
                     source_id=1  # 假设1是Yahoo Finance的数据源ID
                 )
                 db.session.add(stock_data)
+                existing[symbol] = stock_data
             
             # 更新最新价格
-            hist = stock.history(period='1d')
-            if not hist.empty:
+            hist = frames.get(symbol)
+            if hist is not None and not hist.empty:
                 stock_data.last_price = float(hist['Close'].iloc[-1])
                 stock_data.last_update = datetime.now(pytz.timezone('UTC'))
             
@@ -140,58 +243,340 @@ def sync_stock_data():
     db.session.commit()
     return jsonify({'results': results})
 
+@market_data_bp.route('/backfill', methods=['POST'])
+@jwt_required()
+def backfill_price_data():
+    """回补price_data中缺失的K线，默认只返回回补计划"""
+    data = request.get_json() or {}
+    symbols = data.get('symbols', [])
+    interval = data.get('interval', '1d')
+    dry_run = data.get('dry_run', True)
+    
+    if not symbols:
+        return jsonify({'error': '请提供股票代码列表'}), 400
+    
+    try:
+        start = datetime.fromisoformat(data['start_date']) if data.get('start_date') else None
+        end = datetime.fromisoformat(data['end_date']) if data.get('end_date') else None
+    except ValueError:
+        return jsonify({'error': '日期格式无效'}), 400
+    
+    gaps = plan_backfill(symbols, interval, start=start, end=end)
+    report = backfill_report(gaps)
+    report['dry_run'] = dry_run
+    if not dry_run:
+        report['results'] = run_backfill(gaps)
+    return jsonify(report)
+
+@market_data_bp.route('/screener', methods=['GET'])
+@jwt_required()
+def screen_stocks():
+    """按全市场日线快照筛选股票
+
+    数值字段用 min_<字段>/max_<字段> 过滤，文本字段按相等过滤，
+    sort 为排序字段，前缀 - 表示降序。
+    """
+    filters = {}
+    for name in SNAPSHOT_FIELDS:
+        lo = request.args.get(f'min_{name}', type=float)
+        hi = request.args.get(f'max_{name}', type=float)
+        if lo is not None or hi is not None:
+            filters[name] = (lo, hi)
+    equals = {name: request.args[name] for name in SNAPSHOT_TEXT_FIELDS if request.args.get(name)}
+    sort = request.args.get('sort', '-dollar_volume_20d')
+    limit = min(request.args.get('limit', 50, type=int), current_app.config['SCREENER_MAX_RESULTS'])
+    
+    descending = sort.startswith('-')
+    sort = sort.lstrip('-')
+    if sort not in SNAPSHOT_FIELDS:
+        return jsonify({'error': f'不支持的排序字段: {sort}'}), 400
+    
+    # 更新本进程写入过日线的股票；快照为空或过期时比较全部股票的版本号
+    universe = get_universe()
+    universe.refresh(max_age=current_app.config['UNIVERSE_REFRESH_INTERVAL'])
+    total, results = universe.screen(filters, equals, sort=sort, descending=descending, limit=limit)
+    return jsonify({
+        'as_of': universe.as_of(),
+        'universe': len(universe),
+        'total': total,
+        'sort': ('-' if descending else '') + sort,
+        'results': results
+    })
+
+@market_data_bp.route('/quarantine', methods=['GET'])
+@jwt_required()
+def get_quarantined_bars():
+    """查看未通过数据质量校验而被隔离的K线"""
+    symbol = request.args.get('symbol')
+    interval = request.args.get('interval')
+    reason = request.args.get('reason')
+    limit = min(request.args.get('limit', 100, type=int), 1000)
+    
+    query = QuarantinedBar.query
+    if symbol:
+        stock = StockData.query.filter_by(symbol=symbol).first()
+        if not stock:
+            return jsonify({'error': '股票不存在'}), 404
+        query = query.filter(QuarantinedBar.stock_id == stock.id)
+    if interval:
+        query = query.filter(QuarantinedBar.interval == interval)
+    if reason:
+        query = query.filter(QuarantinedBar.reasons.contains(reason))
+    
+    # 按检查项统计，一根K线可能同时有多个原因
+    summary = {}
+    for reasons, count in query.with_entities(QuarantinedBar.reasons, db.func.count()).group_by(QuarantinedBar.reasons):
+        for name in reasons.split(','):
+            summary[name] = summary.get(name, 0) + count
+    
+    bars = query.order_by(QuarantinedBar.timestamp.desc()).limit(limit).all()
+    return jsonify({
+        'total': query.count(),
+        'summary': summary,
+        'bars': [{
+            'symbol': bar.stock.symbol,
+            'interval': bar.interval,
+            'timestamp': bar.timestamp.isoformat(),
+            'open': bar.open_price,
+            'high': bar.high_price,
+            'low': bar.low_price,
+            'close': bar.close_price,
+            'volume': bar.volume,
+            'reasons': bar.reasons,
+            'created_at': bar.created_at.isoformat() if bar.created_at else None
+        } for bar in bars]
+    })
+
 @market_data_bp.route('/indicators', methods=['GET'])
 @jwt_required()
 def get_technical_indicators():
     """获取技术指标"""
     symbol = request.args.get('symbol')
-    indicator = request.args.get('indicator', 'sma')  # sma, ema, rsi, macd, etc.
-    period = int(request.args.get('period', 14))
+    indicator = request.args.get('indicator', 'sma')  # sma, ema, rsi, macd, bollinger, atr, stochastic, obv, vwap
+    output_format = request.args.get('format', 'rows')  # rows, columnar
+    precision = request.args.get('precision', type=int)  # columnar格式下保留的小数位数
     
     if not symbol:
         return jsonify({'error': '请提供股票代码'}), 400
     
+    # 指标参数从查询参数中读取，未提供的使用指标默认值
     try:
-        # 获取历史数据
-        stock = yf.Ticker(symbol)
-        hist = stock.history(period='1y')
-        
-        if hist.empty:
-            return jsonify({'error': '没有找到数据'}), 404
-        
-        # 计算指标
-        if indicator == 'sma':
-            # 简单移动平均线
-            hist['indicator'] = hist['Close'].rolling(window=period).mean()
-        elif indicator == 'ema':
-            # 指数移动平均线
-            hist['indicator'] = hist['Close'].ewm(span=period, adjust=False).mean()
-        elif indicator == 'rsi':
-            # 相对强弱指标
-            delta = hist['Close'].diff()
-            gain = delta.where(delta > 0, 0)
-            loss = -delta.where(delta < 0, 0)
-            avg_gain = gain.rolling(window=period).mean()
-            avg_loss = loss.rolling(window=period).mean()
-            rs = avg_gain / avg_loss
-            hist['indicator'] = 100 - (100 / (1 + rs))
+        params = indicator_params(indicator, request.args)
+    except ValueError:
+        return jsonify({'error': '不支持的指标类型或参数无效'}), 400
+    
+    try:
+        # 获取历史数据，优先读取本地列式存储
+        hist = load_bars(symbol, '1d')
+        if not hist.empty:
+            # 从存储的第一根K线开始增量计算，只计算上次请求之后新增的K线，只返回最近一年；
+            # 起点固定，缓存的指标状态与进程和请求的先后无关。结果为新的DataFrame，不会修改共享的K线数据
+            result = incremental_indicator(symbol, '1d', indicator, hist, since=period_start('1y'), **params)
         else:
-            return jsonify({'error': '不支持的指标类型'}), 400
+            hist = get_history(symbol, period='1y', interval='1d')
+            if hist.empty:
+                return jsonify({'error': '没有找到数据'}), 404
+            result = compute_indicator(indicator, hist, **params)
+        result = result.dropna(how='all')
+        outputs = list(result.columns)
         
         # 格式化数据
-        data = []
-        for index, row in hist.iterrows():
-            if not pd.isna(row['indicator']):
-                data.append({
-                    'date': index.isoformat(),
-                    'value': float(row['indicator'])
-                })
+        if output_format == 'columnar':
+            data = to_columnar(result, {('v' if name == 'value' else name): name for name in outputs}, precision)
+        else:
+            data = []
+            for index, row in result.iterrows():
+                item = {'date': index.isoformat()}
+                for name in outputs:
+                    item[name] = None if pd.isna(row[name]) else float(row[name])
+                data.append(item)
         
         return jsonify({
             'symbol': symbol,
             'indicator': indicator,
-            'period': period,
+            'period': params.get('period'),
+            'params': params,
+            'format': output_format,
             'data': data
         })
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@market_data_bp.route('/indicators/batch', methods=['POST'])
+@jwt_required()
+def get_batch_indicators():
+    """批量计算多只股票的多个技术指标"""
+    data = request.get_json() or {}
+    symbols = data.get('symbols', [])
+    specs = data.get('indicators', [])
+    interval = data.get('interval', '1d')
+    period = data.get('period', '1y')
+    output_format = data.get('format', 'rows')  # rows, columnar
+    precision = data.get('precision')  # columnar格式下保留的小数位数
+    tail = data.get('tail')  # 每个指标只返回最近的若干个点
+    
+    if not symbols:
+        return jsonify({'error': '请提供股票代码列表'}), 400
+    if len(symbols) > current_app.config['INDICATOR_BATCH_MAX_SYMBOLS']:
+        return jsonify({'error': f"一次最多计算 {current_app.config['INDICATOR_BATCH_MAX_SYMBOLS']} 只股票"}), 400
+    if not specs:
+        return jsonify({'error': '请提供指标列表'}), 400
+    
+    # 先校验全部指标参数，key 用于区分同一指标的不同参数
+    indicators = []
+    for spec in specs:
+        name = spec.get('name')
+        try:
+            params = indicator_params(name, spec.get('params') or {})
+        except (ValueError, TypeError):
+            return jsonify({'error': f'不支持的指标类型或参数无效: {name}'}), 400
+        indicators.append((spec.get('key') or name, name, params))
+    
+    try:
+        panel, present, errors = load_panel(symbols, interval, period)
+        results = {}
+        if panel is not None:
+            # 每个指标在整个面板上向量化计算一次，输出列为 (输出名, symbol)
+            outputs = {key: compute_indicator(name, panel, **params) for key, name, params in indicators}
+            for symbol in present.columns:
+                results[symbol] = {}
+                for key, result in outputs.items():
+                    # 去掉对齐时为该股票补出的行
+                    frame = result.xs(symbol, axis=1, level=1)[present[symbol].to_numpy()].dropna(how='all')
+                    if tail:
+                        frame = frame.iloc[-int(tail):]
+                    columns = list(frame.columns)
+                    if output_format == 'columnar':
+                        results[symbol][key] = to_columnar(
+                            frame, {('v' if name == 'value' else name): name for name in columns}, precision)
+                    else:
+                        results[symbol][key] = [{
+                            'date': index.isoformat(),
+                            **{name: None if pd.isna(row[name]) else float(row[name]) for name in columns}
+                        } for index, row in frame.iterrows()]
+        
+        return jsonify({
+            'interval': interval,
+            'period': period,
+            'format': output_format,
+            'indicators': [{'key': key, 'name': name, 'params': params} for key, name, params in indicators],
+            'results': results,
+            'errors': errors
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def _sse(event, data):
+    """格式化一条SSE消息"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@market_data_bp.route('/quotes/stream', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_quotes():
+    """通过SSE推送实时报价
+
+    浏览器的EventSource无法设置请求头，可以通过 jwt 查询参数传递令牌。
+    连接建立后先发送 subscribed 事件（包含订阅ID），之后每次价格变化发送 quote 事件，
+    没有消息时定期发送注释行保持连接。
+    """
+    symbols = [s.strip() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    if not symbols:
+        return jsonify({'error': '请提供股票代码列表'}), 400
+    if len(symbols) > current_app.config['QUOTE_STREAM_MAX_SYMBOLS']:
+        return jsonify({'error': f"一次最多订阅 {current_app.config['QUOTE_STREAM_MAX_SYMBOLS']} 只股票"}), 400
+    
+    hub = get_quote_hub()
+    heartbeat = current_app.config['QUOTE_HEARTBEAT_INTERVAL']
+    subscriber = hub.subscribe(symbols, owner=get_jwt_identity())
+    
+    def generate():
+        try:
+            yield _sse('subscribed', {'id': subscriber.id, 'symbols': sorted(subscriber.symbols)})
+            while not subscriber.closed:
+                messages = subscriber.get(heartbeat)
+                if not messages:
+                    yield ': keepalive\n\n'
+                    continue
+                yield ''.join(_sse('quote', message) for message in messages)
+        finally:
+            # 客户端断开时生成器被关闭，同时取消订阅
+            hub.unsubscribe(subscriber.id)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@market_data_bp.route('/quotes/subscriptions', methods=['GET'])
+@jwt_required()
+def get_quote_subscriptions():
+    """查看报价订阅和轮询的统计信息"""
+    return jsonify(get_quote_hub().stats())
+
+@market_data_bp.route('/quotes/subscriptions/<subscription_id>', methods=['PUT'])
+@jwt_required()
+def update_quote_subscription(subscription_id):
+    """增减一个报价订阅中的股票"""
+    data = request.get_json() or {}
+    hub = get_quote_hub()
+    subscriber = hub.get(subscription_id)
+    if not subscriber or subscriber.owner != get_jwt_identity():
+        return jsonify({'error': '订阅不存在'}), 404
+    
+    add = data.get('add', [])
+    remove = data.get('remove', [])
+    total = len(subscriber.symbols | {s.upper() for s in add})
+    if total > current_app.config['QUOTE_STREAM_MAX_SYMBOLS']:
+        return jsonify({'error': f"一次最多订阅 {current_app.config['QUOTE_STREAM_MAX_SYMBOLS']} 只股票"}), 400
+    
+    subscriber = hub.update(subscription_id, add=add, remove=remove)
+    if not subscriber:
+        return jsonify({'error': '订阅不存在'}), 404
+    return jsonify({
+        'id': subscriber.id,
+        'symbols': sorted(subscriber.symbols)
+    })
+
+@market_data_bp.route('/quotes/subscriptions/<subscription_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_quote_subscription(subscription_id):
+    """取消报价订阅并关闭对应的推送连接"""
+    hub = get_quote_hub()
+    subscriber = hub.get(subscription_id)
+    if not subscriber or subscriber.owner != get_jwt_identity():
+        return jsonify({'error': '订阅不存在'}), 404
+    hub.unsubscribe(subscription_id)
+    return jsonify({'message': '订阅已取消'})
+
+@market_data_bp.route('/cache', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    """查看行情缓存的统计信息和条目"""
+    cache = get_history_cache()
+    return jsonify({
+        'stats': cache.stats(),
+        'singleflight': flight.stats(),
+        'resample': get_resample_cache().stats(),
+        'ring_buffers': get_ring_buffers().stats(),
+        'entries': [{
+            'symbol': symbol,
+            'period': period,
+            'interval': interval,
+            'ttl_remaining': round(ttl, 1)
+        } for (symbol, period, interval), ttl in cache.entries()]
+    })
+
+@market_data_bp.route('/cache', methods=['DELETE'])
+@jwt_required()
+def flush_cache():
+    """清空行情缓存，可通过symbol参数只清除某只股票"""
+    symbol = request.args.get('symbol')
+    cache = get_history_cache()
+    if symbol:
+        removed = cache.delete(lambda key: key[0] == symbol.upper())
+    else:
+        removed = cache.delete()
+    return jsonify({
+        'message': '缓存已清空',
+        'removed': removed
+    })
\ No newline at end of file
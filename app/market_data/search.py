@@ -0,0 +1,190 @@
+"""股票代码搜索索引
+
+内存中保存按代码排序的数组、名称单词前缀表和n-gram倒排表，代替 ILIKE '%q%' 的全表扫描：
+- 代码前缀匹配用二分查找，排在最前面（完全匹配的代码最短，自然排第一）
+- 其次是名称中某个单词以关键词开头的股票，最后是代码或名称中包含关键词的股票
+
+StockData 的代码或名称发生变化后，下次搜索时在后台线程重建索引，重建完成前继续使用旧的索引，
+搜索请求不会等待重建；其他进程写入的变化最迟在 SEARCH_INDEX_TTL 秒后开始重建。
+"""
+import heapq
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, inspect
+
+from app import db
+from app.models.market_data import StockData
+
+logger = logging.getLogger(__name__)
+
+EMPTY_POSTING = np.array([], dtype=np.int32)
+
+# StockData 的代码或名称每变化一次加一，索引据此判断是否过期
+_generation = 0
+_lock = threading.Lock()
+# 是否有后台线程正在重建索引
+_building = False
+
+
+def _grams(text, n):
+    """返回文本中所有长度为n的片段"""
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SymbolIndex:
+    """股票代码和名称的搜索索引
+
+    股票按 (代码长度, 代码) 排序，位置即排名，倒排表中的位置天然有序，
+    匹配到足够的结果后就可以停止扫描。
+    """
+
+    def __init__(self, rows, generation=0):
+        rows = sorted(((row[0], row[1].upper(), (row[2] or '').lower()) for row in rows),
+                      key=lambda r: (len(r[1]), r[1]))
+        self.ids = [row[0] for row in rows]
+        self.symbols = [row[1] for row in rows]
+        self.names = [row[2] for row in rows]
+        self.generation = generation
+        self.built_at = time.monotonic()
+
+        # 按代码字母序排列的位置，用于二分查找代码前缀
+        self.alphabetical = sorted(range(len(rows)), key=self.symbols.__getitem__)
+        self.sorted_symbols = [self.symbols[position] for position in self.alphabetical]
+
+        # 名称中单词的前缀 -> 位置；2-gram 和 3-gram -> 位置（代码和名称中的子串）
+        prefixes, grams = defaultdict(list), defaultdict(list)
+        for position, (symbol, name) in enumerate(zip(self.symbols, self.names)):
+            for prefix in {word[:n] for word in name.split() for n in range(2, len(word) + 1)}:
+                prefixes[prefix].append(position)
+            text = f'{symbol.lower()}\n{name}'
+            for gram in _grams(text, 2) | _grams(text, 3):
+                grams[gram].append(position)
+        self.prefixes = {key: np.array(value, dtype=np.int32) for key, value in prefixes.items()}
+        self.grams = {key: np.array(value, dtype=np.int32) for key, value in grams.items()}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _substring_candidates(self, keyword):
+        """用n-gram倒排表求可能包含关键词的股票位置（需要再逐个校验）"""
+        n = 3 if len(keyword) >= 3 else 2
+        postings = sorted((self.grams.get(gram, EMPTY_POSTING) for gram in _grams(keyword, n)), key=len)
+        result = postings[0]
+        for posting in postings[1:]:
+            if not len(result):
+                break
+            result = np.intersect1d(result, posting, assume_unique=True)
+        return result
+
+    def search(self, query, limit=20):
+        """搜索股票，按相关性返回最多limit个StockData的id"""
+        keyword = ' '.join(query.lower().split())
+        if not keyword:
+            return []
+
+        # 代码前缀匹配：字母序中前缀相同的代码是连续的一段
+        upper = keyword.upper()
+        lo = bisect_left(self.sorted_symbols, upper)
+        hi = bisect_left(self.sorted_symbols, upper + '\uffff')
+        ranked = heapq.nsmallest(limit, self.alphabetical[lo:hi])
+        if len(ranked) >= limit or len(keyword) < 2:
+            return [self.ids[position] for position in ranked]
+
+        chosen = set(ranked)
+
+        def collect(candidates, match):
+            for position in candidates.tolist():
+                if position in chosen or not match(self.symbols[position], self.names[position]):
+                    continue
+                ranked.append(position)
+                chosen.add(position)
+                if len(ranked) >= limit:
+                    return True
+            return False
+
+        # 名称中有单词以关键词开头，其次是代码或名称包含关键词
+        word = keyword.split()[0]
+        word_prefix = f' {keyword}'
+        if collect(self.prefixes.get(word, EMPTY_POSTING),
+                   lambda symbol, name: name.startswith(keyword) or word_prefix in name):
+            return [self.ids[position] for position in ranked]
+        collect(self._substring_candidates(keyword),
+                lambda symbol, name: keyword in name or keyword in symbol.lower())
+        return [self.ids[position] for position in ranked]
+
+
+def _build(app):
+    """从 stock_data 表构建索引并替换当前应用的索引"""
+    generation = _generation
+    started = time.perf_counter()
+    rows = db.session.query(StockData.id, StockData.symbol, StockData.name).all()
+    index = SymbolIndex(rows, generation)
+    app.extensions['symbol_index'] = index
+    logger.info(f"重建股票搜索索引: {len(index)} 只股票，耗时 {time.perf_counter() - started:.3f}s")
+    return index
+
+
+def _build_in_background(app):
+    global _building
+    try:
+        with app.app_context():
+            _build(app)
+    except Exception:
+        logger.exception("重建股票搜索索引失败")
+    finally:
+        _building = False
+
+
+def get_symbol_index(app=None):
+    """获取当前应用的搜索索引
+
+    第一次使用时同步构建；过期后启动后台线程重建，重建完成前返回旧的索引。
+    """
+    global _building
+    app = app or current_app._get_current_object()
+    index = app.extensions.get('symbol_index')
+    if index is None:
+        with _lock:
+            index = app.extensions.get('symbol_index')
+            if index is None:
+                index = _build(app)
+        return index
+
+    if index.generation != _generation or time.monotonic() - index.built_at >= app.config['SEARCH_INDEX_TTL']:
+        with _lock:
+            if not _building:
+                _building = True
+                threading.Thread(target=_build_in_background, args=(app,), name='symbol-index', daemon=True).start()
+    return index
+
+
+def search_symbols(query, limit=20):
+    """搜索股票，返回按相关性排序的StockData列表"""
+    ids = get_symbol_index().search(query, limit)
+    if not ids:
+        return []
+    stocks = {stock.id: stock for stock in StockData.query.filter(StockData.id.in_(ids))}
+    return [stocks[i] for i in ids if i in stocks]
+
+
+def _invalidate(mapper, connection, target):
+    global _generation
+    _generation += 1
+
+
+def _invalidate_on_change(mapper, connection, target):
+    # 定时任务每分钟都会更新价格，只有代码或名称变化时才需要重建
+    state = inspect(target)
+    if state.attrs.symbol.history.has_changes() or state.attrs.name.history.has_changes():
+        _invalidate(mapper, connection, target)
+
+
+event.listen(StockData, 'after_insert', _invalidate)
+event.listen(StockData, 'after_delete', _invalidate)
+event.listen(StockData, 'after_update', _invalidate_on_change)
@@ -0,0 +1,55 @@
+"""行情数据的列式JSON序列化
+
+直接从NumPy数组生成 {"t": [...], "o": [...], ...} 形式的数据，
+序列化开销与列数相关，而不是逐行构造Python字典。
+"""
+import numpy as np
+import pandas as pd
+
+# 列式输出的字段名与DataFrame列的对应关系
+OHLCV_FIELDS = {
+    'o': 'Open',
+    'h': 'High',
+    'l': 'Low',
+    'c': 'Close',
+    'v': 'Volume',
+}
+
+# 输出为整数的列
+INTEGER_COLUMNS = ('Volume',)
+
+
+def timestamps_to_list(index):
+    """把时间索引转换为UTC ISO字符串列表"""
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert('UTC').tz_localize(None)
+    return np.datetime_as_string(index.values, unit='s', timezone='UTC').tolist()
+
+
+def values_to_list(values, precision=None, integer=False):
+    """把数值数组转换为列表，NaN转为None，可选按小数位数取整或输出整数"""
+    values = np.asarray(values, dtype='float64')
+    if integer:
+        values = np.round(values)
+    elif precision is not None:
+        values = np.round(values, precision)
+    mask = np.isnan(values)
+    if not mask.any():
+        return values.astype('int64').tolist() if integer else values.tolist()
+    result = values.astype(object)
+    if integer:
+        result[~mask] = values[~mask].astype('int64')
+    result[mask] = None
+    return result.tolist()
+
+
+def to_columnar(df, fields, precision=None):
+    """把DataFrame转换为列式字典
+
+    fields 为 {输出字段名: DataFrame列名}，时间索引输出为 t 字段。
+    """
+    data = {'t': timestamps_to_list(df.index)}
+    for key, column in fields.items():
+        data[key] = values_to_list(df[column].to_numpy(), precision, column in INTEGER_COLUMNS)
+    return data
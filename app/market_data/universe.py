@@ -0,0 +1,301 @@
+"""全市场日线快照
+
+为每只股票预先计算横截面筛选常用的字段（最新收盘价、1/5/20日收益率、波动率、
+平均成交量、52周最高/最低价），保存为按字段连续的 NumPy 数组表，选股时对整列做向量化
+过滤和排序，不再逐只查询历史K线。
+
+快照按股票增量更新：写入日线后只把该股票标记为待更新，下次读取时重新计算；
+每只股票记录计算时日线存储的版本号，快照为空或距上次全量检查超过 UNIVERSE_REFRESH_INTERVAL 秒时，
+选股请求比较全部股票的版本号，获取其他进程写入的变化，还没有列式存储的股票从 price_data 加载；
+也可以用 flask market_data refresh-universe 或定时任务执行全量检查。
+快照同时保存到 <BAR_STORE_PATH>/universe.npz，进程启动时直接加载，文件被其他进程更新后重新加载。
+"""
+import logging
+import os
+import threading
+import time
+
+import click
+import numpy as np
+import pandas as pd
+from flask import current_app
+
+from app.market_data import market_data_bp
+from app.market_data.bar_store import get_bar_store, load_bars, sync_bar_store
+from app.market_data.resample import storage_interval
+from app.models.market_data import StockData
+
+logger = logging.getLogger(__name__)
+
+# 数值字段，顺序即数组的行
+FIELDS = [
+    'close',
+    'return_1d',
+    'return_5d',
+    'return_20d',
+    'volatility_20d',
+    'adv_20d',
+    'dollar_volume_20d',
+    'high_52w',
+    'low_52w',
+]
+
+# 文本字段，可以按相等过滤
+TEXT_FIELDS = ['name', 'exchange', 'sector', 'industry']
+
+# 计算快照需要的日线根数（52周约252个交易日，多留一些余量）
+LOOKBACK_BARS = 260
+TRADING_DAYS = 252
+
+
+def compute_snapshot(df):
+    """由一只股票的日线计算快照字段，返回与FIELDS顺序一致的数组"""
+    row = np.full(len(FIELDS), np.nan)
+    if df.empty:
+        return row
+    high, low, close, volume = (df[c].to_numpy() for c in ('High', 'Low', 'Close', 'Volume'))
+    n = len(close)
+
+    row[0] = close[-1]
+    for i, days in enumerate((1, 5, 20), start=1):
+        if n > days and close[-1 - days]:
+            row[i] = close[-1] / close[-1 - days] - 1
+    if n >= 3:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.diff(np.log(close[-21:]))
+        row[4] = np.nanstd(returns, ddof=1) * np.sqrt(TRADING_DAYS)
+    row[5] = np.nanmean(volume[-20:])
+    row[6] = np.nanmean(volume[-20:] * close[-20:])
+
+    # 52周按时间而不是根数截取，停牌的股票也只看最近一年
+    start = df.index.searchsorted(df.index[-1] - pd.Timedelta(weeks=52))
+    row[7] = np.nanmax(high[start:])
+    row[8] = np.nanmin(low[start:])
+    return row
+
+
+class UniverseSnapshot:
+    """全市场快照表，每只股票一列"""
+
+    def __init__(self):
+        self.symbols = np.array([], dtype=object)
+        self.values = np.empty((len(FIELDS), 0))
+        self.timestamps = np.array([], dtype='datetime64[ns]')  # 最后一根日线的时间
+        self.versions = np.array([], dtype='int64')  # 计算时日线存储的版本号
+        self.text = {name: np.array([], dtype=object) for name in TEXT_FIELDS}
+        self.positions = {}
+        self.dirty = set()
+        self.mtime = None  # 加载或保存时文件的修改时间
+        self.checked_at = None  # 上次比较全部股票版本号的时间（Unix时间戳）
+        self.lock = threading.RLock()
+        self.refresh_lock = threading.Lock()  # 避免多个请求同时全量检查
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def _grow(self, symbols):
+        """为新股票追加列"""
+        count = len(symbols)
+        self.positions.update({symbol: len(self.symbols) + i for i, symbol in enumerate(symbols)})
+        self.symbols = np.concatenate([self.symbols, np.array(symbols, dtype=object)])
+        self.values = np.concatenate([self.values, np.full((len(FIELDS), count), np.nan)], axis=1)
+        self.timestamps = np.concatenate([self.timestamps, np.full(count, np.datetime64('NaT'), 'datetime64[ns]')])
+        self.versions = np.concatenate([self.versions, np.full(count, -1, dtype='int64')])
+        for name in TEXT_FIELDS:
+            self.text[name] = np.concatenate([self.text[name], np.full(count, None, dtype=object)])
+
+    def update(self, symbols, stocks=None):
+        """重新计算一组股票的快照，返回更新的数量
+
+        stocks 为 {symbol: StockData}，不提供时从数据库读取名称、板块等信息。
+        """
+        symbols = [s.upper() for s in symbols]
+        if stocks is None:
+            stocks = {s.symbol.upper(): s for s in StockData.query.filter(StockData.symbol.in_(symbols))}
+        store = get_bar_store()
+        interval = storage_interval('1d')
+
+        rows = {}
+        for symbol in symbols:
+            if symbol not in stocks:
+                continue
+            info = store.info(symbol, interval)
+            if info is None:
+                # 还没有列式存储的股票先从 price_data 加载
+                sync_bar_store(stocks[symbol].symbol, interval)
+                info = store.info(symbol, interval)
+            if not info or not info['rows']:
+                continue
+            bars = load_bars(symbol, '1d', limit=LOOKBACK_BARS)
+            rows[symbol] = (info['version'], bars.index[-1] if len(bars) else None, compute_snapshot(bars))
+
+        with self.lock:
+            self._grow([symbol for symbol in rows if symbol not in self.positions])
+            for symbol, (version, timestamp, values) in rows.items():
+                i = self.positions[symbol]
+                self.values[:, i] = values
+                self.timestamps[i] = np.datetime64(timestamp, 'ns') if timestamp is not None else np.datetime64('NaT')
+                self.versions[i] = version
+                stock = stocks[symbol]
+                for name in TEXT_FIELDS:
+                    self.text[name][i] = getattr(stock, name)
+            self.dirty.difference_update(symbols)
+        return len(rows)
+
+    def stale_symbols(self):
+        """返回日线存储版本号与快照不一致的股票，包括还没有快照或还没有列式存储的股票"""
+        store = get_bar_store()
+        interval = storage_interval('1d')
+        stale = []
+        for (symbol,) in StockData.query.with_entities(StockData.symbol):
+            symbol = symbol.upper()
+            info = store.info(symbol, interval)
+            if info is not None and not info['rows']:
+                continue
+            i = self.positions.get(symbol)
+            if info is None or i is None or self.versions[i] != info['version']:
+                stale.append(symbol)
+        return stale
+
+    def refresh(self, full=False, max_age=None):
+        """更新待更新的股票，返回更新的股票数量，有更新时保存到文件
+
+        full 时比较全部股票的版本号；指定 max_age（秒）时，快照为空或上次全量检查
+        超过 max_age 秒也会全量检查。
+        """
+        with self.refresh_lock:
+            if max_age is not None and (not len(self) or self.checked_at is None
+                                        or time.time() - self.checked_at >= max_age):
+                full = True
+            symbols = set(self.dirty)
+            if full:
+                symbols.update(self.stale_symbols())
+                self.checked_at = time.time()
+            if not symbols and not full:
+                return 0
+            updated = self.update(sorted(symbols)) if symbols else 0
+            self.save()
+            return updated
+
+    def mark_dirty(self, symbol):
+        self.dirty.add(symbol.upper())
+
+    def screen(self, filters=None, equals=None, sort=None, descending=True, limit=50):
+        """按条件筛选股票
+
+        filters 为 {字段: (最小值, 最大值)}，None 表示不限；equals 为 {文本字段: 值}，
+        sort 为排序字段，缺失值总是排在最后。返回 (满足条件的数量, 结果列表)。
+        """
+        with self.lock:
+            mask = ~np.isnan(self.values[0])
+            for name, (lo, hi) in (filters or {}).items():
+                column = self.values[FIELDS.index(name)]
+                # NaN 与任何值比较都为False，缺失的字段自然被过滤掉
+                if lo is not None:
+                    mask &= column >= lo
+                if hi is not None:
+                    mask &= column <= hi
+            for name, value in (equals or {}).items():
+                mask &= self.text[name] == value
+
+            selected = np.flatnonzero(mask)
+            if sort is not None:
+                key = self.values[FIELDS.index(sort)][selected]
+                order = np.argsort(-key if descending else key, kind='stable')
+                selected = selected[order]
+            selected = selected[:limit]
+
+            results = []
+            for i in selected:
+                result = {'symbol': self.symbols[i]}
+                result.update({name: self.text[name][i] for name in TEXT_FIELDS})
+                result.update({name: None if np.isnan(v) else float(v) for name, v in zip(FIELDS, self.values[:, i])})
+                result['date'] = pd.Timestamp(self.timestamps[i]).isoformat() if not np.isnat(self.timestamps[i]) else None
+                results.append(result)
+            return int(mask.sum()), results
+
+    def as_of(self):
+        """快照中最新的日线时间"""
+        with self.lock:
+            valid = self.timestamps[~np.isnat(self.timestamps)]
+            return pd.Timestamp(valid.max()).isoformat() if len(valid) else None
+
+    def save(self, path=None):
+        """原子地保存到文件"""
+        path = path or snapshot_path()
+        with self.lock:
+            arrays = {
+                'symbols': self.symbols.astype(str),
+                'values': self.values,
+                'timestamps': self.timestamps.astype('int64'),
+                'versions': self.versions,
+                'checked_at': np.array(self.checked_at if self.checked_at is not None else np.nan),
+            }
+            arrays.update({f'text_{name}': np.array([value or '' for value in self.text[name]], dtype=str)
+                           for name in TEXT_FIELDS})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, **arrays)
+        os.replace(tmp, path)
+        self.mtime = os.stat(path).st_mtime_ns
+
+    @classmethod
+    def load(cls, path=None):
+        """从文件加载，文件不存在或字段不一致时返回空快照"""
+        path = path or snapshot_path()
+        snapshot = cls()
+        if not os.path.exists(path):
+            return snapshot
+        try:
+            with np.load(path) as data:
+                values = data['values']
+                if values.shape[0] != len(FIELDS):
+                    logger.warning('快照字段已变化，重新计算')
+                    return snapshot
+                snapshot.symbols = data['symbols'].astype(object)
+                snapshot.values = values
+                snapshot.timestamps = data['timestamps'].view('datetime64[ns]')
+                snapshot.versions = data['versions']
+                if 'checked_at' in data.files and not np.isnan(data['checked_at']):
+                    snapshot.checked_at = float(data['checked_at'])
+                for name in TEXT_FIELDS:
+                    text = data[f'text_{name}'].astype(object)
+                    text[text == ''] = None
+                    snapshot.text[name] = text
+        except Exception as e:
+            logger.error(f"加载全市场快照失败: {str(e)}")
+            return cls()
+        snapshot.positions = {symbol: i for i, symbol in enumerate(snapshot.symbols)}
+        snapshot.mtime = os.stat(path).st_mtime_ns
+        return snapshot
+
+
+def snapshot_path(app=None):
+    app = app or current_app
+    return os.path.join(app.config['BAR_STORE_PATH'], 'universe.npz')
+
+
+def get_universe(app=None):
+    """获取当前应用的全市场快照，首次调用或文件被其他进程更新后从文件加载"""
+    app = app or current_app
+    path = snapshot_path(app)
+    snapshot = app.extensions.get('universe')
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if snapshot is None or (mtime is not None and mtime != snapshot.mtime):
+        loaded = UniverseSnapshot.load(path)
+        if snapshot is not None:
+            # 本进程标记的待更新股票在下次选股时更新
+            loaded.dirty.update(snapshot.dirty)
+        snapshot = loaded
+        app.extensions['universe'] = snapshot
+    return snapshot
+
+
+@market_data_bp.cli.command('refresh-universe')
+def refresh_universe_command():
+    """比较全部股票的日线存储版本号，更新全市场快照"""
+    updated = get_universe().refresh(full=True)
+    click.echo(f'全市场快照已更新: {updated} 只股票')
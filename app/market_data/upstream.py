@@ -0,0 +1,190 @@
+"""上游行情请求
+
+并发的相同请求只会真正发出一次，其余调用方等待这次请求完成并共享结果，
+避免开盘时大量请求同时打到数据源。多只股票的请求按数据源支持的批量大小分批，
+各批次在有界线程池中并发执行。
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+
+from app.market_data.providers import get_provider
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """一次正在进行中的上游调用"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """按键合并并发调用"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.calls = 0
+        self.shared = 0
+
+    def do(self, key, fn):
+        """执行fn；若相同key的调用正在进行，则等待并返回它的结果"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                self.shared += 1
+                leader = False
+            else:
+                call = _Call()
+                self._calls[key] = call
+                self.calls += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stats(self):
+        """返回调用统计：实际发出的调用数、被合并的调用数和进行中的调用数"""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'shared': self.shared,
+                'in_flight': len(self._calls)
+            }
+
+
+flight = SingleFlight()
+
+
+def fetch_history(symbol, period='1mo', interval='1d'):
+    """获取历史K线，并发的相同请求共享一次上游调用
+
+    返回的DataFrame可能被多个调用方共享，调用方需要修改时应先复制。
+    """
+    return flight.do(
+        ('history', symbol.upper(), period, interval),
+        lambda: get_provider().history([symbol], period=period, interval=interval)[symbol]
+    )
+
+
+def fetch_info(symbol):
+    """获取股票基本信息，并发的相同请求共享一次上游调用"""
+    return flight.do(('info', symbol.upper()), lambda: get_provider().info(symbol))
+
+
+def _batches(symbols, size):
+    symbols = list(dict.fromkeys(symbols))
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+
+def _fan_out(jobs, fn):
+    """在有界线程池中执行 fn(job)，返回与jobs顺序一致的结果"""
+    max_workers = min(current_app.config['MARKET_DATA_MAX_WORKERS'], len(jobs))
+    if max_workers <= 1:
+        return [fn(job) for job in jobs]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fn, jobs))
+
+
+def fetch_history_batch(symbols, period='1d', interval='1d', start=None, end=None):
+    """分批获取多只股票的历史K线
+
+    每批的大小取数据源支持的批量大小与 MARKET_DATA_BATCH_SIZE 中较小者，
+    整批请求失败时退回逐只请求，单只股票出错不影响其他股票。
+    返回 (frames, errors)：{symbol: DataFrame} 和 {symbol: 错误信息}。
+    """
+    provider = get_provider()
+    size = max(1, min(provider.max_batch_size, current_app.config['MARKET_DATA_BATCH_SIZE']))
+
+    def load(batch):
+        key = ('history_batch', tuple(batch), period, interval, str(start), str(end))
+        try:
+            return flight.do(key, lambda: provider.history(batch, period=period, interval=interval, start=start, end=end)), {}
+        except Exception as e:
+            if len(batch) == 1:
+                return {}, {batch[0]: str(e)}
+            logger.warning(f"批量获取 {len(batch)} 只股票的K线失败，改为逐只获取: {str(e)}")
+
+        frames, errors = {}, {}
+        for symbol in batch:
+            try:
+                frames.update(provider.history([symbol], period=period, interval=interval, start=start, end=end))
+            except Exception as e:
+                errors[symbol] = str(e)
+        return frames, errors
+
+    frames, errors = {}, {}
+    for batch_frames, batch_errors in _fan_out(_batches(symbols, size), load):
+        frames.update(batch_frames)
+        errors.update(batch_errors)
+    return frames, errors
+
+
+def fetch_info_batch(symbols):
+    """并发获取多只股票的基本信息，返回 (infos, errors)"""
+    provider = get_provider()
+
+    def load(symbol):
+        try:
+            return symbol, flight.do(('info', symbol.upper()), lambda: provider.info(symbol)), None
+        except Exception as e:
+            return symbol, None, str(e)
+
+    infos, errors = {}, {}
+    for symbol, info, error in _fan_out(list(dict.fromkeys(symbols)), load):
+        if error is None:
+            infos[symbol] = info
+        else:
+            errors[symbol] = error
+    return infos, errors
+
+
+def fetch_quote_batch(symbols):
+    """分批获取多只股票的最新报价，返回 (quotes, errors)
+
+    与 fetch_history_batch 相同，整批失败时退回逐只请求。
+    """
+    provider = get_provider()
+    size = max(1, min(provider.max_batch_size, current_app.config['MARKET_DATA_BATCH_SIZE']))
+
+    def load(batch):
+        try:
+            return flight.do(('quote', tuple(batch)), lambda: provider.quote(batch)), {}
+        except Exception as e:
+            if len(batch) == 1:
+                return {}, {batch[0]: str(e)}
+            logger.warning(f"批量获取 {len(batch)} 只股票的报价失败，改为逐只获取: {str(e)}")
+
+        quotes, errors = {}, {}
+        for symbol in batch:
+            try:
+                quotes.update(provider.quote([symbol]))
+            except Exception as e:
+                errors[symbol] = str(e)
+        return quotes, errors
+
+    quotes, errors = {}, {}
+    for batch_quotes, batch_errors in _fan_out(_batches(symbols, size), load):
+        quotes.update(batch_quotes)
+        errors.update(batch_errors)
+    return quotes, errors
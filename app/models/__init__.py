@@ -1,8 +1,8 @@
 # 导入所有模型
 from app.models.user import User
 from app.models.strategy import Strategy
-from app.models.backtest import Backtest, BacktestTrade
-from app.models.market_data import DataSource, StockData, PriceData
+from app.models.backtest import Backtest, BacktestTrade, BacktestJob, BacktestResultCache
+from app.models.market_data import DataSource, StockData, PriceData, QuarantinedBar
 
 # 导入交易相关模型
 from app.models.trading import TradingAccount, TradingTask, TradeOrder, TradePosition
\ No newline at end of file
@@ -15,7 +15,7 @@ class Backtest(db.Model):
     initial_capital = db.Column(db.Float, default=100000.0)
     parameters = db.Column(db.JSON)  # 回测参数
     results = db.Column(db.JSON)  # 回测结果
-    status = db.Column(db.String(16), default='pending')  # pending, running, completed, failed
+    status = db.Column(db.String(16), default='pending')  # pending, queued, running, completed, failed, cancelled
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -41,4 +41,48 @@ class BacktestTrade(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def __repr__(self):
-        return f'<BacktestTrade {self.symbol} {self.side} {self.quantity} @ {self.price}>'
\ No newline at end of file
+        return f'<BacktestTrade {self.symbol} {self.side} {self.quantity} @ {self.price}>'
+
+class BacktestJob(db.Model):
+    """后台回测任务，回测工作进程从该表领取任务"""
+    __tablename__ = 'backtest_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False, default='backtest')  # 任务类型，见 app/backtest/jobs.py
+    backtest_id = db.Column(db.Integer, db.ForeignKey('backtests.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='queued')  # queued, running, cancelling, completed, failed, cancelled
+    payload = db.Column(db.JSON)  # 任务参数
+    result = db.Column(db.JSON)  # 任务结果
+    error = db.Column(db.Text)
+    progress = db.Column(db.Float, default=0.0)  # 0到1
+    worker = db.Column(db.String(64))  # 执行任务的工作进程，主机名:进程号
+    attempts = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    
+    backtest = db.relationship('Backtest', backref=db.backref('jobs', lazy='dynamic'))
+    
+    __table_args__ = (
+        db.Index('ix_backtest_jobs_status_id', status, id),
+    )
+    
+    def __repr__(self):
+        return f'<BacktestJob {self.id} {self.kind} {self.status}>'
+
+class BacktestResultCache(db.Model):
+    """回测结果缓存，按策略代码、参数、区间、引擎设置和K线数据的哈希查找"""
+    __tablename__ = 'backtest_result_cache'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(64), nullable=False, unique=True)  # 见 app/backtest/results.py
+    results = db.Column(db.JSON, nullable=False)  # 回测结果
+    trades = db.Column(db.JSON, nullable=False)  # 成交列表
+    hits = db.Column(db.Integer, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<BacktestResultCache {self.key[:12]}>'
@@ -9,6 +9,8 @@ class DataSource(db.Model):
     name = db.Column(db.String(64), unique=True, nullable=False)
     description = db.Column(db.String(256))
     api_key = db.Column(db.String(128))
+    provider = db.Column(db.String(32))  # 数据源实现：yahoo, replay 等
+    parameters = db.Column(db.JSON)  # 传给数据源实现的参数，如回放数据目录
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -56,7 +58,37 @@ class PriceData(db.Model):
     interval = db.Column(db.String(8))  # 1m, 5m, 15m, 30m, 1h, 1d, 1wk, 1mo
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.UniqueConstraint('stock_id', 'timestamp', 'interval', name='uix_price_data'),)
+    # PostgreSQL上 price_data 按月分区，另有 timestamp 的BRIN索引，见 migrations/versions
+    __table_args__ = (
+        db.UniqueConstraint('stock_id', 'timestamp', 'interval', name='uix_price_data'),
+        db.Index('ix_price_data_stock_interval_ts', stock_id, interval, timestamp.desc()),
+    )
     
     def __repr__(self):
-        return f'<PriceData {self.stock.symbol} {self.timestamp} {self.interval}>'
\ No newline at end of file
+        return f'<PriceData {self.stock.symbol} {self.timestamp} {self.interval}>'
+
+class QuarantinedBar(db.Model):
+    """未通过数据质量校验、没有写入price_data的K线"""
+    __tablename__ = 'quarantined_bars'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stock_data.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    interval = db.Column(db.String(8))
+    open_price = db.Column(db.Float)
+    high_price = db.Column(db.Float)
+    low_price = db.Column(db.Float)
+    close_price = db.Column(db.Float)
+    volume = db.Column(db.Float)  # 原样保存，可能为负数或小数
+    reasons = db.Column(db.String(64))  # 逗号分隔的检查项，见 app/market_data/validation.py
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    stock = db.relationship('StockData')
+    
+    # 同一根K线只保留最近一次被隔离的记录
+    __table_args__ = (
+        db.Index('ix_quarantined_bars_stock_interval_ts', stock_id, interval, timestamp, unique=True),
+    )
+    
+    def __repr__(self):
+        return f'<QuarantinedBar {self.stock_id} {self.timestamp} {self.interval} {self.reasons}>'
@@ -1,21 +1,34 @@
+from flask import current_app
 from app import db, scheduler
 from app.models.trading import TradingTask, TradeOrder, TradePosition
 from app.models.market_data import StockData, PriceData
 from app.models.strategy import Strategy
+from app import indicators
+from app.market_data.backfill import plan_backfill, run_backfill
+from app.market_data.bar_store import load_bars
+from app.market_data.partitions import ensure_price_data_partitions
+from app.market_data.ring_buffer import get_ring_buffers, recent_bars
+from app.market_data.universe import get_universe
+from app.market_data.upstream import fetch_history_batch, fetch_info_batch
 from datetime import datetime, timedelta
 import importlib
 import json
 import logging
 import pytz
-import yfinance as yf
 import pandas as pd
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 传给策略的K线列名
+STRATEGY_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
 def register_tasks(scheduler):
     """注册所有定时任务"""
+    # 预热活跃交易任务用到的K线环形缓冲区
+    warm_ring_buffers()
+    
     # 每天更新股票基本数据
     scheduler.add_job(
         update_stock_data,
@@ -46,6 +59,23 @@ def register_tasks(scheduler):
         id='execute_trading_tasks'
     )
     
+    # 定期比较全部股票的日线存储版本号，更新全市场日线快照
+    scheduler.add_job(
+        refresh_universe_snapshot,
+        'interval',
+        seconds=current_app.config['UNIVERSE_REFRESH_INTERVAL'],
+        id='refresh_universe_snapshot'
+    )
+    
+    # 每天提前创建price_data的月分区（仅PostgreSQL）
+    scheduler.add_job(
+        maintain_price_data_partitions,
+        'cron',
+        hour=1,
+        minute=0,
+        id='maintain_price_data_partitions'
+    )
+    
     # 启动调度器
     if not scheduler.running:
         scheduler.start()
@@ -58,19 +88,28 @@ def update_stock_data():
     try:
         # 获取所有股票
         stocks = StockData.query.all()
+        symbols = [stock.symbol for stock in stocks]
+        
+        # 基本信息在线程池中并发获取，最新价格按批量获取
+        infos, errors = fetch_info_batch(symbols)
+        frames, history_errors = fetch_history_batch(symbols, period="1d")
+        for symbol, error in {**errors, **history_errors}.items():
+            logger.error(f"更新股票 {symbol} 时出错: {error}")
         
         for stock in stocks:
             try:
-                # 使用yfinance获取最新数据
-                ticker = yf.Ticker(stock.symbol)
-                info = ticker.info
+                info = infos.get(stock.symbol, {})
+                hist = frames.get(stock.symbol)
                 
                 # 更新股票信息
                 stock.name = info.get('shortName', stock.name)
                 stock.exchange = info.get('exchange', stock.exchange)
                 stock.industry = info.get('industry', stock.industry)
                 stock.sector = info.get('sector', stock.sector)
-                stock.last_price = info.get('regularMarketPrice', stock.last_price)
+                if hist is not None and not hist.empty:
+                    stock.last_price = float(hist['Close'].iloc[-1])
+                else:
+                    stock.last_price = info.get('regularMarketPrice', stock.last_price)
                 stock.last_update = datetime.now(pytz.utc)
                 
                 db.session.add(stock)
@@ -84,6 +123,40 @@ def update_stock_data():
         db.session.rollback()
         logger.error(f"更新股票数据时发生错误: {str(e)}")
 
+def warm_ring_buffers():
+    """从存储预热活跃交易任务的 (symbol, interval) 环形缓冲区
+
+    只是提前加载，没有预热的缓冲区在首次读取时加载。
+    """
+    try:
+        pairs = set()
+        for task in TradingTask.query.filter_by(status='active').all():
+            parameters = json.loads(task.parameters) if isinstance(task.parameters, str) else task.parameters
+            symbols = json.loads(task.symbols) if isinstance(task.symbols, str) else task.symbols
+            interval = (parameters or {}).get('interval', '1h')
+            pairs.update((symbol, interval) for symbol in symbols or [])
+        get_ring_buffers().warm(pairs)
+        logger.info(f"已预热 {len(pairs)} 个K线环形缓冲区")
+    except Exception as e:
+        logger.error(f"预热K线环形缓冲区时发生错误: {str(e)}")
+
+def maintain_price_data_partitions():
+    """创建price_data未来几个月的分区"""
+    try:
+        created = ensure_price_data_partitions()
+        if created:
+            logger.info(f"已创建price_data分区: {', '.join(created)}")
+    except Exception as e:
+        logger.error(f"维护price_data分区时发生错误: {str(e)}")
+
+def refresh_universe_snapshot():
+    """比较全部股票的日线存储版本号，更新全市场快照"""
+    try:
+        updated = get_universe().refresh(full=True)
+        logger.info(f"全市场快照已更新: {updated} 只股票")
+    except Exception as e:
+        logger.error(f"更新全市场快照时发生错误: {str(e)}")
+
 def update_active_stocks_price():
     """更新活跃股票的价格数据"""
     logger.info("开始更新活跃股票价格数据")
@@ -102,46 +175,28 @@ def update_active_stocks_price():
             logger.info("没有活跃股票需要更新")
             return
         
-        # 获取这些股票的最新价格
-        for symbol in symbols:
-            try:
-                stock = StockData.query.filter_by(symbol=symbol).first()
-                if not stock:
-                    logger.warning(f"股票 {symbol} 不存在于数据库中")
-                    continue
-                
-                # 使用yfinance获取最新数据
-                ticker = yf.Ticker(symbol)
-                hist = ticker.history(period="1d")
-                
-                if hist.empty:
-                    logger.warning(f"无法获取股票 {symbol} 的价格数据")
-                    continue
-                
-                # 获取最新价格
-                latest = hist.iloc[-1]
-                
-                # 更新股票最新价格
-                stock.last_price = latest['Close']
-                stock.last_update = datetime.now(pytz.utc)
-                
-                # 添加到价格历史数据
-                price_data = PriceData(
-                    stock_id=stock.id,
-                    timestamp=datetime.now(pytz.utc),
-                    open_price=latest['Open'],
-                    high_price=latest['High'],
-                    low_price=latest['Low'],
-                    close_price=latest['Close'],
-                    volume=latest['Volume'],
-                    interval='1h'
-                )
-                
-                db.session.add(stock)
-                db.session.add(price_data)
-                logger.info(f"更新股票价格: {symbol}, 价格: {latest['Close']}")
-            except Exception as e:
-                logger.error(f"更新股票 {symbol} 价格时出错: {str(e)}")
+        stocks = StockData.query.filter(StockData.symbol.in_(list(symbols))).all()
+        for symbol in symbols - {stock.symbol for stock in stocks}:
+            logger.warning(f"股票 {symbol} 不存在于数据库中")
+        
+        # 只回补最近一周缺失的K线（小时K线由基础周期聚合，实际回补基础周期），当天未收盘的时段每次都会重新请求
+        gaps = plan_backfill([stock.symbol for stock in stocks], '1h', start=datetime.utcnow() - timedelta(days=7))
+        results = run_backfill(gaps)
+        for symbol, result in results.items():
+            for error in result['errors']:
+                logger.error(f"更新股票 {symbol} 价格时出错: {error}")
+            if result['rows']:
+                logger.info(f"更新股票价格: {symbol}, 写入 {result['rows']} 根K线")
+        
+        # 用最新的K线更新股票最新价格
+        for stock in stocks:
+            latest = load_bars(stock.symbol, '1h', limit=1)
+            if latest.empty:
+                logger.warning(f"无法获取股票 {stock.symbol} 的价格数据")
+                continue
+            stock.last_price = float(latest['Close'].iloc[-1])
+            stock.last_update = datetime.now(pytz.utc)
+            db.session.add(stock)
         
         db.session.commit()
         logger.info("活跃股票价格数据更新完成")
@@ -195,10 +250,12 @@ def execute_strategy(task, strategy, account):
         # 解析策略参数
         parameters = json.loads(task.parameters) if isinstance(task.parameters, str) else task.parameters
         symbols = json.loads(task.symbols) if isinstance(task.symbols, str) else task.symbols
+        interval = (parameters or {}).get('interval', '1h')
         
         # 动态导入并执行策略代码
         strategy_code = compile(strategy.code, f"strategy_{strategy.id}", 'exec')
-        strategy_namespace = {}
+        # 策略代码可以直接使用 indicators 模块计算指标，与行情接口和回测保持一致
+        strategy_namespace = {'indicators': indicators}
         exec(strategy_code, strategy_namespace)
         
         # 检查策略是否定义了generate_signals函数
@@ -208,33 +265,18 @@ def execute_strategy(task, strategy, account):
         
         # 为每个股票获取数据并生成信号
         for symbol in symbols:
-            # 获取股票数据
-            stock = StockData.query.filter_by(symbol=symbol).first()
-            if not stock:
-                logger.warning(f"股票 {symbol} 不存在于数据库中")
-                continue
-            
-            # 获取历史价格数据
-            price_history = PriceData.query.filter_by(
-                stock_id=stock.id
-            ).order_by(PriceData.timestamp.desc()).limit(100).all()
+            # 从环形缓冲区读取最近的K线，直接把只读视图交给策略，不复制数据；
+            # 新增列、替换整列和修改索引不影响缓冲区，原地修改价格列会抛出异常
+            df = recent_bars(symbol, interval, limit=100, columns=STRATEGY_COLUMNS)
             
-            if not price_history:
+            if df.empty:
                 logger.warning(f"股票 {symbol} 没有足够的历史数据")
                 continue
             
-            # 转换为DataFrame
-            df = pd.DataFrame([
-                {
-                    'timestamp': p.timestamp,
-                    'open': p.open_price,
-                    'high': p.high_price,
-                    'low': p.low_price,
-                    'close': p.close_price,
-                    'volume': p.volume
-                } for p in price_history
-            ])
-            df = df.sort_values('timestamp')
+            df.insert(0, 'timestamp', df.index)
+            df.index = pd.RangeIndex(len(df))
+            # 策略通过 indicators.incremental 计算指标时按股票和周期复用增量状态
+            df.attrs.update(symbol=symbol, interval=interval)
             
             # 调用策略生成信号
             signals = strategy_namespace['generate_signals'](df, parameters)
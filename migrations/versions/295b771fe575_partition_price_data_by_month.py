@@ -0,0 +1,117 @@
+"""partition price_data by month
+
+PostgreSQL 上把 price_data 改为按 timestamp 的月度范围分区表：
+- 覆盖已有数据到未来 PARTITION_MONTHS_AHEAD 个月的月分区，以及兜底的默认分区
+- 主键改为 (id, timestamp)，分区表的主键和唯一约束必须包含分区键
+- 新增 (stock_id, interval, timestamp DESC) 复合索引和 timestamp 的BRIN索引
+
+其他数据库只创建复合索引。之后的月分区在写入K线时按需创建，
+见 app/market_data/partitions.py。
+
+Revision ID: 295b771fe575
+Revises: a288bb53c58b
+Create Date: 2026-10-18 06:09:23.398441
+
+"""
+from datetime import datetime
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '295b771fe575'
+down_revision = 'a288bb53c58b'
+branch_labels = None
+depends_on = None
+
+PARTITION_MONTHS_AHEAD = 3
+
+COLUMNS = 'id, stock_id, "timestamp", open_price, high_price, low_price, close_price, volume, "interval", created_at'
+
+COLUMN_DEFINITIONS = """
+    id integer NOT NULL DEFAULT nextval('price_data_id_seq'),
+    stock_id integer NOT NULL REFERENCES stock_data (id),
+    "timestamp" timestamp without time zone NOT NULL,
+    open_price double precision,
+    high_price double precision,
+    low_price double precision,
+    close_price double precision,
+    volume bigint,
+    "interval" varchar(8),
+    created_at timestamp without time zone,
+"""
+
+
+def _month_starts(first, last):
+    """返回从first所在月到last所在月的每月第一天"""
+    month = datetime(first.year, first.month, 1)
+    while month <= last:
+        yield month
+        month = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        op.create_index('ix_price_data_stock_interval_ts', 'price_data',
+                        ['stock_id', 'interval', sa.text('timestamp DESC')])
+        return
+
+    # 原表改名保留，约束名随之改掉，新表沿用原来的约束名和序列
+    op.execute('ALTER TABLE price_data RENAME TO price_data_heap')
+    op.execute('ALTER TABLE price_data_heap RENAME CONSTRAINT price_data_pkey TO price_data_heap_pkey')
+    op.execute('ALTER TABLE price_data_heap RENAME CONSTRAINT uix_price_data TO uix_price_data_heap')
+    op.execute(f"""
+        CREATE TABLE price_data ({COLUMN_DEFINITIONS}
+            CONSTRAINT price_data_pkey PRIMARY KEY (id, "timestamp"),
+            CONSTRAINT uix_price_data UNIQUE (stock_id, "timestamp", "interval")
+        ) PARTITION BY RANGE ("timestamp")
+    """)
+    op.execute('ALTER SEQUENCE price_data_id_seq OWNED BY price_data.id')
+
+    now = datetime.utcnow()
+    first = last = None
+    if not context.is_offline_mode():
+        first, last = bind.execute(sa.text('SELECT min("timestamp"), max("timestamp") FROM price_data_heap')).one()
+    ahead = datetime(now.year + (now.month + PARTITION_MONTHS_AHEAD - 1) // 12,
+                     (now.month + PARTITION_MONTHS_AHEAD - 1) % 12 + 1, 1)
+    for month in _month_starts(min(first or now, now), max(last or now, ahead)):
+        following = datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+        op.execute(
+            f"CREATE TABLE price_data_y{month:%Y}m{month:%m} PARTITION OF price_data "
+            f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{following:%Y-%m-%d}')"
+        )
+    op.execute('CREATE TABLE price_data_default PARTITION OF price_data DEFAULT')
+
+    # 先导入数据再建索引，比逐行维护索引快
+    op.execute(f'INSERT INTO price_data ({COLUMNS}) SELECT {COLUMNS} FROM price_data_heap')
+    op.execute('DROP TABLE price_data_heap')
+    op.create_index('ix_price_data_stock_interval_ts', 'price_data',
+                    ['stock_id', 'interval', sa.text('"timestamp" DESC')])
+    op.execute('CREATE INDEX ix_price_data_timestamp_brin ON price_data USING brin ("timestamp")')
+    op.execute('ANALYZE price_data')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        op.drop_index('ix_price_data_stock_interval_ts', table_name='price_data')
+        return
+
+    op.execute('ALTER TABLE price_data RENAME TO price_data_partitioned')
+    op.execute('ALTER TABLE price_data_partitioned RENAME CONSTRAINT price_data_pkey TO price_data_partitioned_pkey')
+    op.execute('ALTER TABLE price_data_partitioned RENAME CONSTRAINT uix_price_data TO uix_price_data_partitioned')
+    op.execute('ALTER INDEX ix_price_data_stock_interval_ts RENAME TO ix_price_data_partitioned_stock_interval_ts')
+    op.execute('ALTER INDEX ix_price_data_timestamp_brin RENAME TO ix_price_data_partitioned_timestamp_brin')
+    op.execute(f"""
+        CREATE TABLE price_data ({COLUMN_DEFINITIONS}
+            CONSTRAINT price_data_pkey PRIMARY KEY (id),
+            CONSTRAINT uix_price_data UNIQUE (stock_id, "timestamp", "interval")
+        )
+    """)
+    op.execute('ALTER SEQUENCE price_data_id_seq OWNED BY price_data.id')
+    op.execute(f'INSERT INTO price_data ({COLUMNS}) SELECT {COLUMNS} FROM price_data_partitioned')
+    op.execute('DROP TABLE price_data_partitioned CASCADE')
+    op.create_index('ix_price_data_stock_interval_ts', 'price_data',
+                    ['stock_id', 'interval', sa.text('"timestamp" DESC')])
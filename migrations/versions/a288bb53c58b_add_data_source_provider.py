@@ -0,0 +1,30 @@
+"""add data source provider
+
+data_sources 增加 provider 和 parameters 列，用于选择行情数据源的实现，见 app/market_data/providers.py。
+
+Revision ID: a288bb53c58b
+Revises: 9c26e0ca43d6
+Create Date: 2026-10-18 07:17:48.464926
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a288bb53c58b'
+down_revision = '9c26e0ca43d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('data_sources', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('provider', sa.String(length=32), nullable=True))
+        batch_op.add_column(sa.Column('parameters', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('data_sources', schema=None) as batch_op:
+        batch_op.drop_column('parameters')
+        batch_op.drop_column('provider')
@@ -0,0 +1,151 @@
+"""向量化回测引擎与 backtrader 的一致性和速度对比
+
+用随机游走生成的K线对几个 generate_signals 策略分别运行两种引擎，比较最终资金、
+权益曲线、交易统计和成交，并输出耗时和加速比：
+
+    python -m scripts.backtest_parity
+    python -m scripts.backtest_parity --symbols 5 --bars 50000 --freq min
+
+ema_incremental 通过 indicators.incremental 计算指标，脚本不创建应用，覆盖回测中
+不使用指标状态缓存的路径。有不一致时以非零状态退出。
+"""
+import argparse
+import math
+import sys
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from app.backtest.engine import compile_strategy, run_strategy
+
+# 策略名称 -> (策略代码, 参数)
+STRATEGIES = {
+    'sma_cross': ('''
+def generate_signals(data, parameters):
+    short_ma = data['close'].rolling(parameters['short_window']).mean()
+    long_ma = data['close'].rolling(parameters['long_window']).mean()
+    data['signal'] = (short_ma > long_ma).astype(int)
+    return data
+''', {'short_window': 10, 'long_window': 30}),
+    'rsi_reversion': ('''
+def generate_signals(data, parameters):
+    rsi = indicators.rsi(data, period=parameters['period'])
+    data['action'] = None
+    data.loc[rsi < parameters['lower'], 'action'] = 'buy'
+    data.loc[rsi > parameters['upper'], 'action'] = 'sell'
+    return data
+''', {'period': 14, 'lower': 30, 'upper': 70}),
+    'ema_incremental': ('''
+def generate_signals(data, parameters):
+    fast = indicators.incremental('ema', data, period=parameters['fast'])['value']
+    slow = indicators.incremental('ema', data, period=parameters['slow'])['value']
+    rsi = indicators.incremental('rsi', data, period=14)['value']
+    data['signal'] = ((fast > slow) & (rsi < 80)).astype(int)
+    return data
+''', {'fast': 12, 'slow': 26}),
+    'buy_and_hold': ('''
+def generate_signals(data, parameters):
+    data['signal'] = 1
+    return data
+''', {'position_size': 0.5}),
+}
+
+RELATIVE_TOLERANCE = 1e-9
+
+
+def random_bars(symbols, bars, freq, seed):
+    """生成随机游走的K线，不同股票的K线时间相同"""
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2015-01-01', periods=bars, freq=freq)
+    frames = {}
+    for i in range(symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, bars)))
+        open_ = np.concatenate([[100.0], close[:-1]]) * np.exp(rng.normal(0, 0.002, bars))
+        high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, bars))
+        low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, bars))
+        volume = rng.integers(1e5, 1e6, bars).astype('float64')
+        frames[f'S{i}'] = pd.DataFrame({'Open': open_, 'High': high, 'Low': low, 'Close': close, 'Volume': volume},
+                                       index=index.rename('timestamp'))
+    return frames
+
+
+def close_enough(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return math.isclose(a, b, rel_tol=RELATIVE_TOLERANCE, abs_tol=1e-9)
+
+
+def compare(name, frames, code, params, capital, start, end):
+    """运行两种引擎并返回 (不一致的项目列表, backtrader耗时, 向量化耗时)"""
+    strategy_class = compile_strategy(code)
+
+    began = time.perf_counter()
+    expected, expected_fills = run_strategy(frames, strategy_class, dict(params, engine='backtrader'), capital, start, end)
+    backtrader_time = time.perf_counter() - began
+
+    began = time.perf_counter()
+    actual, actual_fills = run_strategy(frames, strategy_class, dict(params, engine='vectorized'), capital, start, end)
+    vectorized_time = time.perf_counter() - began
+
+    problems = []
+    for metric in ('final_value', 'return', 'sharpe_ratio', 'max_drawdown', 'total_trades', 'won_trades', 'lost_trades'):
+        if not close_enough(expected[metric], actual[metric]):
+            problems.append(f'{metric}: backtrader={expected[metric]} vectorized={actual[metric]}')
+
+    curve = np.array([point['value'] for point in expected['equity_curve']])
+    other = np.array([point['value'] for point in actual['equity_curve']])
+    if len(curve) != len(other):
+        problems.append(f'权益曲线长度: backtrader={len(curve)} vectorized={len(other)}')
+    elif len(curve) and not np.allclose(curve, other, rtol=RELATIVE_TOLERANCE):
+        problems.append(f'权益曲线最大相对误差: {np.max(np.abs(curve / other - 1)):.3g}')
+
+    if len(expected_fills) != len(actual_fills):
+        problems.append(f'成交笔数: backtrader={len(expected_fills)} vectorized={len(actual_fills)}')
+    else:
+        key = lambda fill: (fill['timestamp'], fill['symbol'])
+        for a, b in zip(sorted(expected_fills, key=key), sorted(actual_fills, key=key)):
+            if a['timestamp'] != b['timestamp'] or a['side'] != b['side'] or not close_enough(a['quantity'], b['quantity']) \
+                    or not close_enough(a['price'], b['price']):
+                problems.append(f'成交不一致: {a} != {b}')
+                break
+
+    print(f'{name:<15} 最终资金 {actual["final_value"]:>14.2f}  交易 {actual["total_trades"]:>5}  '
+          f'backtrader {backtrader_time:8.3f}s  向量化 {vectorized_time:8.4f}s  '
+          f'加速 {backtrader_time / vectorized_time:7.1f}x  {"一致" if not problems else "不一致"}')
+    for problem in problems:
+        print(f'    {problem}')
+    return problems, backtrader_time, vectorized_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比向量化回测引擎与 backtrader 的结果和速度')
+    parser.add_argument('--symbols', type=int, default=3, help='股票数量')
+    parser.add_argument('--bars', type=int, default=2500, help='每只股票的K线数量')
+    parser.add_argument('--freq', default='B', help='K线频率，如 B（交易日）、min（分钟）')
+    parser.add_argument('--capital', type=float, default=100000, help='初始资金')
+    parser.add_argument('--seed', type=int, default=0, help='随机数种子')
+    args = parser.parse_args()
+
+    warnings.filterwarnings('ignore')
+    frames = random_bars(args.symbols, args.bars, args.freq, args.seed)
+    index = next(iter(frames.values())).index
+    # 从第二十根K线开始回测，前面的K线只用于计算信号
+    start, end = index[20].to_pydatetime(), index[-1].to_pydatetime()
+
+    failed = False
+    totals = [0.0, 0.0]
+    for name, (code, params) in STRATEGIES.items():
+        problems, backtrader_time, vectorized_time = compare(
+            name, frames, code, dict(params, symbols=list(frames)), args.capital, start, end)
+        failed |= bool(problems)
+        totals[0] += backtrader_time
+        totals[1] += vectorized_time
+
+    print(f'合计 backtrader {totals[0]:.3f}s  向量化 {totals[1]:.4f}s  加速 {totals[0] / totals[1]:.1f}x')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+"""price_data 查询基准测试
+
+对几类典型查询输出执行计划和延迟分位数，用于比较分区和索引迁移前后的效果：
+
+    python -m scripts.benchmark_price_data --save before.json
+    flask db upgrade
+    python -m scripts.benchmark_price_data --compare before.json
+
+支持 PostgreSQL（EXPLAIN (ANALYZE, BUFFERS)）和 SQLite（EXPLAIN QUERY PLAN）。
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+# 先加载环境变量
+load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.models.market_data import StockData
+
+# 查询名称 -> (说明, SQL)
+QUERIES = {
+    'latest_bars': (
+        '单只股票最近100根K线（实盘策略）',
+        'SELECT "timestamp", open_price, high_price, low_price, close_price, volume FROM price_data '
+        'WHERE stock_id = :stock_id AND "interval" = :interval ORDER BY "timestamp" DESC LIMIT 100'
+    ),
+    'range_scan': (
+        '单只股票一年的K线（回测）',
+        'SELECT "timestamp", open_price, high_price, low_price, close_price, volume FROM price_data '
+        'WHERE stock_id = :stock_id AND "interval" = :interval AND "timestamp" >= :start AND "timestamp" < :end '
+        'ORDER BY "timestamp"'
+    ),
+    'cross_section': (
+        '全部股票最近一周的收盘价（横截面）',
+        'SELECT stock_id, "timestamp", close_price FROM price_data '
+        'WHERE "interval" = :interval AND "timestamp" >= :week_start'
+    ),
+    'month_count': (
+        '某个月的K线数量（分区裁剪）',
+        'SELECT count(*) FROM price_data WHERE "timestamp" >= :month_start AND "timestamp" < :month_end'
+    ),
+}
+
+
+def explain(query, params):
+    """返回查询的执行计划文本"""
+    dialect = db.engine.dialect.name
+    if dialect == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS)'
+    else:
+        prefix = 'EXPLAIN QUERY PLAN'
+    rows = db.session.execute(text(f'{prefix} {query}'), params).all()
+    return '\n'.join(' '.join(str(value) for value in row) for row in rows)
+
+
+def measure(query, params, runs):
+    """执行runs次查询，返回延迟（毫秒）的统计值"""
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        db.session.execute(text(query), params).all()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1 if len(latencies) > 1 else 0], 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+    }
+
+
+def query_params(symbol, interval):
+    """以该股票的最后一根K线为基准确定查询参数"""
+    stock = StockData.query.filter_by(symbol=symbol).first()
+    if not stock:
+        raise SystemExit(f'股票 {symbol} 不存在')
+    last = db.session.execute(text(
+        'SELECT max("timestamp") FROM price_data WHERE stock_id = :stock_id AND "interval" = :interval'
+    ), {'stock_id': stock.id, 'interval': interval}).scalar()
+    if last is None:
+        raise SystemExit(f'股票 {symbol} 没有 {interval} 周期的K线')
+    if isinstance(last, str):
+        # SQLite 返回字符串
+        last = datetime.fromisoformat(last)
+    month_start = last.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return {
+        'stock_id': stock.id,
+        'interval': interval,
+        'start': last.replace(year=last.year - 1),
+        'end': last,
+        'week_start': last - timedelta(days=7),
+        'month_start': month_start,
+        'month_end': month_start.replace(year=month_start.year + month_start.month // 12,
+                                         month=month_start.month % 12 + 1),
+    }
+
+
+def run(symbol, interval, runs):
+    params = query_params(symbol, interval)
+    results = {
+        'dialect': db.engine.dialect.name,
+        'symbol': symbol,
+        'interval': interval,
+        'runs': runs,
+        'queries': {}
+    }
+    for name, (description, query) in QUERIES.items():
+        # 先执行一次预热缓存
+        db.session.execute(text(query), params).all()
+        results['queries'][name] = {
+            'description': description,
+            'plan': explain(query, params),
+            **measure(query, params, runs)
+        }
+    return results
+
+
+def print_results(results, baseline=None):
+    for name, result in results['queries'].items():
+        print(f"== {name}: {result['description']}")
+        print(result['plan'])
+        line = f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, mean {result['mean_ms']} ms"
+        before = (baseline or {}).get('queries', {}).get(name)
+        if before:
+            speedup = before['p50_ms'] / result['p50_ms'] if result['p50_ms'] else float('inf')
+            line += f"（迁移前 p50 {before['p50_ms']} ms, p95 {before['p95_ms']} ms，p50 加速比 {speedup:.2f}x）"
+        print(line)
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='price_data 查询基准测试')
+    parser.add_argument('--symbol', default='AAPL', help='用于单只股票查询的股票代码')
+    parser.add_argument('--interval', default='1d', help='K线周期')
+    parser.add_argument('--runs', type=int, default=50, help='每个查询的执行次数')
+    parser.add_argument('--save', help='把结果保存为JSON文件')
+    parser.add_argument('--compare', help='与之前保存的JSON结果比较')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name not in ('postgresql', 'sqlite'):
+            raise SystemExit('只支持 PostgreSQL 和 SQLite')
+        results = run(args.symbol.upper(), args.interval, args.runs)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f'结果已保存到 {args.save}')
+
+
+if __name__ == '__main__':
+    main()